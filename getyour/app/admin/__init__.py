@@ -17,14 +17,18 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import json
+import datetime
 import logging
 import pendulum
 
 from django.http.response import HttpResponse
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 from django.core.files.storage import default_storage
-from django.shortcuts import render, reverse
+from django.shortcuts import get_object_or_404, render, reverse
+from django.urls import path
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.http import HttpRequest, HttpResponseRedirect
 from django.utils.html import format_html
 from django.utils.translation import ngettext
@@ -44,6 +48,7 @@ from app.models import (
     Address,
     AddressRD,
     Household,
+    HouseholdHist,
     HouseholdMembers,
     EligibilityProgram,
     EligibilityProgramRD,
@@ -51,6 +56,7 @@ from app.models import (
     IQProgramRD,
     Admin as AppAdmin,
     Feedback,
+    NotificationOutbox,
 )
 from app.backend import (
     get_eligible_iq_programs,
@@ -59,8 +65,16 @@ from app.backend import (
     finalize_application,
     remove_ineligible_programs,
     address_check,
+    queue_bulk_notifications,
+)
+from app.constants import application_pages, reminder_sms_body
+from app.previews import get_previews
+from app.history import (
+    update_with_history,
+    get_history_page,
+    get_state_as_of,
+    reconstructable_models,
 )
-from app.constants import application_pages
 from app.admin.filters import (
     GMAListFilter,
     CityCoveredListFilter,
@@ -118,44 +132,60 @@ def create_modeladmin(
     return modeladmin
 
 
-def document_path_parsed(obj):
+def blob_link(blob_name, text, previews):
     """
-    Parse each document_path into a link that can be used to view the
-    files.
+    Return a link that opens ``text`` in a popup window, showing the preview
+    of the document (if ``previews`` has one), followed by a link to the
+    original.
 
-    This function spoofs the URLs that ``django-storages`` creates
-    automatically; this could be eliminated (except for the headers) if the
-    data model was updated to save one file per record.
-    
     """
-    # Parse the stringified list of document_path values. Dynamically
-    # converting to a list would be dangerous, so this is processed manually.
-    if obj.document_path.name != '':
-        blob_list = obj.document_path.name.replace(
-            "[", ''
-        ).replace(
-            "]", ''
-        ).replace(
-            "'", ''
-        ).split(
-            ', '
-        )
-        url_list = []
-        for idx, itm in enumerate(blob_list):
-            url_list.append(
-                """<a href="{trg}" onclick="javascript:window.open(this.href, 'newwindow', 'width=600, height=600'); return false;">View Document {nm} of {tot}</a>""".format(
-                    trg=reverse(
-                        'app:admin_view_blob',
-                        kwargs={'blob_name': itm},
-                    ),
-                    nm=idx+1,
-                    tot=len(blob_list),
-                )
+
+    link_template = """<a href="{trg}" onclick="javascript:window.open(this.href, 'newwindow', 'width=600, height=600'); return false;">{txt}</a>"""
+    link = link_template.format(
+        trg=reverse(
+            'app:admin_view_blob',
+            kwargs={'blob_name': previews.get(blob_name, blob_name)},
+        ),
+        txt=text,
+    )
+    if blob_name in previews:
+        link += " ({})".format(
+            link_template.format(
+                trg=reverse(
+                    'app:admin_view_blob',
+                    kwargs={'blob_name': blob_name},
+                ),
+                txt='original',
             )
-    else:
-        url_list = ['No document available']
+        )
 
-    return format_html('<br />'.join(url_list))
+    return link
+
+
+def document_links(obj):
+    """
+    Return a link to view each document of the EligibilityProgram ``obj``
+    (prefetch 'documents' when showing many programs).
+
+    """
+    documents = obj.documents.all()
+    if not documents:
+        return 'No document available'
+
+    # Show the downscaled previews by default. Documents deleted by the
+    # retention purge are only noted
+    previews = get_previews([
+        x.blob_name for x in documents if x.purged_at is None
+    ])
+    return format_html('<br />'.join(
+        blob_link(
+            itm.blob_name,
+            f"View Document {idx+1} of {len(documents)}",
+            previews,
+        ) if itm.purged_at is None else
+        f"Document {idx+1} of {len(documents)} purged on {itm.purged_at:%Y-%m-%d}"
+        for idx, itm in enumerate(documents)
+    ))
 
 
 def get_admin_url(obj, urltype='change'):
@@ -333,6 +363,11 @@ class HouseholdMembersInline(admin.TabularInline):
     def household_info_parsed(self, obj):
         person_list = []
         if obj.household_info is not None:
+            # Show the downscaled previews of the IDs by default
+            previews = get_previews([
+                itm['identification_path'] for itm in obj.household_info['persons_in_household']
+                if itm.get('identification_path') is not None
+            ])
             for itm in obj.household_info['persons_in_household']:
                 # Add information, then path to identification file and a blank line
                 person_list.append(f"{itm['name']} (DOB: {itm['birthdate']})")
@@ -340,11 +375,14 @@ class HouseholdMembersInline(admin.TabularInline):
                 # Parse each document_path into a link that can be used to view the
                 # file
                 if 'identification_path' in itm and itm['identification_path'] is not None:
-                    document_link = """<a href="{trg}" onclick="javascript:window.open(this.href, 'newwindow', 'width=600, height=600'); return false;">View Identification</a>""".format(
-                        trg=reverse(
-                            'app:admin_view_blob',
-                            kwargs={'blob_name': itm['identification_path']},
-                        ),
+                    document_link = blob_link(
+                        itm['identification_path'],
+                        'View Identification',
+                        previews,
+                    )
+                elif itm.get('identification_purged_at') is not None:
+                    document_link = "Identification purged on {}".format(
+                        itm['identification_purged_at'][:10]
                     )
                 else:
                     document_link = "No identification available"
@@ -375,10 +413,18 @@ class HouseholdMembersInline(admin.TabularInline):
 
 class EligibilityProgramInline(admin.TabularInline):
     def get_queryset(self, request):
-        """ Override ordering to use program friendly name instead. """
+        """
+        Override ordering to use program friendly name instead, and fetch the
+        programs' documents in one query.
+
+        """
         qs = super().get_queryset(request)
         qs = qs.filter(
             program__is_active=True,
+        ).select_related(
+            'program'
+        ).prefetch_related(
+            'documents'
         ).order_by(
             'program__friendly_name'
         )
@@ -420,7 +466,7 @@ class EligibilityProgramInline(admin.TabularInline):
     @admin.display(description='document')
     def display_document_link(self, obj):
         """ Display a link to each document. """
-        return document_path_parsed(obj)
+        return document_links(obj)
 
     # Show zero extra (unfilled) options
     extra = 0
@@ -529,7 +575,16 @@ class UserAdmin(admin.ModelAdmin):
         AccountDisabledListFilter,
     )
     date_hierarchy = 'last_completed_at'
-    actions = ('export_users', 'mark_awaiting_response', 'mark_verified')
+    actions = (
+        'export_users',
+        'mark_awaiting_response',
+        'mark_verified',
+        'send_sms_reminder',
+    )
+
+    # Fields that aren't shown in the change history (like Django's own
+    # UserAdmin, the password hash is never shown)
+    history_hidden_fields = ('password', )
 
     user_fields = [
         'full_name',
@@ -793,15 +848,14 @@ class UserAdmin(admin.ModelAdmin):
         # check_queryset is a potentially-further-filtered queryset. If their
         # lengths are the same, mark 'income verified'; else return an error msg
         if len(queryset) == len(check_queryset):
-            # Note that queryset.update() cannot be used here, since the update
-            # is on a related model; instead, loop through queryset and update
-            # each related model (in order to avoid .save() calls)
-            for usr in queryset:
-                Household.objects.filter(
-                    user=usr
-                ).update(
-                    is_income_verified=True
-                )
+            # Update the related Household records all at once (in order to
+            # avoid .save() calls), recording their previous values in
+            # HouseholdHist
+            update_with_history(
+                Household.objects.filter(user__in=queryset),
+                HouseholdHist,
+                is_income_verified=True,
+            )
 
             log.info(
                 f"{len(queryset)} users marked as verified.",
@@ -832,6 +886,50 @@ class UserAdmin(admin.ModelAdmin):
                 error_count,
             ), messages.ERROR)
 
+    @admin.action(
+        description="Send an SMS reminder to selected users",
+    )
+    def send_sms_reminder(self, request, queryset):
+        # Queue the reminder for every selected user in bulk, so that it's
+        # delivered by the Django-Q workers at the Twilio send rate rather than
+        # holding up this request
+
+        log.info(
+            "Entering admin action",
+            function='send_sms_reminder',
+            user_id=request.user.id,
+        )
+
+        # Disabled accounts don't receive reminders
+        recipients = [
+            (usr, str(usr.phone_number)) for usr in queryset.filter(
+                is_archived=False,
+            ).exclude(phone_number='')
+        ]
+
+        # Tie the idempotency key to the date, so that repeating this action for
+        # the same users on the same day doesn't send the reminder again
+        queued_count = queue_bulk_notifications(
+            'bulk_sms',
+            recipients,
+            payload={'body': reminder_sms_body},
+            idempotency_prefix=f"bulk_sms:reminder:{pendulum.today().to_date_string()}",
+        )
+
+        self.message_user(request, ngettext(
+            'An SMS reminder was queued for %d user.',
+            'An SMS reminder was queued for %d users.',
+            queued_count,
+        ) % queued_count, messages.SUCCESS)
+
+        skipped_count = len(queryset) - queued_count
+        if skipped_count > 0:
+            self.message_user(request, ngettext(
+                '%d user was skipped (disabled, no phone number, or already reminded today).',
+                '%d users were skipped (disabled, no phone number, or already reminded today).',
+                skipped_count,
+            ) % skipped_count, messages.WARNING)
+
     @admin.action(
         description="Export selected users",
     )
@@ -959,7 +1057,17 @@ class UserAdmin(admin.ModelAdmin):
         # "if 'url' in request.POST:" section of response_change()
 
         obj = User.objects.get(pk=object_id)
-        extra_context['custom_buttons'] = []
+        extra_context['custom_buttons'] = [
+            {
+                'title': 'View Change History',
+                'link': reverse(
+                    'admin:app_user_changes',
+                    args=(obj.id,),
+                    current_app=self.admin_site.name,
+                ),
+                'target': 'new',
+            },
+        ]
         # Only superusers and admins have access to custom buttons
         # IQ Programs can be added at any time after the user has completed the
         # application
@@ -1084,6 +1192,96 @@ class UserAdmin(admin.ModelAdmin):
             extra_context=extra_context,
         )
     
+    def get_urls(self):
+        return [
+            path(
+                '<path:object_id>/changes/',
+                self.admin_site.admin_view(self.changes_view),
+                name='app_user_changes',
+            ),
+        ] + super().get_urls()
+
+    def changes_view(self, request, object_id):
+        """
+        Show the user's history (from every history model), newest first, a
+        page at a time. With 'as_of', also show the user's records as they were
+        at that time.
+
+        """
+
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        user = get_object_or_404(User, pk=object_id)
+
+        # The cursor is the (created, label, id) of the previous page's last row
+        cursor = None
+        if request.GET.get('after'):
+            try:
+                created, label, row_id = request.GET['after'].split('|')
+                cursor = (datetime.datetime.fromisoformat(created), label, int(row_id))
+            except ValueError:
+                cursor = None
+        rows, next_cursor = get_history_page(user.id, cursor=cursor)
+
+        next_url = None
+        if next_cursor is not None:
+            query = request.GET.copy()
+            query['after'] = '|'.join([
+                next_cursor[0].isoformat(),
+                next_cursor[1],
+                str(next_cursor[2]),
+            ])
+            next_url = f"?{query.urlencode()}"
+
+        # Reconstruct each record as of the requested time (in the local time
+        # zone, from a datetime-local input)
+        as_of = parse_datetime(request.GET.get('as_of', '') or '')
+        states = []
+        if as_of is not None:
+            if timezone.is_naive(as_of):
+                as_of = timezone.make_aware(as_of)
+            for model in reconstructable_models:
+                instance = get_state_as_of(model, user.id, as_of)
+                states.append({
+                    'name': model._meta.verbose_name.title(),
+                    'fields': [] if instance is None else [
+                        (field.verbose_name, field.value_from_object(instance))
+                        for field in model._meta.fields
+                        if field.name not in self.history_hidden_fields
+                    ],
+                })
+
+        # Set the current_app for the admin base template
+        request.current_app = self.admin_site.name
+        return render(
+            request,
+            'admin/user_changes.html',
+            {
+                **self.admin_site.each_context(request),
+                'opts': self.model._meta,
+                'original': user,
+                'title': f"Change history for {user.full_name}",
+                'rows': [
+                    {
+                        **row,
+                        'historical_values': json.dumps(
+                            {
+                                key: value
+                                for key, value in (row['historical_values'] or {}).items()
+                                if key not in self.history_hidden_fields
+                            },
+                            indent=2,
+                            sort_keys=True,
+                        ),
+                    } for row in rows
+                ],
+                'next_url': next_url,
+                'as_of': request.GET.get('as_of', ''),
+                'states': states,
+            },
+        )
+
     def response_change(self, request, obj):
         if "_add_iq_program" in request.POST:
             # Handle 'Add Program': load the page to select the program name
@@ -1434,7 +1632,7 @@ class EligibilityProgramAdmin(admin.ModelAdmin):
     @admin.display(description='document')
     def display_document_link(self, obj):
         """ Display a link to each document. """
-        return document_path_parsed(obj)
+        return document_links(obj)
 
     list_per_page = 100
 
@@ -1737,6 +1935,37 @@ class FeedbackAdmin(admin.ModelAdmin):
         return False
 
 
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    search_fields = ('recipient', 'idempotency_key')
+    list_display = ('created_at', 'kind', 'recipient', 'status', 'attempts')
+    list_display_links = ('created_at', )
+    list_filter = ('status', 'kind', 'channel')
+    ordering = ('-created_at', )
+
+    # The payload is excluded since it may contain sensitive data (such as a
+    # password-reset link)
+    fields = readonly_fields = [
+        'created_at',
+        'modified_at',
+        'user',
+        'channel',
+        'kind',
+        'recipient',
+        'idempotency_key',
+        'status',
+        'attempts',
+        'next_attempt_at',
+        'last_error',
+        'sent_at',
+    ]
+
+    list_per_page = 100
+
+    def has_add_permission(self, request, obj=None):
+        # Notifications are only created by the application
+        return False
+
+
 class HouseholdMembersAdmin(admin.ModelAdmin):
     fields = [
         'user_id',
@@ -1796,7 +2025,11 @@ class HouseholdMembersAdmin(admin.ModelAdmin):
                         )
                         return self.notifyAndRedirect(request, object_id, 'A birthdate was not valid')
 
-                    # validate identification_path as existing file
+                    # validate identification_path as existing file, unless
+                    # it was removed by the retention purge
+                    if person.get('identification_path') is None and \
+                            person.get('identification_purged_at') is not None:
+                        continue
                     file = default_storage.open(person['identification_path'])
                     try:
                         blob_data = b''
@@ -1880,3 +2113,4 @@ admin.site.register(EligibilityProgramRD, EligibilityProgramRDAdmin)
 admin.site.register(IQProgramRD, IQProgramRDAdmin)
 admin.site.register(Feedback, FeedbackAdmin)
 admin.site.register(HouseholdMembers, HouseholdMembersAdmin)
+admin.site.register(NotificationOutbox, NotificationOutboxAdmin)
@@ -35,12 +35,12 @@ def needs_income_verification_filter(queryset):
         program__is_active=True,
     )
 
-    # Gather EligibilityProgram objects for each user that are 'active' and have
-    # an uploaded file 
+    # Gather EligibilityProgram objects for each user that are 'active' and
+    # don't have an uploaded file
     active_incomplete_programs = EligibilityProgram.objects.filter(
         user_id=OuterRef('id'),
         program__is_active=True,
-        document_path='',
+        documents__isnull=True,
     )
 
     queryset = queryset.filter(
@@ -111,7 +111,10 @@ class EligProgramAddForm(forms.Form):
         choices=(),
     )
 
-    document_path = forms.FileField(label='Select a file')
+    document_path = forms.FileField(
+        label='Select the file(s)',
+        widget=forms.ClearableFileInput(attrs={'multiple': True}),
+    )
 
 
 class EligibilityProgramRDForm(forms.ModelForm):
@@ -18,21 +18,43 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import logging
 import re
-import base64
+import hashlib
 import pendulum
 import json
 from pathlib import PurePosixPath
-
-from django.shortcuts import render
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import PermissionDenied
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+from django.shortcuts import render, reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.core.files import File
 from django.core.files.storage import default_storage
+from django.db import transaction
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.admin.models import LogEntry, ADDITION, CHANGE
 from django.contrib.contenttypes.models import ContentType
 from azure.core.exceptions import ResourceNotFoundError
+from storages.backends.azure_storage import AzureStorage
 
 from app.models import User, EligibilityProgram, EligibilityProgramRD, HouseholdMembers
 from app.constants import supported_content_types
 from app.backend import file_validation, finalize_application
+from app.normalization import queue_normalization
+from app.uploads import (
+    upload_files,
+    submission_file_names,
+    claim_references,
+    release_references,
+)
 from app.admin.forms import EligProgramAddForm, HouseholdMembersReplaceIDForm
 
 from logger.wrappers import LoggerWrapper
@@ -42,6 +64,171 @@ from logger.wrappers import LoggerWrapper
 log = LoggerWrapper(logging.getLogger(__name__))
 
 
+def parse_range_header(header, size):
+    """
+    Parse a single-range 'Range' header (e.g. 'bytes=0-1023' or 'bytes=-500')
+    for content of ``size`` bytes.
+
+    Returns
+    -------
+    tuple or None
+        The (first, last) byte positions (inclusive), or None if the header
+        should be ignored (it's malformed or requests multiple ranges, so the
+        whole content is sent).
+
+    Raises
+    ------
+    ValueError
+        If the range can't be satisfied.
+
+    """
+
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the final 'last' bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return (max(size - length, 0), size - 1)
+
+    first = int(first)
+    if last != '' and int(last) < first:
+        # Syntactically invalid, so ignore it
+        return None
+    if first >= size:
+        raise ValueError("Unsatisfiable range")
+    return (first, size - 1 if last == '' else min(int(last), size - 1))
+
+
+def get_signed_blob_url(blob_name, content_type):
+    """
+    Return a URL that allows only reading ``blob_name`` (as ``content_type``,
+    displayed inline), which expires after BLOB_SIGNED_URL_EXPIRY_SECOND.
+
+    On Azure, this is a SAS URL for the blob itself. For other storage backends
+    (e.g. local files in development), it's a signed URL for signed_blob().
+
+    """
+
+    if isinstance(default_storage, AzureStorage):
+        return default_storage.url(
+            blob_name,
+            expire=settings.BLOB_SIGNED_URL_EXPIRY_SECOND,
+            parameters={
+                # Override the stored headers with the checked content type
+                'content_type': content_type,
+                'content_disposition': "inline; filename*=utf-8''{}".format(
+                    quote(PurePosixPath(blob_name).name)
+                ),
+            },
+        )
+
+    return reverse(
+        'app:admin_signed_blob',
+        kwargs={'token': signing.dumps(blob_name, salt='signed_blob')},
+    )
+
+
+def get_blob_version(blob_name):
+    """
+    Return the ETag, last-modified time (as a Unix timestamp) and size of
+    ``blob_name``, without downloading it.
+
+    On Azure, these are the blob's properties. For other storage backends
+    (e.g. local files in development), the ETag is the SHA-256 of the
+    content, so the file is read.
+
+    """
+
+    if isinstance(default_storage, AzureStorage):
+        properties = default_storage.get_blob_properties(blob_name)
+        return (
+            properties.etag,
+            int(properties.last_modified.timestamp()),
+            properties.size,
+        )
+
+    file_hash = hashlib.sha256()
+    with default_storage.open(blob_name) as f:
+        for chunk in f.chunks():
+            file_hash.update(chunk)
+    return (
+        file_hash.hexdigest(),
+        int(default_storage.get_modified_time(blob_name).timestamp()),
+        default_storage.size(blob_name),
+    )
+
+
+def iter_blob(blob_name, offset=0, length=None, etag=None):
+    """
+    Return an iterator of the content of ``blob_name`` (or ``length`` bytes
+    of it, from ``offset``) in chunks.
+
+    On Azure, the download fails if the blob no longer matches ``etag`` (see
+    AzureMediaStorage.iter_blob()). Other storage backends ignore it.
+
+    """
+
+    if isinstance(default_storage, AzureStorage):
+        return default_storage.iter_blob(
+            blob_name,
+            offset=offset,
+            length=length,
+            etag=etag,
+        )
+    return _iter_file(blob_name, offset, length)
+
+
+def _iter_file(blob_name, offset, length):
+    with default_storage.open(blob_name) as f:
+        f.seek(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = f.read(
+                File.DEFAULT_CHUNK_SIZE if remaining is None
+                else min(remaining, File.DEFAULT_CHUNK_SIZE)
+            )
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def signed_blob(request, token, **kwargs):
+    """
+    Serve the blob named in ``token`` (from get_signed_blob_url()), if its
+    signature is valid and hasn't expired. This stands in for Azure SAS URLs
+    when using other storage backends.
+
+    """
+
+    try:
+        blob_name = signing.loads(
+            token,
+            salt='signed_blob',
+            max_age=settings.BLOB_SIGNED_URL_EXPIRY_SECOND,
+        )
+    except signing.BadSignature:
+        # Includes expired signatures
+        log.info(
+            "Invalid or expired signed blob URL",
+            function='signed_blob',
+        )
+        raise PermissionDenied
+
+    # The content type was checked before signing
+    return FileResponse(
+        default_storage.open(blob_name),
+        content_type=supported_content_types[PurePosixPath(blob_name).suffix[1:].lower()],
+        filename=PurePosixPath(blob_name).name,
+    )
+
+
 @staff_member_required
 def view_blob(request, blob_name, **kwargs):
     try:
@@ -51,20 +238,6 @@ def view_blob(request, blob_name, **kwargs):
             user_id=request.user.id,
         )
 
-        # Open the blob and extract the data
-        file = default_storage.open(blob_name)
-        try:
-            blob_data = b''
-            for chunk in file.chunks():
-                blob_data += chunk
-        except ResourceNotFoundError as e:
-            log.exception(
-                f"ResourceNotFoundError: {e}",
-                function='view_blob',
-                user_id=request.user.id,
-            )
-            raise ResourceNotFoundError(message=e)
-        
         # Gather the content type from the blob_name extension
         blob_name_path = PurePosixPath(blob_name)
         # Use the lowercase suffix (without the leading dot) as the key to the
@@ -128,20 +301,97 @@ def view_blob(request, blob_name, **kwargs):
                 status=405,
             )
 
-        # Display the blob to the user
+        # Send the browser straight to storage, if enabled
+        if settings.BLOB_DELIVERY_MODE == 'signed_url':
+            log.debug(
+                f"Blob '{blob_name_path}' is ok to view; redirecting to a signed URL",
+                function='view_blob',
+                user_id=request.user.id,
+            )
+            response = HttpResponseRedirect(
+                get_signed_blob_url(blob_name, content_type)
+            )
+            # Don't reuse the redirect after the URL has expired
+            response['Cache-Control'] = 'no-store'
+            return response
+
+        # Get the blob's size and version (without downloading it)
+        try:
+            etag, last_modified, size = get_blob_version(blob_name)
+        except (ResourceNotFoundError, FileNotFoundError) as e:
+            log.exception(
+                f"{type(e).__name__}: {e}",
+                function='view_blob',
+                user_id=request.user.id,
+            )
+            raise
+
+        # Answer conditional requests (e.g. reopening a cached document)
+        # without sending the content again
+        conditional_response = get_conditional_response(
+            request,
+            etag=quote_etag(etag),
+            last_modified=last_modified,
+        )
+        if conditional_response is not None:
+            conditional_response['ETag'] = quote_etag(etag)
+            conditional_response['Last-Modified'] = http_date(last_modified)
+            conditional_response['Cache-Control'] = 'private, no-cache'
+            return conditional_response
+
+        # Send only the requested range (e.g. as a PDF viewer seeks through a
+        # large document), unless If-Range shows the client's copy is stale
+        byte_range = None
+        if 'HTTP_RANGE' in request.META:
+            if_range = request.META.get('HTTP_IF_RANGE')
+            if if_range is None or if_range in (
+                    quote_etag(etag),
+                    http_date(last_modified),
+            ):
+                try:
+                    byte_range = parse_range_header(request.META['HTTP_RANGE'], size)
+                except ValueError:
+                    response = HttpResponse(status=416)
+                    response['Content-Range'] = f"bytes */{size}"
+                    return response
+
+        # Display the blob to the user, streaming it from storage
         log.debug(
             f"Blob '{blob_name_path}' is ok to view.",
             function='view_blob',
             user_id=request.user.id,
         )
-        return render(
-            request,
-            'admin/view_blob.html',
-            {
-                'blob_data': base64.b64encode(blob_data).decode('utf-8'),
-                'content_type': content_type,
-            },
+        if byte_range is None:
+            response = StreamingHttpResponse(
+                iter_blob(blob_name, etag=etag),
+                content_type=content_type,
+            )
+            response['Content-Length'] = size
+        else:
+            first, last = byte_range
+            response = StreamingHttpResponse(
+                iter_blob(
+                    blob_name,
+                    offset=first,
+                    length=last - first + 1,
+                    etag=etag,
+                ),
+                content_type=content_type,
+                status=206,
+            )
+            response['Content-Length'] = last - first + 1
+            response['Content-Range'] = f"bytes {first}-{last}/{size}"
+
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = quote_etag(etag)
+        response['Last-Modified'] = http_date(last_modified)
+        # Documents contain personal information, so they can only be cached
+        # by the browser (and must be revalidated)
+        response['Cache-Control'] = 'private, no-cache'
+        response['Content-Disposition'] = "inline; filename*=utf-8''{}".format(
+            quote(blob_name_path.name)
         )
+        return response
 
     # General view-level exception catching
     except:
@@ -179,11 +429,20 @@ def add_elig_program(request, **kwargs):
             form = EligProgramAddForm(request.POST, request.FILES)
 
             if form.is_valid():
-                file_validated, validation_message = file_validation(
-                    request.FILES.getlist('document_path')[0],
-                    request.user.id,
-                    calling_function='add_elig_program',
-                )
+                uploaded_files = request.FILES.getlist('document_path')
+                for f in uploaded_files:
+                    file_validated, validation_message = file_validation(
+                        f,
+                        request.user.id,
+                        calling_function='add_elig_program',
+                    )
+                    if not file_validated:
+                        break
+
+                    # Store the validated content type rather than the one
+                    # sent by the browser
+                    f.content_type = supported_content_types[validation_message]
+
                 if not file_validated:
                     return render(
                         request,
@@ -205,23 +464,34 @@ def add_elig_program(request, **kwargs):
                         id=int(form.cleaned_data['program_name'])
                     ),
                 )
-                fileNames = []
-                
-                # Save the upload to blob storage
-                fileobj = request.FILES.getlist('document_path')[0]
-                instance.document_path.save(
-                    pendulum.now(
-                        'utc'
-                    ).format(
-                        f"YYYY-MM-DD[T]HHmmss[Z_1_{fileobj}]"
-                    ),
-                    fileobj,
+                # Save the uploads to blob storage together (or reference the
+                # same content, if it's already stored), as the app does
+                file_names = submission_file_names(
+                    [f.name for f in uploaded_files],
+                    pendulum.now('utc'),
                 )
-                fileNames.append(str(instance.document_path))
+                fileNames, new_file_names = upload_files(
+                    [
+                        (instance.document_path.field.generate_filename(instance, file_name), f)
+                        for file_name, f in zip(file_names, uploaded_files)
+                    ],
+                    user_id=request.user.id,
+                    calling_function='add_elig_program',
+                    storage=instance.document_path.storage,
+                )
+                # Queue the new files once, after they're all uploaded. Content
+                # that was already stored is already normalized
+                queue_normalization(new_file_names)
 
-                # Reformat document_path in the database to match the app
-                instance.document_path = str(fileNames)
-                instance.save()
+                # Save the documents, one record per file
+                instance.set_documents([
+                    {
+                        'blob_name': file_name,
+                        'size': f.size,
+                        'content_type': f.content_type,
+                        'sha256': f.sha256,
+                    } for file_name, f in zip(fileNames, uploaded_files)
+                ])
 
                 # Add a log entry to UserAdmin for this new program
                 _ = LogEntry.objects.log_action(
@@ -354,18 +624,44 @@ def replace_household_member_id(request, user_id, **kwargs):
                     f"YYYY-MM-DD[T]HHmmss[Z]" # append datetime for uniqueness
                 ) + file_obj.name.replace(' ', '_') # append new filename with no spaces
             
-            # upload new file with user filename
-            new_filename = default_storage.save(new_filename, file_obj)
-
-            # Update file path for any existing household members with matching old file path
-            household_members = HouseholdMembers.objects.get(user_id=user_id)
-            for person in household_members.household_info['persons_in_household']:
-                # request.POST['member_name'] is the existing document_path
-                if person['identification_path'] == request.POST['member_name']:
-                    person['identification_path'] = new_filename
-
-            # Save changes to household member object
-            household_members.save()
+            # upload new file with user filename (or reference the same
+            # content, if it's already stored)
+            stored_names, new_names = upload_files(
+                [(new_filename, file_obj)],
+                user_id=request.user.id,
+                calling_function='replace_household_member_id',
+            )
+            new_filename = stored_names[0]
+            # Content that was already stored is already normalized
+            queue_normalization(new_names)
+
+            with transaction.atomic():
+                # Update file path for any existing household members with matching old file path
+                household_members = HouseholdMembers.objects.select_for_update().get(
+                    user_id=user_id,
+                )
+                replaced_count = 0
+                for person in household_members.household_info['persons_in_household']:
+                    # request.POST['member_name'] is the existing document_path
+                    if person['identification_path'] == request.POST['member_name']:
+                        person['identification_path'] = new_filename
+                        replaced_count += 1
+
+                # Save changes to household member object
+                household_members.save()
+
+                # Each replaced ID moves a reference from the old document to
+                # the new one, which upload_files() added one reference to.
+                # The old document stays in storage until the
+                # 'unreferenced_document' retention policy deletes it
+                if replaced_count == 0:
+                    release_references([new_filename], retain=True)
+                else:
+                    claim_references([new_filename] * (replaced_count - 1))
+                    release_references(
+                        [request.POST['member_name']] * replaced_count,
+                        retain=True,
+                    )
 
             return render(
                 request,
@@ -18,6 +18,9 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import json
 import datetime
+import functools
+import random
+import uuid
 import requests
 import pendulum
 from enum import Enum
@@ -39,11 +42,10 @@ from django.shortcuts import reverse
 from django.contrib.auth.backends import UserModel
 from django.contrib.auth import login as django_auth_login
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
-from django.db.models.fields.files import FieldFile
-from django.core.serializers.json import DjangoJSONEncoder
 from django.core.files.uploadedfile import UploadedFile
-from phonenumber_field.phonenumber import PhoneNumber
+from django_q.tasks import async_task
 from app.models import (
     HouseholdMembers,
     EligibilityProgram,
@@ -52,12 +54,19 @@ from app.models import (
     User,
     Household,
     AddressRD,
+    NotificationOutbox,
 )
 from app.constants import (
     supported_content_types,
     enable_calendar_year_renewal,
     application_pages,
+    notification_backoff_base_second,
+    notification_backoff_max_second,
+    outbound_max_wait_second,
+    sms_throttled_retry_second,
 )
+from app.ratelimit import throttle, RateLimitExceeded
+from app.history import get_history_serializer, to_json_value
 from logger.wrappers import LoggerWrapper
 
 
@@ -105,19 +114,73 @@ class QualificationStatus(Enum):
     ACTIVE = 'ACTIVE'
 
 
-def broadcast_sms(phone_Number):
-    message_to_broadcast = (
-        "Thank you for creating an account with Get FoCo! Be sure to review the programs you qualify for on your dashboard and click on Apply Now to finish the application process!")
-    client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+@functools.lru_cache(maxsize=None)
+def get_twilio_client():
+    """
+    Return the process-wide Twilio client, so the HTTP session (and its
+    connection pool) is reused across messages.
+
+    """
+
+    return Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+
+
+def send_generic_sms(phone_number, body, bulk=False):
+    """
+    Send an SMS via Twilio, subject to the shared Twilio rate limit.
+
+    Parameters
+    ----------
+    phone_number : str
+        The recipient's phone number.
+    body : str
+        The message text.
+    bulk : bool, optional
+        Whether this is part of a bulk send. Bulk messages can't use the
+        interactive reserve of the rate limiter (if any), but otherwise wait
+        for it the same way, so the workers send them at the rate limit rather
+        than deferring all but one per sweep.
+
+    Returns
+    -------
+    str
+        The Twilio message SID.
+
+    Raises
+    ------
+    RateLimitExceeded
+        If the rate limit (ours or Twilio's) doesn't allow the message now.
+
+    """
+
+    throttle('twilio', timeout=outbound_max_wait_second, bulk=bulk)
 
     try:
-        message_instance = client.messages.create(
-            to=phone_Number,
+        message_instance = get_twilio_client().messages.create(
+            to=phone_number,
             from_=settings.TWILIO_NUMBER,
-            body=message_to_broadcast,
+            body=body,
         )
     except TwilioRestException as e:
-        log.exception(e, function='broadcast_sms')
+        if e.status == 429:
+            log.warning(
+                "Twilio returned HTTP 429; deferring message",
+                function='send_generic_sms',
+            )
+            raise RateLimitExceeded('twilio', sms_throttled_retry_second) from e
+
+        log.exception(e, function='send_generic_sms')
+        # Re-raise so the notification outbox can retry
+        raise
+
+    return message_instance.sid
+
+
+def broadcast_sms(phone_Number):
+    message_to_broadcast = (
+        "Thank you for creating an account with Get FoCo! Be sure to review the programs you qualify for on your dashboard and click on Apply Now to finish the application process!")
+
+    return send_generic_sms(phone_Number, message_to_broadcast)
 
 
 def address_check(address_dict):
@@ -216,6 +279,7 @@ def address_lookup(street_address, zip_code):
     }
 
     # Gather response
+    throttle('arcgis', timeout=outbound_max_wait_second)
     response = requests.get(url, params=payload)
     if response.status_code != requests.codes.ok:
         log.error(
@@ -298,6 +362,8 @@ def connexion_lookup(coord_string):
         'geometry': coord_string,
     }
 
+    throttle('arcgis', timeout=outbound_max_wait_second)
+
     try:
         # Gather response
         response = requests.post(url, params=payload)
@@ -381,6 +447,8 @@ def gma_lookup(coord_string):
         'f': 'pjson',
     }
 
+    throttle('arcgis', timeout=outbound_max_wait_second)
+
     try:
         # Gather response
         response = requests.get(url, params=payload)
@@ -417,6 +485,7 @@ def get_usps_token():
     """Get the bearer token for the USPS v3 API."""
 
     # Gather the token with the 'addresses' scope
+    throttle('usps', timeout=outbound_max_wait_second)
     response = requests.post(
         'https://apis.usps.com/oauth2/v3/token',
         data={
@@ -468,6 +537,7 @@ def validate_usps(inobj):
     # Call the USPS 'addresses' API with the parsed input. urljoin(),
     # urlencode(), and quote are used so that spaces are escaped with '%20'
     # instead of '+' (as requests-native functionality does)
+    throttle('usps', timeout=outbound_max_wait_second)
     response = requests.get(
         "https://apis.usps.com/addresses/v3/address?{}".format(
             urlencode(
@@ -493,7 +563,7 @@ def validate_usps(inobj):
     # Log and return the dictionary
     response_dict = response.json()
     log.info(
-        f"Address dict found: {response_dict}",
+        "Address dict found: %s", response_dict,
         function='validate_usps',
     )
     return response_dict
@@ -505,6 +575,7 @@ def broadcast_email(email):
         to_emails=email)
 
     message.template_id = settings.WELCOME_EMAIL_TEMPLATE
+    throttle('sendgrid', timeout=outbound_max_wait_second)
     try:
         sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
         response = sg.send(message)
@@ -514,6 +585,10 @@ def broadcast_email(email):
         )
     except Exception as e:
         log.exception(e, function='broadcast_email')
+        # Re-raise so the notification outbox can retry
+        raise
+
+    return response.status_code
 
 
 def broadcast_email_pw_reset(email, content):
@@ -527,6 +602,7 @@ def broadcast_email_pw_reset(email, content):
         'html_content': content,
     }
     message.template_id = settings.PW_RESET_EMAIL_TEMPLATE
+    throttle('sendgrid', timeout=outbound_max_wait_second)
     try:
         sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
         response = sg.send(message)
@@ -539,9 +615,19 @@ def broadcast_email_pw_reset(email, content):
             e,
             function='broadcast_email_pw_reset',
         )
+        # Re-raise so the notification outbox can retry
+        raise
+
+    return response.status_code
 
 
 def broadcast_renewal_email(email):
+    # This is only sent by the (bulk) renewal task, so yield to interactive
+    # emails. The wait is capped so the renewal partition stays within its
+    # time budget; a user that isn't sent in time is counted as failed and
+    # retried on the next run
+    throttle('sendgrid', timeout=outbound_max_wait_second, bulk=True)
+
     message = Mail(
         from_email=settings.CONTACT_EMAIL,
         to_emails=email)
@@ -564,70 +650,234 @@ def broadcast_renewal_email(email):
     return response.status_code
 
 
+# Map each notification kind to its channel and the function that delivers it.
+# Each function is called with the outbox recipient and payload, and must raise
+# on failure so that the delivery can be retried
+notification_senders = {
+    'welcome_email': (
+        'email',
+        lambda recipient, payload: broadcast_email(recipient),
+    ),
+    'welcome_sms': (
+        'sms',
+        lambda recipient, payload: broadcast_sms(recipient),
+    ),
+    'bulk_sms': (
+        'sms',
+        lambda recipient, payload: send_generic_sms(
+            recipient,
+            payload['body'],
+            bulk=True,
+        ),
+    ),
+    'pw_reset_email': (
+        'email',
+        lambda recipient, payload: broadcast_email_pw_reset(
+            recipient,
+            payload['content'],
+        ),
+    ),
+}
+
+# Notification kinds whose payload shouldn't be retained once delivered
+notification_sensitive_kinds = {'pw_reset_email'}
+
+
+def queue_notification(
+        kind,
+        recipient,
+        user=None,
+        payload=None,
+        idempotency_key=None,
+    ):
+    """
+    Add a notification to the outbox, to be delivered by a Django-Q worker once
+    the current transaction commits.
+
+    This should be called within the same ``transaction.atomic()`` block as the
+    change that triggers the notification, so that the notification exists if
+    and only if the change does.
+
+    Parameters
+    ----------
+    kind : str
+        The kind of notification; must be a key of ``notification_senders``.
+    recipient : str
+        The email address or phone number of the recipient.
+    user : User, optional
+        The user the notification is for.
+    payload : dict, optional
+        Any JSON-serializable data needed to build the message.
+    idempotency_key : str, optional
+        Key that identifies the triggering event. A notification that already
+        exists with the same key will not be queued again. If not specified, a
+        random key is used.
+
+    Returns
+    -------
+    NotificationOutbox
+        The (new or existing) outbox record.
+
+    """
+
+    channel, _ = notification_senders[kind]
+
+    with transaction.atomic():
+        notification, created = NotificationOutbox.objects.get_or_create(
+            idempotency_key=idempotency_key or f"{kind}:{uuid.uuid4().hex}",
+            defaults={
+                'user': user,
+                'channel': channel,
+                'kind': kind,
+                'recipient': recipient,
+                'payload': payload,
+            },
+        )
+
+        if created:
+            # Deliver as soon as the outermost transaction commits. If this is
+            # lost (e.g. the broker is down), the scheduled sweeper picks it up
+            transaction.on_commit(
+                lambda: async_task(
+                    'app.tasks.deliver_notification',
+                    notification.id,
+                )
+            )
+        else:
+            log.debug(
+                f"Notification '{notification.idempotency_key}' already exists; not queuing",
+                function='queue_notification',
+                user_id=getattr(user, 'id', None),
+            )
+
+    return notification
+
+
+def queue_bulk_notifications(
+        kind,
+        recipients,
+        payload=None,
+        idempotency_prefix=None,
+        batch_size=500,
+    ):
+    """
+    Add one notification per recipient to the outbox in bulk, e.g. for
+    admin-initiated reminders to many households.
+
+    SMS notifications are staggered at the Twilio send rate, so that each run
+    of the scheduled sweeper only releases about as many as the workers can
+    send (waiting for the rate limiter) before the next run.
+
+    Parameters
+    ----------
+    kind : str
+        The kind of notification; must be a key of ``notification_senders``.
+    recipients : iterable
+        ``(user, recipient)`` pairs, where ``user`` may be None.
+    payload : dict, optional
+        Any JSON-serializable data needed to build the message; shared by all
+        recipients.
+    idempotency_prefix : str, optional
+        Key that identifies this bulk send. Recipients that have already been
+        queued with the same prefix are skipped. If not specified, a random
+        prefix is used.
+    batch_size : int, optional
+        The number of rows to insert per query.
+
+    Returns
+    -------
+    int
+        The number of notifications that were queued.
+
+    """
+
+    channel, _ = notification_senders[kind]
+    idempotency_prefix = idempotency_prefix or f"{kind}:{uuid.uuid4().hex}"
+
+    now = pendulum.now('utc')
+    interval_second = 1 / settings.OUTBOUND_RATE_LIMITS['twilio']['rate'] if channel == 'sms' else 0
+
+    notifications = []
+    for idx, (user, recipient) in enumerate(recipients):
+        notifications.append(
+            NotificationOutbox(
+                user=user,
+                channel=channel,
+                kind=kind,
+                recipient=recipient,
+                payload=payload,
+                idempotency_key=f"{idempotency_prefix}:{user.id if user else recipient}",
+                next_attempt_at=now.add(seconds=idx * interval_second),
+            )
+        )
+
+    with transaction.atomic():
+        existing_count = NotificationOutbox.objects.filter(
+            idempotency_key__startswith=f"{idempotency_prefix}:",
+        ).count()
+        # Skip any recipients that were already queued under this prefix
+        NotificationOutbox.objects.bulk_create(
+            notifications,
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        queued_count = NotificationOutbox.objects.filter(
+            idempotency_key__startswith=f"{idempotency_prefix}:",
+        ).count() - existing_count
+
+        # Start delivering whatever is already due, rather than waiting for the
+        # next scheduled sweep
+        transaction.on_commit(
+            lambda: async_task('app.tasks.deliver_pending_notifications')
+        )
+
+    log.info(
+        f"Queued {queued_count} '{kind}' notifications under '{idempotency_prefix}'",
+        function='queue_bulk_notifications',
+    )
+
+    return queued_count
+
+
+def notification_retry_delay(attempts):
+    """
+    Return the delay (as a ``datetime.timedelta``) before the next delivery
+    attempt, using capped exponential backoff with jitter.
+
+    """
+
+    delay = min(
+        notification_backoff_base_second * 2 ** max(attempts - 1, 0),
+        notification_backoff_max_second,
+    )
+    # Add up to 10% jitter so that retries for a provider outage don't all land
+    # at the same time
+    return datetime.timedelta(seconds=delay * (1 + random.random() / 10))
+
+
 def changed_modelfields_to_dict(
         previous_instance,
         current_instance,
         pre_delete=False,
 ):
     """
-    Convert a model object to a dictionary. If a property is a datetime object,
-    it will be converted to a string. If there is a nested model, it will be
-    excluded from the dictionary. If pre_delete is True, the previous instance
-    is returned as a dictionary.
+    Convert a model object to a JSON-ready dictionary of the previous values of
+    the fields that have changed. If a property is a datetime object, it will
+    be converted to a string; relations are stored by ID. If pre_delete is
+    True, the entire previous instance is returned as a dictionary.
+
+    The conversion is done by the model's precompiled serializer (see
+    app.history), so the output doesn't need a JSON round trip.
     :param previous_instance: model object
     :param current_instance: model object
     :param pre_delete: boolean
     """
 
-    # Initialize output
-    model_dict = {}
-
+    serializer = get_history_serializer(previous_instance.__class__)
     if pre_delete:
-        # Save all fields as dictionary before deleting the record
-        for field in previous_instance._meta.fields:
-            field_name = field.name
-            try:
-                value = getattr(previous_instance, field_name)
-                if field.is_relation:
-                    # Designate the field name and value as 'id'
-                    model_dict[f"{field.name}_id"] = value.id
-                elif isinstance(value, FieldFile):
-                    # save the value so it can be json serialized
-                    model_dict[field.name] = str(value)
-                else:
-                    if isinstance(value, datetime.datetime):
-                        value = value.strftime('%Y-%m-%d %H:%M:%S')
-                    elif isinstance(value, PhoneNumber):
-                        value = value.as_e164
-                    model_dict[field.name] = value
-
-            except AttributeError:
-                pass
-    else:
-        # Compare the current instance with the previous instance
-        for field in current_instance._meta.fields:
-            field_name = field.name
-            if getattr(current_instance, field_name) != getattr(previous_instance, field_name):
-                try:
-                    value = getattr(previous_instance, field_name)
-                    if field.is_relation:
-                        # Designate the field name and value as 'id'
-                        model_dict[f"{field.name}_id"] = value.id
-                    # check if the field is FieldFile
-                    elif isinstance(value, FieldFile):
-                        # save the value so it can be json serialized
-                        model_dict[field.name] = str(value)
-                    else:
-                        if isinstance(value, datetime.datetime):
-                            value = value.strftime('%Y-%m-%d %H:%M:%S')
-                        elif isinstance(value, PhoneNumber):
-                            value = value.as_e164
-                        model_dict[field.name] = value
-
-                except AttributeError:
-                    pass
-
-    return model_dict
+        return serializer.serialize(previous_instance)
+
+    return serializer.changed(previous_instance, current_instance)
 
 
 def serialize_household_members(request, file_paths):
@@ -651,8 +901,7 @@ def serialize_household_members(request, file_paths):
         'identification_path': file_paths[i]
     } for i in range(len(household_members_data['name']))]
 
-    household_info = json.loads(json.dumps(
-        {'persons_in_household': household_members}, cls=DjangoJSONEncoder))
+    household_info = to_json_value({'persons_in_household': household_members})
     return household_info
     
 
@@ -902,7 +1151,7 @@ def get_in_progress_eligiblity_file_uploads(request):
         list: List of eligibility programs
     """
     users_in_progress_file_uploads = EligibilityProgram.objects.filter(
-        Q(user_id=request.user.id) & Q(document_path='')
+        Q(user_id=request.user.id) & Q(documents__isnull=True)
     ).select_related('program').values('id', 'program__id', 'program__friendly_name')
     return users_in_progress_file_uploads
 
@@ -923,8 +1172,7 @@ def save_renewal_action(request, action, status='completed', data={}):
         else:
             last_renewal_action[action] = {'status': status, 'data': data}
 
-        user.last_renewal_action = json.loads(
-            json.dumps(last_renewal_action, cls=DjangoJSONEncoder))
+        user.last_renewal_action = to_json_value(last_renewal_action)
         user.save()
 
 
@@ -19,6 +19,76 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # Set the notification buffer to be used for reminders
 notification_buffer_month = 1
 
+# Set the SMS text sent by the admin 'send reminder' action
+reminder_sms_body = "This is a reminder from Get FoCo! Log in to your account to check the status of your applications and finish any that are incomplete."
+
+# Set the notification outbox delivery parameters. Failed deliveries are
+# retried with exponential backoff (base * 2^(attempt-1), capped at the max)
+# until the max attempts have been made
+notification_max_attempts = 6
+notification_backoff_base_second = 30
+notification_backoff_max_second = 3600
+# How long a delivery is claimed for (longer than the Django-Q worker timeout),
+# after which a notification whose worker died is delivered again
+notification_claim_second = 120
+
+# Set the longest a call will wait for its outbound rate limiter (see
+# settings.OUTBOUND_RATE_LIMITS), and how long to defer an SMS when Twilio
+# itself responds with HTTP 429. This must stay well under the Django-Q worker
+# timeout, since bulk SMS waits for the limiter in the workers
+outbound_max_wait_second = 5
+sms_throttled_retry_second = 60
+
+# Set the parameters for partitioned scheduled tasks (see app.coordination).
+# Leases expire if not renewed (e.g. the node crashed), each partition task
+# stops and requeues itself before the Django-Q worker timeout, and run state is
+# kept in Redis for the expiry period
+partition_lease_second = 60
+partition_time_budget_second = 20
+partition_batch_size = 100
+partition_state_expiry_second = 3 * 24 * 3600
+
+# Set the number of history rows read per (keyset-paginated) query when
+# reconstructing past state, and shown per page in the admin history viewer
+history_batch_size = 500
+history_page_size = 50
+
+# Set the parameters for the document retention purge (see app.retention): the
+# number of expired records tombstoned per transaction, and how long each task
+# runs before it requeues itself. The lease and checkpoint timing are shared
+# with the partitioned tasks above
+retention_batch_size = 100
+retention_time_budget_second = 20
+
+# Set the maximum number of files from one submission uploaded to storage at
+# the same time (see app.uploads)
+upload_max_workers = 4
+
+# Set the parameters for resumable (chunked) uploads (see app.resumable): the
+# largest chunk and file accepted (matching max_upload_size_mib in the
+# settings), and how long an unfinished upload can be resumed
+resumable_upload_max_chunk_bytes = 4 * 1024 * 1024
+resumable_upload_max_bytes = 100 * 1024 * 1024
+resumable_upload_expiry_second = 24 * 3600
+
+# Set the parameters for document previews (see app.previews): the longest
+# side (in pixels) and JPEG quality of the preview, and how long to wait before
+# retrying a document that couldn't be previewed
+preview_max_dimension_px = 1600
+preview_jpeg_quality = 80
+preview_retry_second = 24 * 3600
+
+# Define the notification outbox choices
+notification_channel_choices = (
+    ('email', 'Email'),
+    ('sms', 'SMS'),
+)
+notification_status_choices = (
+    ('pending', 'Pending'),
+    ('sent', 'Sent'),
+    ('failed', 'Failed'),
+)
+
 # Enable Calendar Year Renewals
 enable_calendar_year_renewal = True
 
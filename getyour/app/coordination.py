@@ -0,0 +1,336 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+import uuid
+import logging
+import pendulum
+
+from django.conf import settings
+from django.db.models.functions import Mod
+from django_redis import get_redis_connection
+from django_q.tasks import async_task
+
+from app.constants import (
+    partition_lease_second,
+    partition_time_budget_second,
+    partition_batch_size,
+    partition_state_expiry_second,
+)
+from logger.wrappers import LoggerWrapper
+
+
+# Initialize logger
+log = LoggerWrapper(logging.getLogger(__name__))
+
+
+# Release or renew the lease only if it's still held by this owner, so that an
+# expired lease that has since been taken by another node is left alone
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class RedisLease:
+    """
+    A lease (a lock with an expiry) shared by every node that uses the same
+    Redis server. If the holder dies, the lease expires after ``ttl_second``.
+
+    Parameters
+    ----------
+    name : str
+        Name of the lease; used as the Redis key.
+    ttl_second : int, optional
+        How long the lease is held before it expires unless renewed.
+
+    """
+
+    def __init__(self, name, ttl_second=partition_lease_second):
+        self.name = name
+        self.ttl_second = ttl_second
+        self.owner = uuid.uuid4().hex
+        self.connection = get_redis_connection('default')
+
+    def acquire(self):
+        """Attempt to take the lease, returning whether it was acquired."""
+        return bool(
+            self.connection.set(
+                self.name,
+                self.owner,
+                nx=True,
+                px=self.ttl_second * 1000,
+            )
+        )
+
+    def renew(self):
+        """Extend the lease, returning whether it's still held."""
+        return bool(
+            self.connection.eval(
+                RENEW_LEASE_SCRIPT,
+                1,
+                self.name,
+                self.owner,
+                self.ttl_second * 1000,
+            )
+        )
+
+    def release(self):
+        """Release the lease, if it's still held."""
+        self.connection.eval(RELEASE_LEASE_SCRIPT, 1, self.name, self.owner)
+
+    def is_held(self):
+        """Return whether any node currently holds the lease."""
+        return bool(self.connection.exists(self.name))
+
+
+class PartitionedJob:
+    """
+    A job whose users are split by ID into partitions that can be processed by
+    any node's Django-Q workers.
+
+    One node at a time (the holder of the leader lease) plans a run, queuing a
+    task for each partition that hasn't finished. Each partition is processed
+    under its own lease and checkpoints the last user ID it completed, so a
+    crashed node's partition is resumed from its checkpoint the next time the
+    run is planned and no other partition is re-run.
+
+    Parameters
+    ----------
+    name : str
+        Name of the job; used in the Redis keys.
+    partition_task : str
+        Dotted path of the task that processes a partition. It's called with
+        ``(run_id, partition)`` and should call ``process_partition()``.
+    partition_count : int, optional
+        The number of partitions. Defaults to the
+        ``SCHEDULED_TASK_PARTITIONS`` setting.
+
+    """
+
+    def __init__(self, name, partition_task, partition_count=None):
+        self.name = name
+        self.partition_task = partition_task
+        self.partition_count = partition_count or settings.SCHEDULED_TASK_PARTITIONS
+        self.connection = get_redis_connection('default')
+
+    def _key(self, *parts):
+        return ':'.join(['partitioned', self.name] + [str(x) for x in parts])
+
+    def _partition_state(self, run_id, partition):
+        state = self.connection.hgetall(self._key(run_id, partition))
+        return {
+            'last_id': int(state.get(b'last_id', 0)),
+            'processed': int(state.get(b'processed', 0)),
+            'failed': int(state.get(b'failed', 0)),
+            'done': state.get(b'done') == b'1',
+        }
+
+    def _partition_lease(self, run_id, partition):
+        return RedisLease(self._key(run_id, partition, 'lease'))
+
+    def is_complete(self, run_id):
+        """Return whether every partition of the run has finished."""
+        return all(
+            self._partition_state(run_id, partition)['done']
+            for partition in range(self.partition_count)
+        )
+
+    def plan(self, run_id=None, resume_only=False):
+        """
+        Plan a run, queuing each partition that hasn't finished and isn't
+        currently being processed. This is safe to call from every node; only
+        the node holding the leader lease plans.
+
+        Parameters
+        ----------
+        run_id : str, optional
+            Identifier of the run. Calling this again with the same ID only
+            resumes unfinished partitions (e.g. use the date for a daily job).
+            If not specified, the current run is resumed if unfinished, else a
+            new run is started.
+        resume_only : bool, optional
+            Only resume the current run; don't start a new one.
+
+        Returns
+        -------
+        str or None
+            The ID of the run that was planned, or None if nothing was planned.
+
+        """
+
+        leader_lease = RedisLease(self._key('leader'))
+        if not leader_lease.acquire():
+            log.info(
+                f"Another node is planning '{self.name}'; skipping",
+                function='PartitionedJob.plan',
+            )
+            return None
+
+        try:
+            current_run_id = self.connection.get(self._key('current'))
+            current_run_id = current_run_id.decode() if current_run_id else None
+            current_is_complete = current_run_id is None or self.is_complete(
+                current_run_id
+            )
+
+            if resume_only:
+                if current_is_complete:
+                    return None
+                run_id = current_run_id
+            elif run_id is None:
+                run_id = current_run_id if not current_is_complete else \
+                    pendulum.now('utc').format('YYYYMMDDTHHmmss')
+
+            self.connection.set(
+                self._key('current'),
+                run_id,
+                ex=partition_state_expiry_second,
+            )
+
+            queued_partitions = []
+            for partition in range(self.partition_count):
+                if self._partition_state(run_id, partition)['done']:
+                    continue
+                if self._partition_lease(run_id, partition).is_held():
+                    continue
+                # Don't requeue a partition that was queued recently but is
+                # still waiting for a worker
+                if not self.connection.set(
+                        self._key(run_id, partition, 'queued'),
+                        1,
+                        nx=True,
+                        ex=partition_lease_second * 5,
+                ):
+                    continue
+
+                async_task(self.partition_task, run_id, partition)
+                queued_partitions.append(partition)
+
+            log.info(
+                f"Planned '{self.name}' run {run_id}; queued partitions {queued_partitions}",
+                function='PartitionedJob.plan',
+            )
+
+        finally:
+            leader_lease.release()
+
+        return run_id
+
+    def process_partition(self, run_id, partition, queryset, handler):
+        """
+        Process the users of a partition, in ID order starting after the last
+        checkpoint, until it's finished or the time budget runs out (in which
+        case the partition is requeued to continue).
+
+        A user whose handler raises is logged and counted as failed, and the
+        partition moves on, so one user can't hold up the rest.
+
+        Parameters
+        ----------
+        run_id : str
+            Identifier of the run, from ``plan()``.
+        partition : int
+            The partition to process.
+        queryset : QuerySet
+            The users to process (before partitioning).
+        handler : function
+            Called with each user in the partition.
+
+        """
+
+        lease = self._partition_lease(run_id, partition)
+        if not lease.acquire():
+            log.info(
+                f"'{self.name}' run {run_id} partition {partition} is already being processed",
+                function='PartitionedJob.process_partition',
+            )
+            return
+
+        state_key = self._key(run_id, partition)
+        state = self._partition_state(run_id, partition)
+        deadline = time.monotonic() + partition_time_budget_second
+
+        try:
+            partition_queryset = queryset.annotate(
+                id_partition=Mod('id', self.partition_count),
+            ).filter(
+                id_partition=partition,
+            ).order_by('id')
+
+            while True:
+                users = list(
+                    partition_queryset.filter(id__gt=state['last_id'])[:partition_batch_size]
+                )
+                if len(users) == 0:
+                    self.connection.hset(state_key, 'done', 1)
+                    self.connection.expire(state_key, partition_state_expiry_second)
+                    log.info(
+                        f"'{self.name}' run {run_id} partition {partition} finished ({state['processed']} users, {state['failed']} failed)",
+                        function='PartitionedJob.process_partition',
+                    )
+                    return
+
+                for user in users:
+                    try:
+                        handler(user)
+                    except Exception:
+                        log.exception(
+                            f"'{self.name}' run {run_id} partition {partition} failed for this user; continuing",
+                            function='PartitionedJob.process_partition',
+                            user_id=user.id,
+                        )
+                        state['failed'] += 1
+
+                    # Checkpoint after each user, so a crash re-runs at most
+                    # the user that was in progress
+                    state['last_id'] = user.id
+                    state['processed'] += 1
+                    self.connection.hset(state_key, mapping={
+                        'last_id': state['last_id'],
+                        'processed': state['processed'],
+                        'failed': state['failed'],
+                    })
+                    self.connection.expire(state_key, partition_state_expiry_second)
+
+                    # Renew the lease and check the time budget after each
+                    # user, since a handler can block (e.g. on a rate limit)
+                    if not lease.renew():
+                        log.warning(
+                            f"Lost the lease for '{self.name}' run {run_id} partition {partition}; stopping",
+                            function='PartitionedJob.process_partition',
+                        )
+                        return
+
+                    if time.monotonic() > deadline:
+                        # Continue in a new task, so this one doesn't hit the
+                        # Django-Q worker timeout
+                        lease.release()
+                        async_task(self.partition_task, run_id, partition)
+                        return
+
+        finally:
+            lease.release()
@@ -18,6 +18,9 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from functools import wraps
 from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from app.uploads import HashingFileUploadHandler
 
 
 def set_update_mode(view_func):
@@ -40,3 +43,24 @@ def set_update_mode(view_func):
         return response
 
     return wrapper
+
+
+def stream_file_uploads(view_func):
+    """
+    Decorator to write every uploaded file straight to a temporary file on
+    disk, rather than holding smaller files in memory, hashing it on the way
+    (see HashingFileUploadHandler).
+
+    The upload handlers can only be changed before the request body is read,
+    which CsrfViewMiddleware would otherwise do first, so the CSRF check is
+    run here instead.
+    """
+    protected_view_func = csrf_protect(view_func)
+
+    @csrf_exempt
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [HashingFileUploadHandler(request)]
+        return protected_view_func(request, *args, **kwargs)
+
+    return wrapper
@@ -120,7 +120,11 @@ class HouseholdMembersForm(forms.ModelForm):
     name = forms.CharField(label='First & Last Name of Individual')
     birthdate = forms.DateField(
         label="Their Birthdate", widget=forms.widgets.DateInput(attrs={'type': 'date'}))
-    identification_path = forms.CharField(widget=forms.HiddenInput())
+    # Not required, since the files can instead be uploaded in chunks before
+    # the form is submitted (see app.resumable)
+    identification_path = forms.FileField(
+        required=False,
+        widget=forms.FileInput(attrs={'accept': '.jpg, .jpeg, .png, .pdf'}))
 
     class Meta:
         model = HouseholdMembers
@@ -139,6 +143,12 @@ class FileUploadForm(forms.ModelForm):
             'document_path': forms.ClearableFileInput(attrs={'multiple': True}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Not required, since the files can instead be uploaded in chunks
+        # before the form is submitted (see app.resumable)
+        self.fields['document_path'].required = False
+
 
 class FeedbackForm(forms.ModelForm):
     feedback_comments = forms.CharField(max_length=500, required=False)
@@ -0,0 +1,540 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import datetime
+import functools
+
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import F, Func, Q, Value
+from django.db.models.functions import Cast, JSONObject
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from phonenumber_field.modelfields import PhoneNumberField
+from phonenumber_field.phonenumber import PhoneNumber
+
+from app.models import (
+    User,
+    UserHist,
+    Address,
+    AddressHist,
+    Household,
+    HouseholdHist,
+    HouseholdMembers,
+    HouseholdMembersHist,
+    IQProgramHist,
+    EligibilityProgramHist,
+)
+from app.constants import history_batch_size, history_page_size
+
+
+# Models with one record per user, whose past state can be reconstructed: the
+# history model and the field holding when the record was created
+reconstructable_models = {
+    User: (UserHist, 'date_joined'),
+    Address: (AddressHist, 'created_at'),
+    Household: (HouseholdHist, 'created_at'),
+    HouseholdMembers: (HouseholdMembersHist, 'created_at'),
+}
+
+# Every history model, by the label shown in the admin history viewer
+history_models = {
+    'Address': AddressHist,
+    'Eligibility program': EligibilityProgramHist,
+    'Household': HouseholdHist,
+    'Household members': HouseholdMembersHist,
+    'IQ program': IQProgramHist,
+    'User': UserHist,
+}
+
+
+# Used for the values that aren't natively JSON-serializable, so the output
+# matches a json.dumps(..., cls=DjangoJSONEncoder) round trip
+_json_encoder = DjangoJSONEncoder()
+
+_json_native_types = {str, int, float, bool, type(None)}
+
+
+def _json_key(key):
+    # Convert a dict key the same way json.dumps() does
+    if isinstance(key, str):
+        return key
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, float):
+        return float.__repr__(key)
+    return str(key)
+
+
+def to_json_value(value):
+    """
+    Return ``value`` as JSON-ready (natively serializable) data, equivalent to
+    ``json.loads(json.dumps(value, cls=DjangoJSONEncoder))`` but without the
+    round trip through a string.
+
+    """
+
+    value_type = type(value)
+    if value_type in _json_native_types:
+        return value
+    if value_type is dict:
+        return {_json_key(k): to_json_value(v) for k, v in value.items()}
+    if value_type is list or value_type is tuple:
+        return [to_json_value(x) for x in value]
+
+    # Subclasses of the native types, and everything DjangoJSONEncoder
+    # handles (dates and times, Decimal, UUID, lazy strings)
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, dict):
+        return {_json_key(k): to_json_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(x) for x in value]
+    return to_json_value(_json_encoder.default(value))
+
+
+def _datetime_to_json(value):
+    # Historical values store datetimes to the second, without a timezone
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return to_json_value(value)
+
+
+def _phonenumber_to_json(value):
+    if isinstance(value, PhoneNumber):
+        return value.as_e164
+    return to_json_value(value)
+
+
+def _phonenumber_key(value):
+    # Compare phone numbers by their parts; PhoneNumber.__eq__ validates both
+    # numbers, which is by far the slowest part of the comparison
+    if isinstance(value, PhoneNumber):
+        return (value.country_code, value.national_number, value.extension)
+    return value
+
+
+def _file_to_json(value):
+    # FieldFile (or the bare name, before it's wrapped by the descriptor)
+    return str(value)
+
+
+class HistorySerializer:
+    """
+    Serializer for the historical values of a model, built once from its
+    fields so that each field has its converter chosen up front.
+
+    Relations are stored by ID (as '<field>_id', only if set), datetimes as
+    'YYYY-MM-DD HH:MM:SS', phone numbers as E.164 and files by name.
+    Everything else is converted as with a DjangoJSONEncoder round trip.
+
+    Use get_history_serializer() rather than instantiating this directly.
+
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+        # (attname, output key, converter or None for relations) per field
+        self.fields = []
+        # Attnames whose values are compared through a key function
+        self.compare_keys = {}
+        for field in model._meta.fields:
+            if field.is_relation:
+                self.fields.append((field.attname, f"{field.name}_id", None))
+                continue
+
+            if isinstance(field, models.DateTimeField):
+                converter = _datetime_to_json
+            elif isinstance(field, PhoneNumberField):
+                converter = _phonenumber_to_json
+                self.compare_keys[field.attname] = _phonenumber_key
+            elif isinstance(field, models.FileField):
+                converter = _file_to_json
+            else:
+                converter = to_json_value
+            self.fields.append((field.attname, field.name, converter))
+
+    def serialize(self, instance):
+        """ Return every field value of ``instance``, JSON-ready. """
+
+        output = {}
+        for attname, key, converter in self.fields:
+            value = getattr(instance, attname)
+            if converter is None:
+                if value is not None:
+                    output[key] = value
+            else:
+                output[key] = converter(value)
+
+        return output
+
+    def changed(self, previous_instance, current_instance):
+        """
+        Return the values of ``previous_instance`` for the fields that differ
+        in ``current_instance``, JSON-ready.
+
+        """
+
+        output = {}
+        compare_keys = self.compare_keys
+        for attname, key, converter in self.fields:
+            value = getattr(previous_instance, attname)
+            current_value = getattr(current_instance, attname)
+            if attname in compare_keys:
+                compare_key = compare_keys[attname]
+                if compare_key(current_value) == compare_key(value):
+                    continue
+            elif current_value == value:
+                continue
+
+            if converter is None:
+                if value is not None:
+                    output[key] = value
+            else:
+                output[key] = converter(value)
+
+        return output
+
+
+@functools.lru_cache(maxsize=None)
+def get_history_serializer(model):
+    """ Return the (cached) HistorySerializer for ``model``. """
+
+    return HistorySerializer(model)
+
+
+class HistoryDateTime(Func):
+    """
+    Format a datetime column the way historical values store datetimes
+    ('YYYY-MM-DD HH:MM:SS', in UTC).
+
+    """
+
+    output_field = models.CharField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="to_char(%(expressions)s AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')",
+            **extra_context,
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # '%%%%' survives both the template and the parameter substitution
+        return self.as_sql(
+            compiler,
+            connection,
+            template="strftime('%%%%Y-%%%%m-%%%%d %%%%H:%%%%M:%%%%S', %(expressions)s)",
+            **extra_context,
+        )
+
+    def as_sql(self, compiler, connection, **extra_context):
+        if 'template' not in extra_context:
+            # Fall back to the database's own text representation
+            return Cast(
+                *self.get_source_expressions(),
+                output_field=models.TextField(),
+            ).as_sql(compiler, connection)
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+def _history_expression(field):
+    # Database-side equivalent of the HistorySerializer converters
+    if isinstance(field, models.DateTimeField):
+        return HistoryDateTime(F(field.attname))
+    if isinstance(field, (models.DecimalField, models.DateField, models.UUIDField)):
+        return Cast(F(field.attname), output_field=models.TextField())
+    return F(field.attname)
+
+
+def update_with_history(queryset, hist_model, user_field=None, **values):
+    """
+    Update every record in ``queryset`` with ``values`` (as with
+    ``queryset.update(**values)``), recording the previous values of the
+    updated fields as ``hist_model`` rows, in one transaction.
+
+    The history rows are written with a single INSERT ... SELECT and the
+    change is applied with a single UPDATE, so this avoids loading and saving
+    each instance (and its pre_save history signal). As with the signals, only
+    records where at least one value changes get a history row; the row holds
+    the previous values of all the updated fields.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        The records to update.
+    hist_model : Model
+        The history model (e.g. HouseholdHist) for the queryset's model.
+    user_field : str, optional
+        The field of the queryset's model that holds the user ID. Defaults to
+        'id' for the user model and 'user_id' otherwise.
+    **values
+        The new field values. These may be expressions (e.g. Now()), in which
+        case every record counts as changed.
+
+    Returns
+    -------
+    tuple
+        The number of records updated and the number of history rows written.
+
+    """
+
+    model = queryset.model
+    if user_field is None:
+        user_field = 'id' if model._meta.label == settings.AUTH_USER_MODEL else 'user_id'
+
+    # Only record history for the records where a value changes. Excluding
+    # the new value also handles NULLs
+    changed = Q()
+    for name, value in values.items():
+        if hasattr(value, 'resolve_expression'):
+            changed = Q(pk__isnull=False)
+            break
+        if value is None:
+            changed |= Q(**{f"{name}__isnull": False})
+        else:
+            changed |= ~Q(**{name: value})
+
+    fields = [model._meta.get_field(name) for name in values]
+    db = router.db_for_write(model)
+    connection = connections[db]
+
+    history_queryset = queryset.filter(changed).order_by().annotate(
+        _history_user=F(user_field),
+        _history_created=Value(timezone.now(), output_field=models.DateTimeField()),
+        _history_values=JSONObject(**{
+            (f"{field.name}_id" if field.is_relation else field.name): _history_expression(field)
+            for field in fields
+        }),
+    ).values_list(
+        '_history_user',
+        '_history_created',
+        '_history_values',
+    )
+
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(using=db):
+        # Lock the records so they can't change between the statements
+        history_queryset = history_queryset.select_for_update(of=('self',))
+        select_sql, params = history_queryset.query.get_compiler(
+            using=db,
+        ).as_sql()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {table} ({user}, {created}, {values}) {select}".format(
+                    table=quote_name(hist_model._meta.db_table),
+                    user=quote_name(hist_model._meta.get_field('user').column),
+                    created=quote_name(hist_model._meta.get_field('created').column),
+                    values=quote_name(hist_model._meta.get_field('historical_values').column),
+                    select=select_sql,
+                ),
+                params,
+            )
+            history_count = cursor.rowcount
+
+        updated_count = queryset.update(**values)
+
+    return updated_count, history_count
+
+
+def iter_history(hist_model, user_id, after=None, batch_size=history_batch_size):
+    """
+    Yield the (id, created, historical_values) of a user's ``hist_model`` rows
+    in the order they were written, optionally only those created after
+    ``after``.
+
+    Rows are read in batches using keyset pagination on (created, id), so
+    each query is a range scan of the (user, created) index regardless of
+    how far through the history it is.
+
+    """
+
+    queryset = hist_model.objects.filter(user_id=user_id).order_by('created', 'id')
+    if after is not None:
+        queryset = queryset.filter(created__gt=after)
+
+    last_created = last_id = None
+    while True:
+        batch_queryset = queryset
+        if last_id is not None:
+            batch_queryset = queryset.filter(
+                Q(created__gt=last_created) |
+                Q(created=last_created, id__gt=last_id)
+            )
+
+        rows = list(batch_queryset.values_list(
+            'id',
+            'created',
+            'historical_values',
+        )[:batch_size])
+        yield from rows
+
+        if len(rows) < batch_size:
+            return
+        last_id, last_created = rows[-1][0], rows[-1][1]
+
+
+def _from_history_value(field, value):
+    # Convert a historical (JSON-ready) value back to the field's Python type
+    if value is None:
+        return None
+
+    try:
+        value = field.to_python(value)
+    except ValidationError:
+        # Keep values that no longer fit the field as they were stored
+        return value
+
+    if isinstance(value, datetime.datetime) and timezone.is_naive(value):
+        # Historical datetimes are stored in UTC without a timezone
+        value = timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def get_state_as_of(model, user_id, as_of):
+    """
+    Reconstruct a user's ``model`` record (User, Address, Household or
+    HouseholdMembers) as it was at ``as_of``.
+
+    Each history row holds the previous values of the fields changed at its
+    ``created`` time, so the value of each field at ``as_of`` is the one in
+    the first row written after ``as_of`` that contains it (or the current
+    value, if none does). The rows are read with iter_history(), stopping
+    once every field has been found.
+
+    Returns
+    -------
+    Model or None
+        An unsaved instance with the reconstructed values (don't save it), or
+        None if the record didn't exist at ``as_of``.
+
+    """
+
+    if model not in reconstructable_models:
+        raise ValueError(f"History for {model.__name__} can't be reconstructed")
+    hist_model, created_field = reconstructable_models[model]
+
+    if model is User:
+        instance = model._default_manager.filter(pk=user_id).first()
+    else:
+        instance = model._default_manager.filter(user_id=user_id).first()
+    if instance is None or getattr(instance, created_field) > as_of:
+        return None
+
+    # Map the historical value keys to their fields
+    fields = {
+        key: model._meta.get_field(attname)
+        for attname, key, _ in get_history_serializer(model).fields
+    }
+    pending = set(fields)
+
+    for _, _, historical_values in iter_history(hist_model, user_id, after=as_of):
+        for key, value in (historical_values or {}).items():
+            if key in pending:
+                field = fields[key]
+                setattr(instance, field.attname, _from_history_value(field, value))
+                pending.discard(key)
+
+        if not pending:
+            break
+
+    # Make sure this can't be mistaken for the stored state
+    instance._state.adding = True
+    instance.__dict__.pop('_loaded_values', None)
+    return instance
+
+
+def get_history_page(user_id, cursor=None, page_size=history_page_size):
+    """
+    Return one page of a user's history across every history model, newest
+    first, for the admin history viewer.
+
+    Pages use keyset pagination on (created, model label, id), so each page is
+    a bounded read of each history model's (user, created) index rather than
+    an OFFSET scan.
+
+    Parameters
+    ----------
+    user_id : int
+        The user to show the history of.
+    cursor : tuple, optional
+        The (created, label, id) of the last row of the previous page.
+    page_size : int, optional
+        The number of rows per page.
+
+    Returns
+    -------
+    tuple
+        The list of rows (dicts of 'id', 'created', 'historical_values' and
+        'label') and the cursor for the next page (None if this is the last).
+
+    """
+
+    querysets = []
+    for label, hist_model in history_models.items():
+        queryset = hist_model.objects.filter(user_id=user_id)
+
+        if cursor is not None:
+            # Rows sort by created (descending), then label, then id
+            # (descending); keep those after the cursor
+            created, cursor_label, cursor_id = cursor
+            if label > cursor_label:
+                queryset = queryset.filter(created__lte=created)
+            elif label == cursor_label:
+                queryset = queryset.filter(
+                    Q(created__lt=created) | Q(created=created, id__lt=cursor_id)
+                )
+            else:
+                queryset = queryset.filter(created__lt=created)
+
+        querysets.append(
+            queryset.order_by().values(
+                'id',
+                'created',
+                'historical_values',
+            ).annotate(
+                label=Value(label, output_field=models.CharField()),
+            )
+        )
+
+    rows = list(querysets[0].union(*querysets[1:], all=True).order_by(
+        '-created',
+        'label',
+        '-id',
+    )[:page_size + 1])
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = (rows[-1]['created'], rows[-1]['label'], rows[-1]['id'])
+
+    return rows, next_cursor
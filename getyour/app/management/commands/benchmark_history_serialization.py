@@ -0,0 +1,140 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import copy
+import json
+import timeit
+import datetime
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.fields.files import FieldFile
+from phonenumber_field.phonenumber import PhoneNumber
+
+from app.history import get_history_serializer
+from app.models import User, Household
+
+
+def legacy_changed_modelfields_to_dict(previous_instance, current_instance):
+    """
+    The previous implementation of changed_modelfields_to_dict() (followed by
+    the JSON round trip done by the signals), kept for comparison.
+
+    """
+
+    model_dict = {}
+    for field in current_instance._meta.fields:
+        field_name = field.attname
+        if getattr(current_instance, field_name) != getattr(previous_instance, field_name):
+            try:
+                value = getattr(previous_instance, field_name)
+                if field.is_relation:
+                    if value is not None:
+                        model_dict[f"{field.name}_id"] = value
+                elif isinstance(value, FieldFile):
+                    model_dict[field.name] = str(value)
+                else:
+                    if isinstance(value, datetime.datetime):
+                        value = value.strftime('%Y-%m-%d %H:%M:%S')
+                    elif isinstance(value, PhoneNumber):
+                        value = value.as_e164
+                    model_dict[field.name] = value
+
+            except AttributeError:
+                pass
+
+    return json.loads(json.dumps(model_dict, cls=DjangoJSONEncoder))
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark the history serialization done on each tracked save, "
+        "comparing the precompiled serializer with the previous getattr/JSON "
+        "round trip path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=20000,
+            help="Number of calls per case.",
+        )
+
+    def handle(self, *args, **options):
+        number = options['number']
+
+        # Unsaved instances, so no database is needed
+        now = datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+        previous_user = User(
+            id=1,
+            email='someone@example.com',
+            first_name='First',
+            last_name='Last',
+            phone_number='+19705551234',
+            last_completed_at=now,
+            last_action_notification_at=now,
+            last_renewal_action={
+                'get_ready': {'status': 'completed', 'data': {}},
+                'account': {'status': 'completed', 'data': {}},
+            },
+        )
+        current_user = copy.deepcopy(previous_user)
+        current_user.first_name = 'Changed'
+        current_user.phone_number = PhoneNumber.from_string('+19705559999')
+        current_user.last_completed_at = now + datetime.timedelta(days=1)
+        current_user.last_renewal_action = {}
+
+        previous_household = Household(
+            user_id=1,
+            duration_at_address='More than 3 Years',
+            number_persons_in_household=2,
+            income_as_fraction_of_ami=Decimal('0.30'),
+            rent_own='Rent',
+        )
+        current_household = copy.deepcopy(previous_household)
+        current_household.number_persons_in_household = 3
+        current_household.income_as_fraction_of_ami = Decimal('0.50')
+
+        for label, previous, current in (
+                ('User', previous_user, current_user),
+                ('Household', previous_household, current_household),
+        ):
+            serializer = get_history_serializer(previous.__class__)
+            legacy_output = legacy_changed_modelfields_to_dict(previous, current)
+            output = serializer.changed(previous, current)
+            if output != legacy_output:
+                self.stderr.write(
+                    f"{label}: outputs differ: {output} != {legacy_output}"
+                )
+
+            cases = [
+                ('previous path', lambda: legacy_changed_modelfields_to_dict(
+                    previous, current,
+                )),
+                ('precompiled serializer', lambda: serializer.changed(
+                    previous, current,
+                )),
+            ]
+            for name, func in cases:
+                # Take the best of a few runs to reduce noise
+                seconds = min(timeit.repeat(func, number=number, repeat=5))
+                self.stdout.write(
+                    f"{label}, {name}: {seconds / number * 1e6:.2f} us per call"
+                )
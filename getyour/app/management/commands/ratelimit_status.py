@@ -0,0 +1,39 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from django.core.management.base import BaseCommand
+
+from app.ratelimit import rate_limit_utilization
+
+
+class Command(BaseCommand):
+    help = "Show the current utilization of each outbound rate limiter."
+
+    def handle(self, *args, **options):
+        for limiter in rate_limit_utilization():
+            if limiter['available'] is None:
+                self.stdout.write(f"{limiter['name']}: unavailable")
+                continue
+
+            self.stdout.write(
+                "{name}: {utilization:.0%} used ({available:.1f}/{capacity:g} "
+                "tokens at {rate:g}/s); last minute {acquired_last_minute} "
+                "acquired, {denied_last_minute} denied; this minute "
+                "{acquired_this_minute} acquired, {denied_this_minute} "
+                "denied".format(**limiter)
+            )
@@ -0,0 +1,65 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from app.tasks import run_renewal_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the renewal selection and decision logic against the database "
+        "without sending anything, and report the counts, per-stage timings "
+        "and projected API calls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help="Output the report as JSON.",
+        )
+
+    def handle(self, *args, **options):
+        report = run_renewal_task(dry_run=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        counts = report['counts']
+        self.stdout.write(f"Selected users: {counts.get('selected', 0)}")
+        self.stdout.write(f"Due to renew: {counts.get('due', 0)}")
+        self.stdout.write(f"  Not due: {counts.get('not_due', 0)}")
+        self.stdout.write(f"  Recently notified: {counts.get('recently_notified', 0)}")
+        self.stdout.write(f"  To send: {counts.get('to_send', 0)}")
+
+        self.stdout.write("Stage timings:")
+        for stage, seconds in report['stage_timings'].items():
+            self.stdout.write(f"  {stage}: {seconds:.3f}s")
+        self.stdout.write(f"  total: {report['total_second']:.3f}s")
+        self.stdout.write(f"Database queries: {report['db_queries']}")
+
+        self.stdout.write("Projected API calls:")
+        for api, calls in report['projected_api_calls'].items():
+            self.stdout.write(f"  {api}: {calls}")
+        self.stdout.write(
+            f"Projected minimum send time: {report['projected_send_second']:.1f}s"
+        )
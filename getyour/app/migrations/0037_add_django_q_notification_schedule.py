@@ -0,0 +1,43 @@
+# Generated by Django 4.1.8 on 2026-10-19 03:05
+
+from django.db import migrations
+
+from django_q.models import Schedule
+
+SCHEDULE_NAME = 'Deliver Pending Notifications'
+
+def apply_migration(apps, schema_editor):
+    # Add the every-minute 'Deliver Pending Notifications' schedule to
+    # Django-Q2. This picks up notification retries (and any notifications
+    # whose initial queuing was lost), so it repeats by default
+    Schedule.objects.create(
+        # Name the schedule
+        name=SCHEDULE_NAME,
+        # Run the function
+        func='app.tasks.deliver_pending_notifications',
+        # Run every minute
+        schedule_type=Schedule.MINUTES,
+        minutes=1,
+        # Repeat forever
+        repeats=-1,
+        # No cluster is specified, so this will run on any cluster
+    )
+
+
+def revert_migration(apps, schema_editor):
+    # Remove the schedule with the same name
+    Schedule.objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0036_notificationoutbox"),
+        (
+            "django_q",
+            "0017_task_cluster_alter",
+        ),
+    ]
+
+    operations = [
+        migrations.RunPython(apply_migration, revert_migration),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.8 on 2026-10-19 04:10
+
+from django.db import migrations
+
+from django_q.models import Schedule
+
+SCHEDULE_NAME = 'Resume Partitioned Tasks'
+
+def apply_migration(apps, schema_editor):
+    # Add the 'Resume Partitioned Tasks' schedule to Django-Q2. This requeues
+    # partitions of an unfinished renewal or cache run (e.g. after a node
+    # crash) and never starts a new run, so it repeats by default
+    Schedule.objects.create(
+        # Name the schedule
+        name=SCHEDULE_NAME,
+        # Run the function
+        func='app.tasks.resume_partitioned_tasks',
+        # Run every 10 minutes
+        schedule_type=Schedule.MINUTES,
+        minutes=10,
+        # Repeat forever
+        repeats=-1,
+        # No cluster is specified, so this will run on any cluster
+    )
+
+
+def revert_migration(apps, schema_editor):
+    # Remove the schedule with the same name
+    Schedule.objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0037_add_django_q_notification_schedule"),
+    ]
+
+    operations = [
+        migrations.RunPython(apply_migration, revert_migration),
+    ]
@@ -0,0 +1,15 @@
+# Generated by Django 4.1.8 on 2026-10-19 03:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # The 'Maintain Log Partitions' schedule is now added by
+    # logger.0020_add_django_q_log_partition_schedule, so that the logger app
+    # is self-contained. This migration is kept (as a no-op) because later
+    # migrations depend on it
+    dependencies = [
+        ("app", "0038_add_django_q_partition_resume_schedule"),
+    ]
+
+    operations = []
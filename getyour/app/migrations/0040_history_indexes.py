@@ -0,0 +1,69 @@
+# Generated by Django 4.1.8 on 2026-10-19 03:30
+
+from django.db import migrations, models
+
+HIST_TABLES = [
+    'app_userhist',
+    'app_addresshist',
+    'app_householdhist',
+    'app_householdmembershist',
+    'app_iqprogramhist',
+    'app_eligibilityprogramhist',
+]
+
+
+def add_gin_indexes(apps, schema_editor):
+    # GIN indexes (for containment and key lookups on the JSON diffs) are
+    # PostgreSQL-only; other backends (e.g. SQLite in local development) skip
+    # them
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for table in HIST_TABLES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_values_gin ON {table} "
+            "USING gin (historical_values)"
+        )
+
+
+def remove_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for table in HIST_TABLES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_values_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0039_add_django_q_log_partition_schedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='addresshist',
+            index=models.Index(fields=['user', 'created'], name='addresshist_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eligibilityprogramhist',
+            index=models.Index(fields=['user', 'created'], name='eligproghist_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='householdhist',
+            index=models.Index(fields=['user', 'created'], name='householdhist_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='householdmembershist',
+            index=models.Index(fields=['user', 'created'], name='hhmembershist_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='iqprogramhist',
+            index=models.Index(fields=['user', 'created'], name='iqprogramhist_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userhist',
+            index=models.Index(fields=['user', 'created'], name='userhist_user_created_idx'),
+        ),
+        migrations.RunPython(add_gin_indexes, remove_gin_indexes),
+    ]
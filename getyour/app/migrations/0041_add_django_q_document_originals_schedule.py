@@ -0,0 +1,43 @@
+# Generated by Django 4.1.8 on 2026-10-19 04:05
+
+import pendulum
+
+from django.db import migrations
+
+from django_q.models import Schedule
+
+SCHEDULE_NAME = 'Purge Document Originals'
+
+def apply_migration(apps, schema_editor):
+    # Add the daily 'Purge Document Originals' schedule to Django-Q2. This
+    # deletes the originals of normalized documents past
+    # DOCUMENT_ORIGINAL_RETENTION_DAY, so it repeats by default
+    Schedule.objects.create(
+        # Name the schedule
+        name=SCHEDULE_NAME,
+        # Run the function
+        func='app.tasks.purge_document_originals',
+        # Create a 'daily' schedule
+        schedule_type=Schedule.DAILY,
+        # Repeat forever
+        repeats=-1,
+        # Set the next run to be 3 AM in America/Denver timezone, starting
+        # tomorrow (from whenever this is applied)
+        next_run=pendulum.tomorrow(tz='America/Denver').add(hours=3),
+        # No cluster is specified, so this will run on any cluster
+    )
+
+
+def revert_migration(apps, schema_editor):
+    # Remove the schedule with the same name
+    Schedule.objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0040_history_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(apply_migration, revert_migration),
+    ]
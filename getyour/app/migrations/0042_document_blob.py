@@ -0,0 +1,29 @@
+# Generated by Django 4.1.8 on 2026-10-19 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0041_add_django_q_document_originals_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('blob_name', models.CharField(max_length=1024, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=1)),
+            ],
+            options={
+                'verbose_name': 'document blob',
+                'verbose_name_plural': 'document blobs',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.8 on 2026-10-19 03:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0042_document_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EligibilityProgramDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=1)),
+                ('blob_name', models.CharField(max_length=1024)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('content_type', models.CharField(max_length=100)),
+                ('sha256', models.CharField(blank=True, max_length=64, null=True)),
+                ('uploaded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('eligibility_program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='app.eligibilityprogram')),
+            ],
+            options={
+                'verbose_name': 'eligibility program document',
+                'verbose_name_plural': 'eligibility program documents',
+                'ordering': ['eligibility_program', 'position'],
+            },
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 4.1.8 on 2026-10-19 04:10
+
+import re
+import datetime
+
+from django.db import migrations
+
+# The supported extensions at the time of this migration (see
+# app.constants.supported_content_types)
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'pdf': 'application/pdf',
+}
+
+# Uploaded files are named 'user_<id>/YYYY-MM-DDTHHmmssZ...'
+TIMESTAMP_PATTERN = re.compile(r'/(\d{4}-\d{2}-\d{2}T\d{6})Z')
+
+BATCH_SIZE = 1000
+
+
+def parse_document_path(document_path):
+    # document_path is the stringified list of blob names, e.g.
+    # "['user_1/a.png', 'user_1/b.pdf']", parsed the same way the admin did
+    # (rather than evaluating it). Blank values ('' or '[]') have no documents
+    return [
+        x for x in document_path.replace(
+            "[", ''
+        ).replace(
+            "]", ''
+        ).replace(
+            "'", ''
+        ).split(
+            ', '
+        ) if x != ''
+    ]
+
+
+def apply_migration(apps, schema_editor):
+    # Create an EligibilityProgramDocument for each blob name in each
+    # EligibilityProgram.document_path
+    EligibilityProgram = apps.get_model('app', 'EligibilityProgram')
+    EligibilityProgramDocument = apps.get_model('app', 'EligibilityProgramDocument')
+    DocumentBlob = apps.get_model('app', 'DocumentBlob')
+
+    documents = []
+    for program in EligibilityProgram.objects.exclude(
+            document_path__isnull=True,
+        ).exclude(
+            document_path='',
+        ).iterator(chunk_size=BATCH_SIZE):
+        blob_names = parse_document_path(program.document_path.name)
+
+        # Use the dedup index for the hash and size, where it exists
+        blobs = {
+            x.blob_name: x for x in DocumentBlob.objects.filter(
+                blob_name__in=blob_names,
+            )
+        }
+        for idx, blob_name in enumerate(blob_names, start=1):
+            # The upload time is in the name; fall back to when the record
+            # was last modified
+            match = TIMESTAMP_PATTERN.search(blob_name)
+            if match:
+                uploaded_at = datetime.datetime.strptime(
+                    match.group(1),
+                    '%Y-%m-%dT%H%M%S',
+                ).replace(tzinfo=datetime.timezone.utc)
+            else:
+                uploaded_at = program.modified_at
+
+            blob = blobs.get(blob_name)
+            documents.append(
+                EligibilityProgramDocument(
+                    eligibility_program_id=program.id,
+                    position=idx,
+                    blob_name=blob_name,
+                    size=blob.size if blob else None,
+                    content_type=CONTENT_TYPES.get(
+                        blob_name.rsplit('.', 1)[-1].lower(),
+                        'application/octet-stream',
+                    ),
+                    sha256=blob.sha256 if blob else None,
+                    uploaded_at=uploaded_at,
+                )
+            )
+
+        if len(documents) >= BATCH_SIZE:
+            EligibilityProgramDocument.objects.bulk_create(documents)
+            documents = []
+
+    EligibilityProgramDocument.objects.bulk_create(documents)
+
+
+def revert_migration(apps, schema_editor):
+    # document_path is unchanged, so only the documents need to be removed
+    EligibilityProgramDocument = apps.get_model('app', 'EligibilityProgramDocument')
+    EligibilityProgramDocument.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0043_eligibility_program_document"),
+    ]
+
+    operations = [
+        migrations.RunPython(apply_migration, revert_migration),
+    ]
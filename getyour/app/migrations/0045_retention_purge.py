@@ -0,0 +1,26 @@
+# Generated by Django 4.1.8 on 2026-10-19 04:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0044_migrate_document_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eligibilityprogramdocument',
+            name='purged_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='eligibilityprogramdocument',
+            index=models.Index(condition=models.Q(('purged_at__isnull', True)), fields=['uploaded_at'], name='eligprogdoc_unpurged_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='householdmembers',
+            index=models.Index(fields=['modified_at'], name='hhmembers_modified_at_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.8 on 2026-10-19 04:20
+
+import pendulum
+
+from django.db import migrations
+
+from django_q.models import Schedule
+
+SCHEDULE_NAME = 'Purge Expired Documents'
+
+def apply_migration(apps, schema_editor):
+    # Add the daily 'Purge Expired Documents' schedule to Django-Q2. This
+    # deletes the documents past their policy in DOCUMENT_RETENTION_DAY (only
+    # logging them while DOCUMENT_RETENTION_DRY_RUN is set), so it repeats by
+    # default
+    Schedule.objects.create(
+        # Name the schedule
+        name=SCHEDULE_NAME,
+        # Run the function
+        func='app.tasks.purge_expired_documents',
+        # Create a 'daily' schedule
+        schedule_type=Schedule.DAILY,
+        # Repeat forever
+        repeats=-1,
+        # Set the next run to be 4 AM in America/Denver timezone (after the
+        # originals are purged), starting tomorrow (from whenever this is
+        # applied)
+        next_run=pendulum.tomorrow(tz='America/Denver').add(hours=4),
+        # No cluster is specified, so this will run on any cluster
+    )
+
+
+def revert_migration(apps, schema_editor):
+    # Remove the schedule with the same name
+    Schedule.objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0045_retention_purge"),
+    ]
+
+    operations = [
+        migrations.RunPython(apply_migration, revert_migration),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.8 on 2026-10-19 04:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0046_purge_expired_documents_schedule'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eligibilityprogramdocument',
+            name='eligibility_program',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='documents', to='app.eligibilityprogram'),
+        ),
+        migrations.AddIndex(
+            model_name='documentblob',
+            index=models.Index(fields=['modified_at'], name='documentblob_modified_at_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.1.8 on 2026-10-19 04:39
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def recount_references(apps, schema_editor):
+    # Replaced IDs weren't released before, so recount the references to each
+    # document from the records that hold them: each EligibilityProgramDocument
+    # that hasn't been purged and each household member's ID
+    DocumentBlob = apps.get_model('app', 'DocumentBlob')
+    EligibilityProgramDocument = apps.get_model('app', 'EligibilityProgramDocument')
+    HouseholdMembers = apps.get_model('app', 'HouseholdMembers')
+
+    ref_counts = Counter(
+        EligibilityProgramDocument.objects.filter(
+            purged_at__isnull=True,
+        ).values_list('blob_name', flat=True).iterator()
+    )
+    for household_info in HouseholdMembers.objects.filter(
+            household_info__isnull=False,
+        ).values_list('household_info', flat=True).iterator():
+        ref_counts.update(
+            x['identification_path']
+            for x in household_info.get('persons_in_household', [])
+            if x.get('identification_path') is not None
+        )
+
+    for document in DocumentBlob.objects.iterator():
+        ref_count = ref_counts.get(document.blob_name, 0)
+        if document.ref_count != ref_count:
+            # Documents that are now unreferenced are kept for the full
+            # 'unreferenced_document' retention period from now
+            DocumentBlob.objects.filter(id=document.id).update(
+                ref_count=ref_count,
+                modified_at=timezone.now() if ref_count == 0 else document.modified_at,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0047_detach_eligibility_documents'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='documentblob',
+            name='documentblob_modified_at_idx',
+        ),
+        migrations.AddIndex(
+            model_name='documentblob',
+            index=models.Index(condition=models.Q(('ref_count', 0)), fields=['modified_at'], name='documentblob_unreferenced_idx'),
+        ),
+        migrations.RunPython(recount_references, migrations.RunPython.noop),
+    ]
@@ -16,9 +16,11 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import copy
 import hashlib
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.fields.files import FieldFile
 from phonenumber_field.modelfields import PhoneNumberField
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
@@ -26,8 +28,14 @@ from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Value
 from django.db.models.functions import Concat
+from django.utils import timezone
 
-from app.constants import rent_own_choices, duration_at_address_choices
+from app.constants import (
+    rent_own_choices,
+    duration_at_address_choices,
+    notification_channel_choices,
+    notification_status_choices,
+)
 
 
 def userfiles_path(instance, filename):
@@ -93,6 +101,74 @@ class CaseInsensitiveFieldMixin:
         return super().get_lookup(converted)
 
 
+class HistorySnapshotMixin:
+    """
+    Model mixin that snapshots the field values of each instance as they were
+    loaded from (or last saved to) the database, so the history signals can
+    compare against them in memory instead of re-fetching the record.
+
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+
+        # Skip the snapshot if any fields were deferred, since it would be
+        # incomplete
+        if len(values) == len(cls._meta.concrete_fields):
+            instance._loaded_values = dict(zip(field_names, copy.deepcopy(values)))
+
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._take_snapshot(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._take_snapshot(fields)
+
+    def _take_snapshot(self, field_names=None):
+        if field_names is None:
+            fields = self._meta.concrete_fields
+            self._loaded_values = {}
+        elif hasattr(self, '_loaded_values'):
+            fields = [self._meta.get_field(x) for x in field_names]
+        else:
+            # Only some fields were saved or loaded, so there's nothing to
+            # snapshot against
+            return
+
+        for field in fields:
+            value = getattr(self, field.attname)
+            if isinstance(value, FieldFile):
+                # Store only the file name (a FieldFile references this
+                # instance)
+                value = value.name
+            else:
+                value = copy.deepcopy(value)
+            self._loaded_values[field.attname] = value
+
+    def get_previous_instance(self):
+        """
+        Return an instance with the field values as they were last loaded from
+        (or saved to) the database, for comparison with this one. If this
+        instance has no snapshot, the record is fetched instead, which raises
+        DoesNotExist if it hasn't been saved.
+
+        """
+
+        snapshot = getattr(self, '_loaded_values', None)
+        if snapshot is None:
+            return self.__class__._default_manager.get(pk=self.pk)
+
+        return self.__class__.from_db(
+            self._state.db,
+            list(snapshot.keys()),
+            list(snapshot.values()),
+        )
+
+
 # Class to automatically save date data was entered into postgre
 class TimeStampedModel(models.Model):
     """
@@ -138,7 +214,7 @@ class CIEmailField(CaseInsensitiveFieldMixin, models.EmailField):
     pass
 
 
-class User(AbstractUser):
+class User(HistorySnapshotMixin, AbstractUser):
     username = None
     email = CIEmailField(_('email address'), unique=True)
     first_name = models.CharField(max_length=200)
@@ -219,6 +295,16 @@ class UserHist(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     historical_values = models.JSONField(null=True, blank=True)
 
+    class Meta:
+        # Support reading a user's history in order (see app.history). A GIN
+        # index on historical_values is added on PostgreSQL by migration
+        indexes = [
+            models.Index(
+                fields=['user', 'created'],
+                name='userhist_user_created_idx',
+            ),
+        ]
+
 
 class AddressRD(GenericTimeStampedModel):
     address1 = models.CharField(
@@ -298,7 +384,7 @@ class AddressRD(GenericTimeStampedModel):
 
 
 # Addresses model attached to user (will delete as user account is deleted too)
-class Address(GenericTimeStampedModel):
+class Address(HistorySnapshotMixin, GenericTimeStampedModel):
     # Default relation is the User primary key
     user = models.OneToOneField(
         User,
@@ -356,9 +442,17 @@ class AddressHist(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     historical_values = models.JSONField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'created'],
+                name='addresshist_user_created_idx',
+            ),
+        ]
+
 
 # Eligibility model class attached to user (will delete as user account is deleted too)
-class Household(GenericTimeStampedModel):
+class Household(HistorySnapshotMixin, GenericTimeStampedModel):
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -438,8 +532,16 @@ class HouseholdHist(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     historical_values = models.JSONField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'created'],
+                name='householdhist_user_created_idx',
+            ),
+        ]
+
 
-class HouseholdMembers(GenericTimeStampedModel):
+class HouseholdMembers(HistorySnapshotMixin, GenericTimeStampedModel):
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -454,6 +556,13 @@ class HouseholdMembers(GenericTimeStampedModel):
     class Meta:
         verbose_name = 'household member'
         verbose_name_plural = 'household members'
+        indexes = [
+            # For finding expired identification (see app.retention)
+            models.Index(
+                fields=['modified_at'],
+                name='hhmembers_modified_at_idx',
+            ),
+        ]
 
     # Define non-database attributes
     @property
@@ -488,6 +597,14 @@ class HouseholdMembersHist(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     historical_values = models.JSONField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'created'],
+                name='hhmembershist_user_created_idx',
+            ),
+        ]
+
 
 class IQProgramRD(GenericTimeStampedModel):
     # ``id`` is the implicity primary key
@@ -635,7 +752,7 @@ class IQProgramRD(GenericTimeStampedModel):
         return str(self.friendly_name)
 
 
-class IQProgram(IQProgramTimeStampedModel):
+class IQProgram(HistorySnapshotMixin, IQProgramTimeStampedModel):
     """ Model class to store each user's program enrollment status.
 
     Note that the record for a program is created when a user applies (at which
@@ -696,6 +813,14 @@ class IQProgramHist(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     historical_values = models.JSONField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'created'],
+                name='iqprogramhist_user_created_idx',
+            ),
+        ]
+
 
 class EligibilityProgramRD(GenericTimeStampedModel):
     """
@@ -760,7 +885,7 @@ class EligibilityProgramRD(GenericTimeStampedModel):
         return str(self.friendly_name)
 
 
-class EligibilityProgram(GenericTimeStampedModel):
+class EligibilityProgram(HistorySnapshotMixin, GenericTimeStampedModel):
     """
     Model class to store the eligibility programs.
     """
@@ -806,6 +931,82 @@ class EligibilityProgram(GenericTimeStampedModel):
         # Setter for renewal_mode
         self._renewal_mode = val
 
+    def set_documents(self, documents):
+        """
+        Save the uploaded documents of this program, replacing any existing
+        ones.
+
+        Each document is a dictionary of 'blob_name', 'size', 'content_type'
+        and 'sha256'. document_path is also set to the stringified list of
+        blob names, as before EligibilityProgramDocument, since the history
+        tables still record it.
+
+        The existing documents are detached from the program rather than
+        deleted, so they're still purged by their retention policy (see
+        app.retention). Each keeps its reference to the stored document (see
+        DocumentBlob) until then, and the purge releases it.
+
+        """
+
+        with transaction.atomic():
+            self.document_path = str([x['blob_name'] for x in documents])
+            self.save()
+
+            self.documents.update(eligibility_program=None)
+            EligibilityProgramDocument.objects.bulk_create([
+                EligibilityProgramDocument(
+                    eligibility_program=self,
+                    position=idx,
+                    **itm,
+                ) for idx, itm in enumerate(documents, start=1)
+            ])
+
+
+class EligibilityProgramDocument(models.Model):
+    """
+    A document uploaded for a user's eligibility program, in the order they
+    were uploaded (``position``).
+
+    Documents outlive their program (e.g. when it's replaced at renewal), with
+    ``eligibility_program`` set to NULL, until they're purged by the retention
+    policy (see app.retention).
+
+    """
+    eligibility_program = models.ForeignKey(
+        EligibilityProgram,
+        related_name='documents',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    position = models.PositiveSmallIntegerField(default=1)
+    blob_name = models.CharField(max_length=1024)
+    # Size and hash are of the document as uploaded. These are null for
+    # documents uploaded before this model existed
+    size = models.BigIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100)
+    sha256 = models.CharField(max_length=64, null=True, blank=True)
+    uploaded_at = models.DateTimeField(default=timezone.now)
+    # Set when the document is deleted by the retention purge (see
+    # app.retention); the row is kept as a tombstone
+    purged_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['eligibility_program', 'position']
+        verbose_name = "eligibility program document"
+        verbose_name_plural = "eligibility program documents"
+        indexes = [
+            # For finding expired documents (see app.retention)
+            models.Index(
+                fields=['uploaded_at'],
+                condition=models.Q(purged_at__isnull=True),
+                name='eligprogdoc_unpurged_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.blob_name)
+
 
 class EligibilityProgramHist(models.Model):
     id = models.AutoField(primary_key=True)
@@ -818,6 +1019,50 @@ class EligibilityProgramHist(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     historical_values = models.JSONField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'created'],
+                name='eligproghist_user_created_idx',
+            ),
+        ]
+
+
+class DocumentBlob(GenericTimeStampedModel):
+    """
+    Index of the uploaded documents in storage by the SHA-256 of their
+    content, so identical uploads are stored once (see app.uploads).
+
+    ``ref_count`` is the number of references to the blob from the users'
+    records: each EligibilityProgramDocument that hasn't been purged and each
+    household member's ID. The blob is only deleted once none remain; a blob
+    that's no longer referenced because it was replaced (e.g. an ID) is kept
+    with a ``ref_count`` of 0 until the 'unreferenced_document' retention
+    policy deletes it (see app.retention). Note that the hash is of the
+    content as uploaded, which normalization (see app.normalization) can
+    replace in place.
+
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    blob_name = models.CharField(max_length=1024, unique=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "document blob"
+        verbose_name_plural = "document blobs"
+        indexes = [
+            # For finding unreferenced documents (see app.retention)
+            models.Index(
+                fields=['modified_at'],
+                condition=models.Q(ref_count=0),
+                name='documentblob_unreferenced_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.blob_name)
+
 
 def user_directory_path(instance, filename):
     # file will be uploaded to MEDIA_ROOT/user_<id>/<filename>
@@ -862,3 +1107,60 @@ class Admin(models.Model):
 
     class Meta:
         verbose_name = verbose_name_plural = 'administration'
+
+
+class NotificationOutbox(GenericTimeStampedModel):
+    """
+    Transactional outbox for user notifications.
+
+    A record is written in the same transaction as the change that triggers the
+    notification, then delivered by a Django-Q worker (see
+    ``app.tasks.deliver_notification()``) so that slow or unavailable
+    providers never hold up the request.
+
+    """
+    # ``id`` is the implicit primary key
+    user = models.ForeignKey(
+        User,
+        related_name='notifications',
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+    )
+
+    channel = models.CharField(
+        max_length=10,
+        choices=notification_channel_choices,
+    )
+    # The kind of notification, which determines the message that's sent (see
+    # backend.notification_senders)
+    kind = models.CharField(max_length=50)
+    recipient = models.CharField(max_length=254)
+    payload = models.JSONField(null=True, blank=True)
+
+    # Key to ensure a single triggering event creates a single notification
+    idempotency_key = models.CharField(max_length=200, unique=True)
+
+    status = models.CharField(
+        max_length=10,
+        choices=notification_status_choices,
+        default='pending',
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'notification'
+        verbose_name_plural = 'notifications'
+        indexes = [
+            # Used by the sweeper to find notifications ready for delivery
+            models.Index(
+                fields=['status', 'next_attempt_at'],
+                name='app_notif_status_next_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.recipient} ({self.status})"
@@ -0,0 +1,234 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import io
+import logging
+from pathlib import PurePosixPath
+
+import pendulum
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django_q.tasks import async_task
+
+from app.constants import supported_content_types
+from logger.wrappers import LoggerWrapper
+
+# Pillow is required for normalization; without it, images are kept as they
+# were uploaded
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+
+# Initialize logger
+log = LoggerWrapper(logging.getLogger(__name__))
+
+# Originals are kept under this prefix, then '<YYYY-MM-DD>/<blob name>', so
+# each day's originals can be purged together (see purge_originals())
+originals_prefix = 'originals'
+
+
+def get_original_name(blob_name, date):
+    return f"{originals_prefix}/{date.to_date_string()}/{blob_name}"
+
+
+def queue_normalization(blob_names):
+    """
+    Queue the normalization of the uploaded documents ``blob_names`` in
+    Django-Q, followed by the creation of their previews. Only pass documents
+    that were newly stored, since a document whose content was already
+    stored (see app.uploads) is already normalized and can be referenced by
+    other records.
+
+    """
+
+    if not blob_names:
+        return
+
+    try:
+        async_task('app.tasks.normalize_documents', list(blob_names))
+    except Exception:
+        log.exception(
+            "Document normalization couldn't be queued",
+            function='queue_normalization',
+        )
+
+
+def normalize_image(file, content_type):
+    """
+    Normalize the image in ``file``: rotate it upright (per its EXIF
+    orientation), drop its metadata (e.g. the location it was taken),
+    downscale it to DOCUMENT_NORMALIZATION_MAX_DIMENSION_PX and re-encode it
+    in the same format.
+
+    Returns
+    -------
+    bytes or None
+        The normalized image, or None if the document isn't an image or
+        normalizing it wouldn't change anything worthwhile (i.e. it has no
+        metadata, isn't downscaled and wouldn't be any smaller).
+
+    """
+
+    if Image is None or content_type not in ('image/jpeg', 'image/png'):
+        return None
+
+    original_size = file.seek(0, io.SEEK_END)
+    file.seek(0)
+
+    max_dimension = settings.DOCUMENT_NORMALIZATION_MAX_DIMENSION_PX
+    image = Image.open(file)
+    has_metadata = bool(image.getexif()) or 'xmp' in image.info
+    is_downscaled = max(image.size) > max_dimension
+
+    if content_type == 'image/jpeg':
+        # Decode at a reduced scale, rather than decoding the full resolution
+        # just to downscale it
+        image.draft('RGB', (max_dimension, max_dimension))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_dimension, max_dimension))
+
+    # Only the colour profile is kept from the original
+    buffer = io.BytesIO()
+    if content_type == 'image/jpeg':
+        if image.mode not in ('RGB', 'L', 'CMYK'):
+            image = image.convert('RGB')
+        image.save(
+            buffer,
+            'JPEG',
+            quality=settings.DOCUMENT_NORMALIZATION_JPEG_QUALITY,
+            optimize=True,
+            icc_profile=image.info.get('icc_profile'),
+        )
+    else:
+        image.save(
+            buffer,
+            'PNG',
+            optimize=True,
+            icc_profile=image.info.get('icc_profile'),
+        )
+
+    normalized = buffer.getvalue()
+    if not (has_metadata or is_downscaled or len(normalized) < original_size):
+        return None
+    return normalized
+
+
+def normalize_document(blob_name, storage=default_storage):
+    """
+    Replace the document ``blob_name`` with its normalized version (see
+    normalize_image()), under the same name, after copying the original to
+    'originals/<today>/<blob_name>'.
+
+    Returns
+    -------
+    bool
+        Whether the document was replaced.
+
+    """
+
+    content_type = supported_content_types.get(
+        PurePosixPath(blob_name).suffix[1:].lower()
+    )
+    if not settings.DOCUMENT_NORMALIZATION or content_type is None:
+        return False
+
+    with storage.open(blob_name) as file:
+        original = io.BytesIO(file.read())
+
+    normalized = normalize_image(original, content_type)
+    if normalized is None:
+        return False
+
+    original_name = storage.save(
+        get_original_name(blob_name, pendulum.today('utc')),
+        ContentFile(original.getvalue()),
+    )
+
+    # The storage doesn't overwrite files, so the document is deleted first
+    # to save its replacement under the same name (which the database refers
+    # to). If this fails, the original is restored from its copy
+    storage.delete(blob_name)
+    try:
+        saved_name = storage.save(blob_name, ContentFile(normalized))
+    except Exception:
+        storage.save(blob_name, ContentFile(original.getvalue()))
+        raise
+    if saved_name != blob_name:
+        raise RuntimeError(f"'{blob_name}' was saved as '{saved_name}'")
+
+    log.info(
+        "Document '%s' normalized from %s to %s bytes (original kept as '%s')",
+        blob_name,
+        len(original.getvalue()),
+        len(normalized),
+        original_name,
+        function='normalize_document',
+    )
+    return True
+
+
+def _delete_tree(storage, path):
+    directories, files = storage.listdir(path)
+    for name in files:
+        storage.delete(f"{path}/{name}")
+    for name in directories:
+        _delete_tree(storage, f"{path}/{name}")
+
+
+def purge_originals(storage=default_storage, today=None):
+    """
+    Delete the originals of normalized documents once they're older than
+    DOCUMENT_ORIGINAL_RETENTION_DAY days.
+
+    Returns
+    -------
+    list of str
+        The dates (directories) that were purged.
+
+    """
+
+    today = today or pendulum.today('utc')
+    cutoff = today.subtract(
+        days=settings.DOCUMENT_ORIGINAL_RETENTION_DAY
+    ).to_date_string()
+
+    # Directories are only virtual on Azure, so the prefix is listed rather
+    # than checked with exists()
+    try:
+        directories, _ = storage.listdir(originals_prefix)
+    except FileNotFoundError:
+        return []
+
+    purged = []
+    for date in sorted(directories):
+        # The dates are ISO strings, so they compare in date order
+        if date >= cutoff:
+            continue
+        _delete_tree(storage, f"{originals_prefix}/{date}")
+        purged.append(date)
+
+    if purged:
+        log.info(
+            "Originals of normalized documents purged for %s",
+            ', '.join(purged),
+            function='purge_originals',
+        )
+    return purged
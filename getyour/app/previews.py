@@ -0,0 +1,232 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import io
+import logging
+from pathlib import PurePosixPath
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django_q.tasks import async_task
+
+from app.constants import (
+    supported_content_types,
+    preview_max_dimension_px,
+    preview_jpeg_quality,
+    preview_retry_second,
+)
+from logger.wrappers import LoggerWrapper
+
+# Pillow is required for previews, and pypdfium2 for previews of PDFs. Without
+# them, documents are shown without previews
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+
+# Initialize logger
+log = LoggerWrapper(logging.getLogger(__name__))
+
+# The preview of a document is stored next to it, with this added to its name
+preview_suffix = '.preview.jpg'
+
+
+def get_preview_name(blob_name):
+    return f"{blob_name}{preview_suffix}"
+
+
+def _get_cache_key(blob_name):
+    # The cached value is the preview's blob name, or '' if the document
+    # couldn't be previewed
+    return f"blob_preview_{blob_name}"
+
+
+def delete_preview(blob_name, storage=default_storage):
+    """
+    Delete the preview of the document ``blob_name`` from ``storage``, and its
+    name from the cache (where it doesn't expire), e.g. once the document is
+    deleted.
+
+    """
+
+    storage.delete(get_preview_name(blob_name))
+    cache.delete(_get_cache_key(blob_name))
+
+
+def get_previews(blob_names):
+    """
+    Return the previews that exist for ``blob_names``, as a dict of document
+    blob name to preview blob name, from the cache.
+
+    Documents that aren't in the cache (e.g. uploaded before previews existed)
+    are queued for a preview, so they have one the next time they're shown.
+
+    """
+
+    if Image is None or not blob_names:
+        return {}
+
+    # The previews are optional, so show the originals if the cache is down
+    try:
+        cached = cache.get_many([_get_cache_key(x) for x in blob_names])
+    except Exception:
+        log.exception(
+            "Document previews couldn't be read from the cache",
+            function='get_previews',
+        )
+        return {}
+
+    previews = {}
+    missing = []
+    for blob_name in blob_names:
+        preview_name = cached.get(_get_cache_key(blob_name))
+        if preview_name is None:
+            missing.append(blob_name)
+        elif preview_name:
+            previews[blob_name] = preview_name
+
+    if missing:
+        queue_previews(missing)
+
+    return previews
+
+
+def queue_previews(blob_names):
+    """ Queue the creation of the previews of ``blob_names`` in Django-Q. """
+
+    if Image is None:
+        return
+
+    # Queue each document only once at a time (e.g. if the admin page is
+    # reloaded before its preview is ready). If this fails, the previews are
+    # queued again the next time the documents are shown
+    try:
+        blob_names = [
+            x for x in blob_names if cache.add(
+                f"{_get_cache_key(x)}_queued",
+                True,
+                timeout=600,
+            )
+        ]
+        if blob_names:
+            async_task('app.tasks.create_document_previews', blob_names)
+    except Exception:
+        log.exception(
+            "Document previews couldn't be queued",
+            function='queue_previews',
+        )
+
+
+def render_preview(file, content_type):
+    """
+    Render a downscaled JPEG of the image (or the first page of the PDF) in
+    ``file``.
+
+    Returns
+    -------
+    bytes or None
+        The JPEG, or None if this type of document can't be previewed.
+
+    """
+
+    if Image is None:
+        return None
+
+    max_size = (preview_max_dimension_px, preview_max_dimension_px)
+    if content_type == 'application/pdf':
+        if pypdfium2 is None:
+            return None
+
+        pdf = pypdfium2.PdfDocument(file)
+        try:
+            page = pdf[0]
+            # Render straight to (about) the preview size
+            scale = preview_max_dimension_px / max(page.get_size())
+            image = page.render(scale=scale).to_pil()
+        finally:
+            pdf.close()
+
+    elif content_type.startswith('image/'):
+        image = Image.open(file)
+        # Decode JPEGs at a reduced scale, rather than decoding the full
+        # resolution just to downscale it
+        image.draft('RGB', max_size)
+        # Apply the camera orientation, since the preview has no EXIF data
+        image = ImageOps.exif_transpose(image)
+
+    else:
+        return None
+
+    image = image.convert('RGB')
+    image.thumbnail(max_size)
+
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=preview_jpeg_quality, optimize=True)
+    return buffer.getvalue()
+
+
+def create_preview(blob_name, storage=default_storage):
+    """
+    Create and cache the preview of the document ``blob_name``, unless it
+    already exists.
+
+    Returns
+    -------
+    str or None
+        The preview's blob name, or None if the document can't be previewed.
+
+    """
+
+    cache_key = _get_cache_key(blob_name)
+    preview_name = get_preview_name(blob_name)
+
+    if not storage.exists(preview_name):
+        content_type = supported_content_types.get(
+            PurePosixPath(blob_name).suffix[1:].lower()
+        )
+
+        preview = None
+        if content_type is not None:
+            try:
+                with storage.open(blob_name) as file:
+                    preview = render_preview(file, content_type)
+            except Exception:
+                log.exception(
+                    f"Preview of '{blob_name}' couldn't be created",
+                    function='create_preview',
+                )
+
+        if preview is None:
+            # Try again later (e.g. once pypdfium2 is installed)
+            cache.set(cache_key, '', timeout=preview_retry_second)
+            return None
+
+        preview_name = storage.save(preview_name, ContentFile(preview))
+        log.debug(
+            f"Preview '{preview_name}' created ({len(preview)} bytes)",
+            function='create_preview',
+        )
+
+    cache.set(cache_key, preview_name, timeout=None)
+    return preview_name
@@ -0,0 +1,313 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+import logging
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from logger.wrappers import LoggerWrapper
+
+
+# Initialize logger
+log = LoggerWrapper(logging.getLogger(__name__))
+
+
+# Refill and take from the bucket atomically, using the Redis server clock so
+# that every process sharing the bucket agrees on the time. 'reserve' tokens are
+# held back from bulk callers so they can't starve interactive ones; it's capped
+# so a bulk caller can always eventually acquire (i.e. a bucket whose capacity
+# is a single request has no reserve). Acquired and denied calls are counted per
+# minute for utilization reporting. Numbers are returned as strings because Lua
+# numbers are truncated to integers on return
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local reserve = math.min(tonumber(ARGV[4]), math.max(capacity - requested, 0))
+
+local server_time = redis.call('TIME')
+local now = tonumber(server_time[1]) + tonumber(server_time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens - reserve >= requested then
+    tokens = tokens - requested
+    allowed = 1
+else
+    wait = (requested + reserve - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+
+local stats_key = KEYS[1] .. ':stats:' .. math.floor(now / 60)
+redis.call('HINCRBY', stats_key, allowed == 1 and 'acquired' or 'denied', 1)
+redis.call('EXPIRE', stats_key, 180)
+
+return {allowed, tostring(wait)}
+"""
+
+# Read the current (refilled) token count without taking any tokens
+TOKEN_COUNT_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+
+local server_time = redis.call('TIME')
+local now = tonumber(server_time[1]) + tonumber(server_time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+    return {tostring(capacity), tostring(math.floor(now / 60))}
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+return {tostring(tokens), tostring(math.floor(now / 60))}
+"""
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when an outbound call isn't allowed by its rate limiter (or by the
+    provider itself, e.g. an HTTP 429) and should be retried later.
+
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Rate limit '{name}' exceeded; retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    A token bucket shared by every process that uses the same Redis server.
+
+    Parameters
+    ----------
+    name : str
+        Name of the bucket; used as part of the Redis key.
+    rate : float
+        Tokens added to the bucket per second.
+    capacity : float, optional
+        Maximum number of tokens the bucket can hold (the allowed burst).
+        Defaults to ``rate``, with a minimum of 1.
+    bulk_reserve : float, optional
+        Fraction of ``capacity`` that is only available to interactive
+        callers. Bulk callers still get the full rate once the bucket is above
+        the reserve, but can't drain it below. The reserve never exceeds what
+        would leave room for the request itself, so it has no effect on a
+        bucket that only holds one call (``capacity`` of 1).
+
+    """
+
+    def __init__(self, name, rate, capacity=None, bulk_reserve=0):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(self.rate, 1))
+        self.bulk_reserve = float(bulk_reserve)
+        self.key = f"ratelimit:{name}"
+        self._scripts = {}
+
+    def _get_script(self, script):
+        if script not in self._scripts:
+            self._scripts[script] = get_redis_connection(
+                'default'
+            ).register_script(script)
+        return self._scripts[script]
+
+    def try_acquire(self, tokens=1, bulk=False):
+        """
+        Attempt to take ``tokens`` from the bucket without waiting.
+
+        Parameters
+        ----------
+        tokens : int, optional
+            The number of tokens to take.
+        bulk : bool, optional
+            Whether this is a bulk (non-interactive) call, which can't use the
+            reserved tokens.
+
+        Returns
+        -------
+        tuple
+            ``(acquired, retry_after)``, where ``retry_after`` is the number of
+            seconds until enough tokens will be available.
+
+        """
+
+        reserve = self.capacity * self.bulk_reserve if bulk else 0
+        try:
+            allowed, retry_after = self._get_script(TOKEN_BUCKET_SCRIPT)(
+                keys=[self.key],
+                args=[self.rate, self.capacity, tokens, reserve],
+            )
+        except Exception as e:
+            # Fail open: being unable to reach Redis shouldn't stop outbound
+            # calls altogether, since each provider enforces its own limit
+            log.warning(
+                f"Rate limiter '{self.name}' unavailable; allowing call: {e}",
+                function='TokenBucket.try_acquire',
+            )
+            return True, 0.0
+
+        return bool(int(allowed)), float(retry_after)
+
+    def acquire(self, tokens=1, timeout=None, bulk=False):
+        """
+        Take ``tokens`` from the bucket, waiting up to ``timeout`` seconds for
+        them to become available (indefinitely if ``timeout`` is None).
+
+        Returns
+        -------
+        tuple
+            ``(acquired, retry_after)``, as in ``try_acquire()``.
+
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            acquired, retry_after = self.try_acquire(tokens, bulk=bulk)
+            if acquired:
+                return acquired, retry_after
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if retry_after > remaining:
+                    return acquired, retry_after
+            time.sleep(retry_after)
+
+    def utilization(self):
+        """
+        Return the current state of the bucket.
+
+        Returns
+        -------
+        dict
+            The configured ``rate`` and ``capacity``, the ``available`` tokens,
+            ``utilization`` as the fraction of capacity in use, and the
+            ``acquired``/``denied`` call counts for the current and previous
+            minute. Values are None if Redis is unavailable.
+
+        """
+
+        output = {
+            'name': self.name,
+            'rate': self.rate,
+            'capacity': self.capacity,
+            'available': None,
+            'utilization': None,
+            'acquired_this_minute': None,
+            'denied_this_minute': None,
+            'acquired_last_minute': None,
+            'denied_last_minute': None,
+        }
+
+        try:
+            available, minute = self._get_script(TOKEN_COUNT_SCRIPT)(
+                keys=[self.key],
+                args=[self.rate, self.capacity],
+            )
+            connection = get_redis_connection('default')
+            this_minute = connection.hgetall(f"{self.key}:stats:{int(minute)}")
+            last_minute = connection.hgetall(f"{self.key}:stats:{int(minute) - 1}")
+        except Exception as e:
+            log.warning(
+                f"Rate limiter '{self.name}' unavailable: {e}",
+                function='TokenBucket.utilization',
+            )
+            return output
+
+        available = float(available)
+        output.update({
+            'available': available,
+            'utilization': 1 - available / self.capacity,
+            'acquired_this_minute': int(this_minute.get(b'acquired', 0)),
+            'denied_this_minute': int(this_minute.get(b'denied', 0)),
+            'acquired_last_minute': int(last_minute.get(b'acquired', 0)),
+            'denied_last_minute': int(last_minute.get(b'denied', 0)),
+        })
+        return output
+
+
+# Cache of limiters, so each process only loads its scripts once
+_rate_limiters = {}
+
+
+def get_rate_limiter(name):
+    """
+    Return the named rate limiter, as configured in
+    ``settings.OUTBOUND_RATE_LIMITS``.
+
+    """
+
+    if name not in _rate_limiters:
+        _rate_limiters[name] = TokenBucket(
+            name,
+            **settings.OUTBOUND_RATE_LIMITS[name],
+        )
+    return _rate_limiters[name]
+
+
+def throttle(name, timeout=None, bulk=False):
+    """
+    Wait for the named rate limiter before an outbound call.
+
+    Parameters
+    ----------
+    name : str
+        The name of the limiter (a key of ``settings.OUTBOUND_RATE_LIMITS``).
+    timeout : float, optional
+        The maximum number of seconds to wait. Defaults to waiting as long as
+        needed; use 0 to not wait at all.
+    bulk : bool, optional
+        Whether this is a bulk (non-interactive) call.
+
+    Raises
+    ------
+    RateLimitExceeded
+        If the call isn't allowed within ``timeout``.
+
+    """
+
+    acquired, retry_after = get_rate_limiter(name).acquire(
+        timeout=timeout,
+        bulk=bulk,
+    )
+    if not acquired:
+        raise RateLimitExceeded(name, retry_after)
+
+
+def rate_limit_utilization():
+    """Return ``TokenBucket.utilization()`` for every configured limiter."""
+
+    return [
+        get_rate_limiter(name).utilization()
+        for name in settings.OUTBOUND_RATE_LIMITS
+    ]
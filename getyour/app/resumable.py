@@ -0,0 +1,472 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+import uuid
+import base64
+import hashlib
+import logging
+import tempfile
+
+import pendulum
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django_redis import get_redis_connection
+from storages.backends.azure_storage import AzureStorage
+
+from app.backend import file_validation
+from app.constants import (
+    supported_content_types,
+    resumable_upload_max_chunk_bytes,
+    resumable_upload_max_bytes,
+    resumable_upload_expiry_second,
+)
+from app.models import userfiles_path
+from app.uploads import (
+    submission_file_name,
+    get_sha256,
+    claim_document,
+    register_document,
+    claim_references,
+)
+from logger.wrappers import LoggerWrapper
+
+
+# Initialize logger
+log = LoggerWrapper(logging.getLogger(__name__))
+
+# The types of file that can be uploaded, with the name each is stored as (or
+# None to keep the name it was uploaded with)
+upload_purposes = {
+    'document': None,
+    'identification': 'household_member_id',
+}
+
+# Advance the offset only if the chunk starts at the current offset, so a
+# chunk that's resent (e.g. after its response was lost) isn't counted twice,
+# and record the chunk's block ID. Returns the new offset, the current offset
+# if the chunk was out of place, or -1 if the upload doesn't exist
+APPEND_CHUNK_SCRIPT = """
+local offset = redis.call('HGET', KEYS[1], 'offset')
+if not offset then
+    return -1
+end
+offset = tonumber(offset)
+if offset ~= tonumber(ARGV[1]) then
+    return offset
+end
+offset = offset + tonumber(ARGV[2])
+redis.call('HSET', KEYS[1], 'offset', offset)
+redis.call('RPUSH', KEYS[2], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return offset
+"""
+
+# Name the blob only if it hasn't been named yet (by a concurrent request for
+# the first chunk), and return the name to use. Returns false if the upload
+# doesn't exist
+SET_BLOB_NAME_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+redis.call('HSETNX', KEYS[1], 'blob_name', ARGV[1])
+redis.call('HSETNX', KEYS[1], 'content_type', ARGV[2])
+return redis.call('HGET', KEYS[1], 'blob_name')
+"""
+
+
+class UploadError(Exception):
+    """
+    Raised when a resumable upload can't continue, with the HTTP status to
+    respond with.
+
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadOffsetMismatch(UploadError):
+    """
+    Raised when a chunk doesn't start at the upload's current offset, which
+    the client should resume from instead.
+
+    """
+
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}", status=409)
+        self.offset = offset
+
+
+def _get_key(upload_id):
+    return f"resumable_upload:{upload_id}"
+
+
+def _get_blocks_key(upload_id):
+    return f"resumable_upload:{upload_id}:blocks"
+
+
+def _get_temp_path(upload_id):
+    # Without block blob storage, chunks are assembled in a local file
+    directory = os.path.join(
+        settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(),
+        'resumable_uploads',
+    )
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, upload_id)
+
+
+def _get_block_id(offset):
+    # Block IDs must be base64 and the same length for every block of a blob,
+    # so use the zero-padded offset of the chunk
+    return base64.b64encode(f"{offset:012d}".encode()).decode()
+
+
+def _discard(upload_id):
+    # Remove the upload's state and any partial file. Staged Azure blocks
+    # don't need to be removed; they're discarded if never committed
+    connection = get_redis_connection('default')
+    connection.delete(_get_key(upload_id), _get_blocks_key(upload_id))
+    if not isinstance(default_storage, AzureStorage):
+        try:
+            os.remove(_get_temp_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+
+def start_upload(user, file_name, size, number=1, purpose='document'):
+    """
+    Start a resumable upload of a file of ``size`` bytes.
+
+    Parameters
+    ----------
+    user : User
+        The user uploading the file.
+    file_name : str
+        The name of the file on the user's device.
+    size : int
+        The size of the file, in bytes.
+    number : int, optional
+        The 1-based position of the file in its submission, for its name.
+    purpose : str, optional
+        The type of file, from ``upload_purposes``.
+
+    Returns
+    -------
+    str
+        The ID of the upload.
+
+    """
+
+    if purpose not in upload_purposes:
+        raise UploadError(f"Unknown upload purpose '{purpose}'")
+    if size <= 0:
+        raise UploadError("File is empty")
+    if size > resumable_upload_max_bytes:
+        raise UploadError(
+            "File is too large. Files must be {} MB or less.".format(
+                resumable_upload_max_bytes // (1024 * 1024),
+            ),
+            status=413,
+        )
+
+    upload_id = uuid.uuid4().hex
+    connection = get_redis_connection('default')
+    connection.hset(_get_key(upload_id), mapping={
+        'user_id': user.id,
+        'file_name': os.path.basename(file_name),
+        'size': size,
+        'number': number,
+        'purpose': purpose,
+        # The file is named with the time its upload started
+        'started_at': pendulum.now('utc').isoformat(),
+        'offset': 0,
+        # 'blob_name' and 'content_type' are set by the first chunk
+        'is_complete': 0,
+    })
+    connection.expire(_get_key(upload_id), resumable_upload_expiry_second)
+
+    log.debug(
+        "Resumable upload %s started (%s bytes)",
+        upload_id,
+        size,
+        function='start_upload',
+        user_id=user.id,
+    )
+    return upload_id
+
+
+def get_upload(upload_id, user):
+    """
+    Return the state of the upload as a dictionary, if it exists and belongs
+    to ``user``.
+
+    """
+
+    upload = {
+        key.decode(): value.decode()
+        for key, value in get_redis_connection('default').hgetall(
+            _get_key(upload_id)
+        ).items()
+    }
+
+    # Uploads of other users are reported as missing, the same as uploads
+    # that have expired
+    if not upload or upload['user_id'] != str(user.id):
+        raise UploadError("Upload not found or expired", status=404)
+
+    for key in ('size', 'number', 'offset'):
+        upload[key] = int(upload[key])
+    for key in ('blob_name', 'content_type'):
+        upload.setdefault(key, '')
+    upload['is_complete'] = upload['is_complete'] == '1'
+    upload['is_new'] = upload.get('is_new') == '1'
+    return upload
+
+
+def append_chunk(upload_id, user, offset, data):
+    """
+    Write the chunk ``data`` at ``offset`` of the upload.
+
+    The first chunk is validated (with ``file_validation()``) before anything
+    is stored, and the blob name is chosen then.
+
+    Returns
+    -------
+    int
+        The offset to send the next chunk from.
+
+    """
+
+    upload = get_upload(upload_id, user)
+    if upload['is_complete']:
+        raise UploadError("Upload is already complete", status=409)
+    if offset != upload['offset']:
+        raise UploadOffsetMismatch(upload['offset'])
+    if not data or len(data) > resumable_upload_max_chunk_bytes:
+        raise UploadError(
+            f"Chunks must be 1 to {resumable_upload_max_chunk_bytes} bytes",
+        )
+    if offset + len(data) > upload['size']:
+        raise UploadError("Chunk is past the end of the file")
+
+    connection = get_redis_connection('default')
+    if offset == 0:
+        is_valid, result = file_validation(
+            data,
+            user.id,
+            calling_function='append_chunk',
+        )
+        if not is_valid:
+            _discard(upload_id)
+            raise UploadError(result, status=415)
+
+        # Name the file with its validated extension
+        file_name = upload['file_name']
+        if upload_purposes[upload['purpose']] is not None:
+            file_name = f"{upload_purposes[upload['purpose']]}.{result}"
+        blob_name = default_storage.get_available_name(
+            userfiles_path(
+                user,
+                submission_file_name(
+                    file_name,
+                    upload['number'],
+                    pendulum.parse(upload['started_at']),
+                ),
+            ),
+        )
+        # Only the first request to get here names the blob, so concurrent
+        # retries of the first chunk all stage it under the same blob as the
+        # chunks that follow
+        blob_name = connection.register_script(SET_BLOB_NAME_SCRIPT)(
+            keys=[_get_key(upload_id)],
+            args=[blob_name, supported_content_types[result]],
+        )
+        if blob_name is None:
+            raise UploadError("Upload not found or expired", status=404)
+        upload['blob_name'] = blob_name.decode()
+
+    block_id = _get_block_id(offset)
+    if isinstance(default_storage, AzureStorage):
+        default_storage.stage_block(upload['blob_name'], block_id, data)
+    else:
+        with open(_get_temp_path(upload_id), 'r+b' if offset else 'wb') as f:
+            f.seek(offset)
+            f.write(data)
+
+    new_offset = connection.register_script(APPEND_CHUNK_SCRIPT)(
+        keys=[_get_key(upload_id), _get_blocks_key(upload_id)],
+        args=[offset, len(data), block_id, resumable_upload_expiry_second],
+    )
+    if new_offset == -1:
+        raise UploadError("Upload not found or expired", status=404)
+    if new_offset != offset + len(data):
+        # Another request wrote this chunk first
+        raise UploadOffsetMismatch(new_offset)
+
+    return new_offset
+
+
+def complete_upload(upload_id, user):
+    """
+    Assemble the uploaded chunks into the file in storage. Completing an
+    upload that's already complete has no effect.
+
+    The upload's 'is_new' is set to whether the content was newly stored
+    (rather than already stored, see app.uploads.claim_document()). The
+    stored document isn't referenced until the upload is attached (see
+    attach_uploads()), so an upload that's never attached is deleted by the
+    'unreferenced_document' retention policy (see app.retention).
+
+    Returns
+    -------
+    str
+        The name of the file in storage.
+
+    """
+
+    upload = get_upload(upload_id, user)
+    if upload['is_complete']:
+        return upload['blob_name']
+    if upload['offset'] != upload['size']:
+        raise UploadError(
+            f"Upload is incomplete ({upload['offset']} of {upload['size']} bytes)",
+            status=409,
+        )
+
+    # Identical content that's already stored is used instead (see
+    # app.uploads.claim_document())
+    connection = get_redis_connection('default')
+    blob_name = upload['blob_name']
+    if isinstance(default_storage, AzureStorage):
+        default_storage.commit_blocks(
+            blob_name,
+            [x.decode() for x in connection.lrange(_get_blocks_key(upload_id), 0, -1)],
+            upload['content_type'],
+        )
+
+        # The blocks were staged by separate requests, so the blob is hashed
+        # once it's committed
+        file_hash = hashlib.sha256()
+        for chunk in default_storage.iter_blob(blob_name):
+            file_hash.update(chunk)
+        sha256 = file_hash.hexdigest()
+        existing_name = claim_document(sha256, references=0)
+        if existing_name is None:
+            existing_name = register_document(
+                sha256,
+                blob_name,
+                upload['size'],
+                references=0,
+            )
+        else:
+            default_storage.delete(blob_name)
+        is_new = existing_name == blob_name
+        blob_name = existing_name
+
+    else:
+        temp_path = _get_temp_path(upload_id)
+        with open(temp_path, 'rb') as f:
+            file = File(f)
+            sha256 = get_sha256(file)
+            existing_name = claim_document(sha256, references=0)
+            is_new = existing_name is None
+            if is_new:
+                saved_name = default_storage.save(blob_name, file)
+                blob_name = register_document(
+                    sha256,
+                    saved_name,
+                    upload['size'],
+                    references=0,
+                )
+                is_new = blob_name == saved_name
+            else:
+                blob_name = existing_name
+        os.remove(temp_path)
+
+    connection.hset(_get_key(upload_id), mapping={
+        'blob_name': blob_name,
+        'sha256': sha256,
+        'is_complete': 1,
+        'is_new': int(is_new),
+    })
+    connection.delete(_get_blocks_key(upload_id))
+
+    log.info(
+        "Resumable upload %s completed as %s (%s bytes)",
+        upload_id,
+        blob_name,
+        upload['size'],
+        function='complete_upload',
+        user_id=user.id,
+    )
+    return blob_name
+
+
+def get_completed_uploads(upload_ids, user, purpose):
+    """
+    Return the completed uploads, in order, if they can be attached to the
+    user's records, i.e. they're for the ``purpose`` they were started with
+    (see ``upload_purposes``).
+
+    Returns
+    -------
+    list of dict
+        The state of each upload (see get_upload()), including its
+        'blob_name', 'size', 'content_type', 'sha256' and 'is_new'.
+
+    """
+
+    uploads = [get_upload(upload_id, user) for upload_id in upload_ids]
+    if not all(x['is_complete'] for x in uploads):
+        raise UploadError("Upload is incomplete", status=409)
+    if any(x['purpose'] != purpose for x in uploads):
+        raise UploadError("Upload is not for this type of file")
+    return uploads
+
+
+def attach_uploads(upload_ids, user, purpose):
+    """
+    Attach the completed uploads (see get_completed_uploads()) by adding a
+    reference to each stored document. Each upload can only be attached once.
+
+    Call this in a transaction with the save of the records that reference
+    the documents, so the references are only kept if the records are.
+
+    Returns
+    -------
+    list of dict
+        The state of each upload, as get_completed_uploads().
+
+    """
+
+    uploads = get_completed_uploads(upload_ids, user, purpose)
+
+    # Removing the state is what attaches an upload, so an upload that's
+    # being attached by another request at the same time is reported missing
+    deleted_count = get_redis_connection('default').delete(
+        *[_get_key(upload_id) for upload_id in set(upload_ids)]
+    )
+    if deleted_count != len(set(upload_ids)):
+        raise UploadError("Upload not found or expired", status=404)
+
+    claim_references([x['blob_name'] for x in uploads])
+    return uploads
@@ -0,0 +1,333 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+import logging
+
+import pendulum
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+from django_q.tasks import async_task
+
+from app.constants import (
+    retention_batch_size,
+    retention_time_budget_second,
+    partition_state_expiry_second,
+)
+from app.coordination import RedisLease
+from app.models import (
+    DocumentBlob,
+    EligibilityProgramDocument,
+    HouseholdMembers,
+)
+from app.uploads import (
+    get_identification_names,
+    release_references,
+    delete_documents,
+)
+from logger.wrappers import LoggerWrapper
+
+
+# Initialize logger
+log = LoggerWrapper(logging.getLogger(__name__))
+
+
+class EligibilityDocumentPolicy:
+    """
+    Documents uploaded for eligibility programs, which expire by their upload
+    time. The EligibilityProgramDocument rows are kept as tombstones (with
+    ``purged_at`` set).
+
+    """
+
+    name = 'eligibility_document'
+
+    def get_batch(self, cutoff, last_id):
+        # Uses the partial index of documents that haven't been purged
+        return list(
+            EligibilityProgramDocument.objects.filter(
+                purged_at__isnull=True,
+                uploaded_at__lt=cutoff,
+                id__gt=last_id,
+            ).order_by('id')[:retention_batch_size]
+        )
+
+    def get_id(self, record):
+        return record.id
+
+    def get_blob_names(self, record):
+        return [record.blob_name]
+
+    def tombstone(self, records, cutoff, purged_at):
+        # Lock the rows and re-check them, in case they've changed since the
+        # batch was read
+        documents = list(
+            EligibilityProgramDocument.objects.select_for_update().filter(
+                id__in=[x.id for x in records],
+                purged_at__isnull=True,
+                uploaded_at__lt=cutoff,
+            )
+        )
+        EligibilityProgramDocument.objects.filter(
+            id__in=[x.id for x in documents],
+        ).update(purged_at=purged_at)
+
+        return [self.get_blob_names(x) for x in documents]
+
+
+class IdentificationPolicy:
+    """
+    Identification uploaded for household members. Since the IDs are stored
+    in ``HouseholdMembers.household_info``, they expire once the household
+    members haven't been modified for the retention period (which is never
+    sooner than the IDs were uploaded). Each ID's path is replaced by its
+    purge time (``identification_purged_at``).
+
+    """
+
+    name = 'identification'
+
+    def get_batch(self, cutoff, last_id):
+        return list(
+            HouseholdMembers.objects.filter(
+                household_info__isnull=False,
+                modified_at__lt=cutoff,
+                user_id__gt=last_id,
+            ).order_by('user_id')[:retention_batch_size]
+        )
+
+    def get_id(self, record):
+        return record.user_id
+
+    def get_blob_names(self, record):
+        return get_identification_names(record.household_info)
+
+    def tombstone(self, records, cutoff, purged_at):
+        purged_names = []
+        for household_members in HouseholdMembers.objects.select_for_update().filter(
+                user_id__in=[x.user_id for x in records if self.get_blob_names(x)],
+                modified_at__lt=cutoff,
+        ):
+            names = self.get_blob_names(household_members)
+            if not names:
+                continue
+
+            for person in household_members.household_info['persons_in_household']:
+                if person.get('identification_path') is not None:
+                    person['identification_path'] = None
+                    person['identification_purged_at'] = purged_at.isoformat()
+
+            # Use update() so modified_at (the user's last change) and the
+            # history are left alone
+            HouseholdMembers.objects.filter(
+                user_id=household_members.user_id,
+            ).update(household_info=household_members.household_info)
+            purged_names.append(names)
+
+        return purged_names
+
+
+class UnreferencedDocumentPolicy:
+    """
+    Indexed documents (DocumentBlob) that no record references any more, e.g.
+    IDs that were replaced when household members were re-submitted. These
+    expire once their last reference has been released for the retention
+    period (or since they were last re-used), and the DocumentBlob row is
+    deleted.
+
+    """
+
+    name = 'unreferenced_document'
+
+    def get_batch(self, cutoff, last_id):
+        # Uses the partial index of unreferenced documents
+        return list(
+            DocumentBlob.objects.filter(
+                ref_count=0,
+                modified_at__lt=cutoff,
+                id__gt=last_id,
+            ).order_by('id')[:retention_batch_size]
+        )
+
+    def get_id(self, record):
+        return record.id
+
+    def get_blob_names(self, record):
+        return [record.blob_name]
+
+    def tombstone(self, records, cutoff, purged_at):
+        # Lock the rows and re-check them; a document that was re-used since
+        # the batch was read is referenced again
+        documents = list(
+            DocumentBlob.objects.select_for_update().filter(
+                id__in=[x.id for x in records],
+                ref_count=0,
+                modified_at__lt=cutoff,
+            )
+        )
+
+        # With the rows deleted, release_references() returns the names for
+        # deletion from storage
+        DocumentBlob.objects.filter(id__in=[x.id for x in documents]).delete()
+        return [[x.blob_name] for x in documents]
+
+
+# The policies, in the order they're run (a new instance of each per task).
+# Each is enabled by its retention period in settings.DOCUMENT_RETENTION_DAY,
+# and provides:
+# - get_batch(cutoff, last_id): the next records (after the checkpoint) that
+#   may have expired documents
+# - get_id(record): the record's ID, for the checkpoint
+# - get_blob_names(record): the record's documents
+# - tombstone(records, cutoff, purged_at): remove the references to the
+#   expired documents, returning the document names of each record changed
+policies = [
+    EligibilityDocumentPolicy,
+    IdentificationPolicy,
+    UnreferencedDocumentPolicy,
+]
+
+
+def purge_expired_documents(dry_run=None):
+    """
+    Delete the uploaded documents that are past their retention policy (see
+    settings.DOCUMENT_RETENTION_DAY), in batches.
+
+    Each batch is tombstoned (and its document references released) in one
+    transaction, then the unreferenced documents are deleted from storage in
+    parallel. Progress is checkpointed in Redis after each batch, and the
+    purge requeues itself (to continue from the checkpoints) once its time
+    budget runs out. Only one purge runs at a time.
+
+    Parameters
+    ----------
+    dry_run : bool, optional
+        Only log what would be purged. Defaults to the
+        DOCUMENT_RETENTION_DRY_RUN setting.
+
+    Returns
+    -------
+    dict or None
+        The number of records and documents purged (or that would be) by
+        each policy in this task, or None if another purge is running.
+
+    """
+
+    if dry_run is None:
+        dry_run = settings.DOCUMENT_RETENTION_DRY_RUN
+    mode = 'dry_run' if dry_run else 'purge'
+
+    lease = RedisLease('retention_purge:lease')
+    if not lease.acquire():
+        log.info(
+            "Another retention purge is running; skipping",
+            function='purge_expired_documents',
+        )
+        return None
+
+    connection = get_redis_connection('default')
+    deadline = time.monotonic() + retention_time_budget_second
+    now = pendulum.now('utc')
+    totals = {}
+
+    try:
+        for policy in [x() for x in policies]:
+            retention_day = settings.DOCUMENT_RETENTION_DAY.get(policy.name)
+            if retention_day is None:
+                continue
+
+            cutoff = now.subtract(days=retention_day)
+            checkpoint_key = f"retention_purge:{policy.name}:{mode}"
+            last_id = int(connection.get(checkpoint_key) or 0)
+            totals[policy.name] = {'records': 0, 'documents': 0}
+
+            while True:
+                records = policy.get_batch(cutoff, last_id)
+                if len(records) == 0:
+                    connection.delete(checkpoint_key)
+                    break
+
+                if dry_run:
+                    purged_names = [
+                        names for names in map(policy.get_blob_names, records)
+                        if names
+                    ]
+                    blob_names = [x for names in purged_names for x in names]
+                    if blob_names:
+                        log.info(
+                            "Dry run: would purge %s %s",
+                            policy.name,
+                            ', '.join(blob_names),
+                            function='purge_expired_documents',
+                        )
+
+                else:
+                    with transaction.atomic():
+                        purged_names = policy.tombstone(records, cutoff, now)
+                        blob_names = [x for names in purged_names for x in names]
+                        unreferenced_names = release_references(blob_names)
+
+                    # Deleted only once the tombstones are committed, so a
+                    # document is never referenced after it's gone. A
+                    # failure leaves an orphaned document, which is logged
+                    delete_documents(
+                        unreferenced_names,
+                        calling_function='purge_expired_documents',
+                    )
+
+                totals[policy.name]['records'] += len(purged_names)
+                totals[policy.name]['documents'] += len(blob_names)
+
+                last_id = policy.get_id(records[-1])
+                connection.set(
+                    checkpoint_key,
+                    last_id,
+                    ex=partition_state_expiry_second,
+                )
+
+                if not lease.renew():
+                    log.warning(
+                        "Lost the retention purge lease; stopping",
+                        function='purge_expired_documents',
+                    )
+                    return totals
+
+                if time.monotonic() > deadline:
+                    # Continue in a new task, so this one doesn't hit the
+                    # Django-Q worker timeout
+                    lease.release()
+                    async_task('app.tasks.purge_expired_documents', dry_run=dry_run)
+                    log.info(
+                        "Retention purge continuing in a new task (%s): %s",
+                        mode,
+                        totals,
+                        function='purge_expired_documents',
+                    )
+                    return totals
+
+        log.info(
+            "Retention purge finished (%s): %s",
+            mode,
+            totals,
+            function='purge_expired_documents',
+        )
+        return totals
+
+    finally:
+        lease.release()
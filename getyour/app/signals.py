@@ -16,9 +16,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
-import json
 from django.db.models.signals import pre_save, pre_delete
-from django.core.serializers.json import DjangoJSONEncoder
 from django.dispatch import receiver
 from app.models import (
     Household,
@@ -51,17 +49,13 @@ def household_pre_save(sender, instance, **kwargs):
             # Save the previous values of the fields that have been updated in the
             # user's household data to the database in the householdhist table
             household_history = HouseholdHist(
-                user=instance.user,
-                # Convert the updated household objects to a dictionary and then to
-                # a JSON string and set it to the historical_values field
-                historical_values=json.loads(
-                    json.dumps(
-                        changed_modelfields_to_dict(
-                            sender.objects.get(pk=instance.pk),
-                            instance,
-                        ), cls=DjangoJSONEncoder
-                    )
-                )
+                user_id=instance.user_id,
+                # Convert the updated household objects to a JSON-ready
+                # dictionary and set it to the historical_values field
+                historical_values=changed_modelfields_to_dict(
+                    instance.get_previous_instance(),
+                    instance,
+                ),
             )
 
         except Household.DoesNotExist:
@@ -86,17 +80,13 @@ def householdmembers_pre_save(sender, instance, **kwargs):
             # user's householdmembers data to the database in the
             # householdmembershist table
             householdmembers_history = HouseholdMembersHist(
-                user=instance.user,
-                # Convert the updated household objects to a dictionary and then to
-                # a JSON string and set it to the historical_values field
-                historical_values=json.loads(
-                    json.dumps(
-                        changed_modelfields_to_dict(
-                            sender.objects.get(pk=instance.pk),
-                            instance,
-                        ), cls=DjangoJSONEncoder
-                    )
-                )
+                user_id=instance.user_id,
+                # Convert the updated household objects to a JSON-ready
+                # dictionary and set it to the historical_values field
+                historical_values=changed_modelfields_to_dict(
+                    instance.get_previous_instance(),
+                    instance,
+                ),
             )
 
         except HouseholdMembers.DoesNotExist:
@@ -122,16 +112,12 @@ def user_pre_save(sender, instance, **kwargs):
             # user's account data to the database in the userhist table
             user_history = UserHist(
                 user=instance,
-                # Convert the updated user objects to a dictionary and then to
-                # a JSON string and set it to the historical_values field
-                historical_values=json.loads(
-                    json.dumps(
-                        changed_modelfields_to_dict(
-                            sender.objects.get(pk=instance.pk),
-                            instance,
-                        ), cls=DjangoJSONEncoder
-                    )
-                )
+                # Convert the updated user objects to a JSON-ready
+                # dictionary and set it to the historical_values field
+                historical_values=changed_modelfields_to_dict(
+                    instance.get_previous_instance(),
+                    instance,
+                ),
             )
 
         except User.DoesNotExist:
@@ -157,17 +143,13 @@ def address_pre_save(sender, instance, **kwargs):
             # the AddressRD data don't change, only the Address data need to be
             # preserved
             address_history = AddressHist(
-                user=instance.user,
-                # Convert the updated address objects to a dictionary and then to
-                # a JSON string and set it to the historical_values field
-                historical_values=json.loads(
-                    json.dumps(
-                        changed_modelfields_to_dict(
-                            sender.objects.get(pk=instance.pk),
-                            instance,
-                        ), cls=DjangoJSONEncoder
-                    )
-                )
+                user_id=instance.user_id,
+                # Convert the updated address objects to a JSON-ready
+                # dictionary and set it to the historical_values field
+                historical_values=changed_modelfields_to_dict(
+                    instance.get_previous_instance(),
+                    instance,
+                ),
             )
 
         except Address.DoesNotExist:
@@ -197,18 +179,14 @@ def iqprogram_pre_delete(sender, instance, **kwargs):
             # user's iq program data to the database in the
             # iqprogramhist table
             iqprogram_history = IQProgramHist(
-                user=instance.user,
-                # Convert the iqprogram objects to a dictionary and then to
-                # a JSON string and set it to the historical_values field
-                historical_values=json.loads(
-                    json.dumps(
-                        changed_modelfields_to_dict(
-                            sender.objects.get(pk=instance.pk),
-                            instance,
-                            pre_delete=True
-                        ), cls=DjangoJSONEncoder
-                    )
-                )
+                user_id=instance.user_id,
+                # Convert the iqprogram objects to a JSON-ready
+                # dictionary and set it to the historical_values field
+                historical_values=changed_modelfields_to_dict(
+                    instance.get_previous_instance(),
+                    instance,
+                    pre_delete=True,
+                ),
             )
 
         except IQProgram.DoesNotExist:
@@ -236,16 +214,14 @@ def eligiblity_program_pre_delete(sender, instance, **kwargs):
             # user's eligibility program data to the database in the
             # eligibilityprogramhist table
             eligiblity_program_history = EligibilityProgramHist(
-                user=instance.user,
-                # Convert the eligibilityprogram objects to a dictionary and
-                # then to a JSON string and set it to the historical_values field
-                historical_values=json.loads(
-                    json.dumps(changed_modelfields_to_dict(
-                        sender.objects.get(pk=instance.pk),
-                        instance,
-                        pre_delete=True
-                    ), cls=DjangoJSONEncoder)
-                )
+                user_id=instance.user_id,
+                # Convert the eligibilityprogram objects to a JSON-ready
+                # dictionary and set it to the historical_values field
+                historical_values=changed_modelfields_to_dict(
+                    instance.get_previous_instance(),
+                    instance,
+                    pre_delete=True,
+                ),
             )
 
         except EligibilityProgram.DoesNotExist:
@@ -16,8 +16,11 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import time
+import datetime
 import logging
 import pendulum
+from contextlib import contextmanager
 
 from sendgrid.helpers.mail import Mail
 from sendgrid import SendGridAPIClient
@@ -29,38 +32,88 @@ from python_http_client.exceptions import (
 
 from django.conf import settings
 from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
 from django_q.tasks import async_task
 
-from app.backend import broadcast_renewal_email, check_if_user_needs_to_renew
-from app.models import User
-from app.constants import notification_buffer_month
+from app.backend import (
+    broadcast_renewal_email,
+    check_if_user_needs_to_renew,
+    notification_senders,
+    notification_sensitive_kinds,
+    notification_retry_delay,
+)
+from app.models import User, NotificationOutbox
+from app.ratelimit import throttle, RateLimitExceeded
+from app.coordination import PartitionedJob
+from app.previews import create_preview, queue_previews
+from app.normalization import normalize_document, purge_originals
+from app import retention
+from app.constants import (
+    notification_buffer_month,
+    notification_max_attempts,
+    notification_claim_second,
+)
 from logger.wrappers import LoggerWrapper
 
 
 def populate_cache_task():
-    async_task(populate_redis_cache)
+    """
+    Plan the (partitioned) population of the renewal notification cache. If a
+    population run is already in progress, it's resumed rather than restarted.
 
+    """
 
-def populate_redis_cache():
-    users = User.objects.all()
-    for user in users:
-        cache_key = f"user_last_notified_{user.id}"
+    PartitionedJob(
+        'populate_cache',
+        'app.tasks.populate_redis_cache',
+    ).plan()
 
-        # Check if user needs to renew their application. We don't want to
-        # cache users that don't need application renewals
-        needs_renewal = check_if_user_needs_to_renew(user.id)
 
-        if needs_renewal and user.last_action_notification_at:
-            cache.set(cache_key, str(user.last_action_notification_at), timeout=3600 * 24 * 30)
+def populate_redis_cache(run_id, partition):
+    """Populate the renewal notification cache for a partition of users."""
+
+    PartitionedJob(
+        'populate_cache',
+        'app.tasks.populate_redis_cache',
+    ).process_partition(
+        run_id,
+        partition,
+        User.objects.all(),
+        populate_user_cache,
+    )
+
+
+def populate_user_cache(user):
+    cache_key = f"user_last_notified_{user.id}"
+
+    # Check if user needs to renew their application. We don't want to
+    # cache users that don't need application renewals
+    needs_renewal = check_if_user_needs_to_renew(user.id)
+
+    if needs_renewal and user.last_action_notification_at:
+        cache.set(cache_key, str(user.last_action_notification_at), timeout=3600 * 24 * 30)
 
 
-def run_renewal_task():
+def run_renewal_task(dry_run=False):
     """
     Run the task to send an automated 'renewal required' email to each affected
     user.
+
+    The users are split into partitions that are processed by any node's
+    workers (see app.coordination). The run is identified by the date, so if
+    this is triggered more than once in a day (e.g. by more than one cluster),
+    only the partitions that haven't finished are re-run.
+
+    If ``dry_run``, the selection and decision logic is instead run for every
+    user in this process, with nothing sent or saved, and a report is returned
+    (see ``run_renewal_dry_run()``).
     
     """
 
+    if dry_run:
+        return run_renewal_dry_run()
+
     # Initialize logger
     log = LoggerWrapper(logging.getLogger(__name__))
 
@@ -69,30 +122,190 @@ def run_renewal_task():
         function='run_renewal_task',
     )
 
-    # For every user in the database that isn't archived or has a NULL
-    # last_completed_at, run the send_renewal_email task (asynchronously)
-    for user in User.objects.filter(
-        is_archived=False,
-        last_completed_at__isnull=False,
-    ):
+    PartitionedJob(
+        'renewal',
+        'app.tasks.run_renewal_partition',
+    ).plan(
+        run_id=pendulum.today(tz='America/Denver').format('YYYYMMDD'),
+    )
+
+
+def run_renewal_partition(run_id, partition):
+    """
+    Run the renewal task for a partition of users: every user in the database
+    that isn't archived and doesn't have a NULL last_completed_at.
+
+    """
+
+    PartitionedJob(
+        'renewal',
+        'app.tasks.run_renewal_partition',
+    ).process_partition(
+        run_id,
+        partition,
+        User.objects.filter(
+            is_archived=False,
+            last_completed_at__isnull=False,
+        ),
+        run_renewal_for_user,
+    )
+
+
+def run_renewal_for_user(user, dry_run=False, stage_timings=None):
+    """
+    Run the renewal decision (and send, unless ``dry_run``) for a user.
+
+    Returns
+    -------
+    str
+        The outcome: 'recently_notified', 'not_due', 'to_send' (dry run only),
+        'sent' or 'failed'.
+
+    """
+
+    with _time_stage(stage_timings, 'cache_lookup'):
         cache_key = f"user_last_notified_{user.id}"
         last_notified = cache.get(cache_key)
-        should_enqueue = (
+        should_send = (
             last_notified is None or 
             (pendulum.now() - pendulum.parse(last_notified)).in_months() > notification_buffer_month
         )
-        
-        if should_enqueue:
-            async_task(send_renewal_email, user)
+
+    # Send within the partition (rather than as a separate async task) so the
+    # partition checkpoint is only advanced once the user has been handled
+    if should_send:
+        return send_renewal_email(
+            user,
+            dry_run=dry_run,
+            stage_timings=stage_timings,
+        )
+
+    return 'recently_notified'
+
+
+def run_renewal_dry_run():
+    """
+    Run the full renewal selection and decision logic against the database,
+    without sending any emails or saving anything, and report what a real run
+    would do.
+
+    Returns
+    -------
+    dict
+        The ``counts`` of selected users, of users ``due`` to renew (whether
+        or not they were recently notified) and of each outcome, the
+        cumulative ``stage_timings`` (in seconds), the number of ``db_queries``, and the
+        ``projected_api_calls`` and ``projected_send_second`` (the minimum time
+        the sends would take at the SendGrid rate limit).
+
+    """
+
+    # Initialize logger
+    log = LoggerWrapper(logging.getLogger(__name__))
+
+    stage_timings = {}
+    counts = {}
+    query_count = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal query_count
+        query_count += 1
+        return execute(sql, params, many, context)
+
+    start_time = time.perf_counter()
+    with connection.execute_wrapper(count_queries):
+        with _time_stage(stage_timings, 'select'):
+            users = list(
+                User.objects.filter(
+                    is_archived=False,
+                    last_completed_at__isnull=False,
+                ).order_by('id')
+            )
+        counts['selected'] = len(users)
+        counts['due'] = 0
+
+        for user in users:
+            outcome = run_renewal_for_user(
+                user,
+                dry_run=True,
+                stage_timings=stage_timings,
+            )
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+            # Users to send to are due; recently notified users are skipped
+            # before the renewal check, so check whether they're due here
+            if outcome == 'to_send':
+                counts['due'] += 1
+            elif outcome == 'recently_notified':
+                with _time_stage(stage_timings, 'needs_renewal_check'):
+                    if check_if_user_needs_to_renew(user.id):
+                        counts['due'] += 1
+
+    to_send = counts.get('to_send', 0)
+    report = {
+        'counts': counts,
+        'stage_timings': stage_timings,
+        'total_second': time.perf_counter() - start_time,
+        'db_queries': query_count,
+        'projected_api_calls': {'sendgrid': to_send},
+        'projected_send_second': to_send / settings.OUTBOUND_RATE_LIMITS['sendgrid']['rate'],
+    }
+
+    log.info(
+        f"Renewal dry run: {report}",
+        function='run_renewal_dry_run',
+    )
+
+    return report
+
+
+@contextmanager
+def _time_stage(stage_timings, stage):
+    """Add the time spent in the block to ``stage_timings[stage]``, if given."""
+
+    if stage_timings is None:
+        yield
+        return
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_timings[stage] = stage_timings.get(stage, 0) + (
+            time.perf_counter() - start_time
+        )
+
+
+def resume_partitioned_tasks():
+    """
+    Resume any partitioned run that hasn't finished, e.g. because the node
+    processing one of its partitions crashed. This never starts a new run.
+
+    """
+
+    PartitionedJob(
+        'populate_cache',
+        'app.tasks.populate_redis_cache',
+    ).plan(resume_only=True)
+    PartitionedJob(
+        'renewal',
+        'app.tasks.run_renewal_partition',
+    ).plan(resume_only=True)
 
 
-def send_renewal_email(user):
+def send_renewal_email(user, dry_run=False, stage_timings=None):
     """
     Determine if the user
     a) needs to renew and
     b) hasn't been notified within the buffer period
     
-    and kick off the 'renewal required' email.
+    and kick off the 'renewal required' email (unless ``dry_run``).
+
+    Returns
+    -------
+    str
+        The outcome: 'not_due', 'recently_notified', 'to_send' (dry run only),
+        'sent' or 'failed'.
 
     """
 
@@ -101,7 +314,8 @@ def send_renewal_email(user):
     cache_key = f"user_last_notified_{user.id}"
 
     # Check if user needs to renew their application
-    needs_renewal = check_if_user_needs_to_renew(user.id)
+    with _time_stage(stage_timings, 'needs_renewal_check'):
+        needs_renewal = check_if_user_needs_to_renew(user.id)
 
     # If they need to renew and if they have been notified within the
     # notification buffer period, send them a renewal email.
@@ -113,11 +327,15 @@ def send_renewal_email(user):
         # `.months` specifies number of months within a year,
         # where `in_months()` (used here) specifies overall number of months
         # (e.g. period.months + period.years*12 = period.in_months())
-        last_notified = cache.get(cache_key)
-        should_notify = (
-            last_notified is None or 
-            (pendulum.now() - pendulum.parse(last_notified)).in_months() > notification_buffer_month
-        )
+        with _time_stage(stage_timings, 'cache_lookup'):
+            last_notified = cache.get(cache_key)
+            should_notify = (
+                last_notified is None or 
+                (pendulum.now() - pendulum.parse(last_notified)).in_months() > notification_buffer_month
+            )
+        if should_notify and dry_run:
+            return 'to_send'
+
         if should_notify:
             log.info(
                 "User needs renewal; sending notification",
@@ -125,8 +343,8 @@ def send_renewal_email(user):
                 user_id=user.id,
             )
             
-            # Note that SendGrid doesn't have rate limits for 'send' operations
-            # in the v3 API (used here), so this needs no rate consideration
+            # broadcast_renewal_email() waits for the (bulk) SendGrid rate
+            # limiter, so interactive emails aren't starved by renewals
             status_code = broadcast_renewal_email(user.email)
 
             # Now update the user's last_action_notification_at
@@ -142,12 +360,14 @@ def send_renewal_email(user):
                 user.last_action_notification_at = pendulum.now()
                 user.save()
                 cache.set(cache_key, str(pendulum.now()), timeout=3600 * 24 * 30 * notification_buffer_month)
+                return 'sent'
             else:
                 log.debug(
                     f"SendGrid call failed. SendGrid status_code: '{status_code}'",
                     function='send_renewal_email',
                     user_id=user.id,
                 )
+                return 'failed'
         else:
             log.debug(
                 "User needs renewal but has recently been notified",
@@ -157,6 +377,7 @@ def send_renewal_email(user):
 
             # TODO: Discuss archiving users that haven't renewed and have
             # exceeded the `notification_buffer_month` notification window
+            return 'recently_notified'
 
     else:
         log.debug(
@@ -164,6 +385,7 @@ def send_renewal_email(user):
             function='send_renewal_email',
             user_id=user.id,
         )
+        return 'not_due'
 
 
 def send_generic_email(template_str, *args):
@@ -232,6 +454,7 @@ def send_generic_email(template_str, *args):
 
             message.template_id = template_id
             try:
+                throttle('sendgrid', bulk=True)
                 sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
                 _ = sg.send(message)
 
@@ -255,3 +478,186 @@ def send_generic_email(template_str, *args):
             function='send_generic_email',
         )
         raise
+
+
+def deliver_notification(notification_id):
+    """
+    Deliver a single notification from the outbox.
+
+    The outbox record is first claimed (its next attempt is pushed back by
+    ``notification_claim_second``) in a short transaction, so a notification
+    that has been queued more than once (e.g. by both the request and the
+    sweeper) is only sent once, without holding a database transaction open
+    during the call to the provider. The result is then recorded, unless the
+    claim was lost in the meantime. A failed delivery is rescheduled with
+    exponential backoff until ``notification_max_attempts`` is reached.
+
+    """
+
+    # Initialize logger (needs to be done within the async task)
+    log = LoggerWrapper(logging.getLogger(__name__))
+
+    with transaction.atomic():
+        notification = NotificationOutbox.objects.select_for_update(
+            skip_locked=True,
+        ).filter(
+            id=notification_id,
+            status='pending',
+            next_attempt_at__lte=timezone.now(),
+        ).first()
+
+        # Exit if the notification has already been delivered, is being
+        # delivered by another worker, or isn't yet due
+        if notification is None:
+            return
+
+        # Claim the delivery. If this worker dies, the notification is picked
+        # up again by the sweeper once the claim expires
+        notification.attempts += 1
+        notification.next_attempt_at = timezone.now() + datetime.timedelta(
+            seconds=notification_claim_second
+        )
+        notification.save(update_fields=['attempts', 'next_attempt_at', 'modified_at'])
+
+    claimed_attempts = notification.attempts
+    result = {}
+    _, sender = notification_senders[notification.kind]
+    try:
+        sender(notification.recipient, notification.payload)
+
+    except RateLimitExceeded as e:
+        # Rate limited, so this doesn't count as an attempt. The sweeper
+        # will pick it back up once it's due
+        result['attempts'] = claimed_attempts - 1
+        result['next_attempt_at'] = timezone.now() + datetime.timedelta(
+            seconds=e.retry_after
+        )
+        log.debug(
+            f"Notification {notification.id} ({notification.kind}) deferred until {result['next_attempt_at']}",
+            function='deliver_notification',
+            user_id=notification.user_id,
+        )
+
+    except Exception as e:
+        result['last_error'] = repr(e)
+        if claimed_attempts >= notification_max_attempts:
+            result['status'] = 'failed'
+            log.error(
+                f"Notification {notification.id} ({notification.kind}) failed after {claimed_attempts} attempts",
+                function='deliver_notification',
+                user_id=notification.user_id,
+            )
+        else:
+            result['next_attempt_at'] = timezone.now() + notification_retry_delay(
+                claimed_attempts
+            )
+            log.warning(
+                f"Notification {notification.id} ({notification.kind}) failed; retrying at {result['next_attempt_at']}",
+                function='deliver_notification',
+                user_id=notification.user_id,
+            )
+
+    else:
+        result['status'] = 'sent'
+        result['sent_at'] = timezone.now()
+        result['last_error'] = ''
+        if notification.kind in notification_sensitive_kinds:
+            result['payload'] = None
+        log.debug(
+            f"Notification {notification.id} ({notification.kind}) sent",
+            function='deliver_notification',
+            user_id=notification.user_id,
+        )
+
+    # Record the result only if the claim is still this worker's (i.e. it
+    # didn't expire and get claimed by another worker)
+    updated_count = NotificationOutbox.objects.filter(
+        id=notification.id,
+        status='pending',
+        attempts=claimed_attempts,
+    ).update(
+        modified_at=timezone.now(),
+        **result,
+    )
+    if updated_count == 0:
+        log.warning(
+            f"Notification {notification.id} ({notification.kind}) was claimed by another worker before its result was recorded",
+            function='deliver_notification',
+            user_id=notification.user_id,
+        )
+
+
+def deliver_pending_notifications(batch_size=500):
+    """
+    Queue delivery of all outbox notifications that are due. This is run by a
+    Django-Q schedule and picks up retries as well as any notifications whose
+    initial queuing was lost.
+
+    """
+
+    notification_ids = NotificationOutbox.objects.filter(
+        status='pending',
+        next_attempt_at__lte=timezone.now(),
+    ).order_by(
+        'next_attempt_at'
+    ).values_list(
+        'id',
+        flat=True,
+    )[:batch_size]
+
+    for notification_id in notification_ids:
+        async_task(deliver_notification, notification_id)
+
+
+def create_document_previews(blob_names):
+    """
+    Create the preview of each uploaded document (see app.previews), for the
+    admin to show instead of the full-size original.
+
+    """
+
+    for blob_name in blob_names:
+        create_preview(blob_name)
+
+
+def normalize_documents(blob_names):
+    """
+    Normalize each uploaded document (see app.normalization), then queue its
+    preview, so the preview is made from the normalized version.
+
+    """
+
+    log = LoggerWrapper(logging.getLogger(__name__))
+
+    for blob_name in blob_names:
+        try:
+            normalize_document(blob_name)
+        except Exception:
+            # The document is kept as it was uploaded
+            log.exception(
+                f"Document '{blob_name}' couldn't be normalized",
+                function='normalize_documents',
+            )
+
+    queue_previews(blob_names)
+
+
+def purge_document_originals():
+    """
+    Delete the originals of normalized documents past their retention. This
+    is run by a daily Django-Q schedule.
+
+    """
+
+    purge_originals()
+
+
+def purge_expired_documents(dry_run=None):
+    """
+    Delete the uploaded documents past their retention policy (see
+    app.retention). This is run by a daily Django-Q schedule, and requeues
+    itself until the purge is finished.
+
+    """
+
+    retention.purge_expired_documents(dry_run=dry_run)
@@ -16,12 +16,27 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+from django_redis import get_redis_connection
+
 from app import models
 
 import random
 import pendulum
 
 
+def redis_available():
+    """
+    Return whether the Redis server (used by the cache, rate limiters, etc) is
+    reachable, so tests that need it can be skipped otherwise.
+
+    """
+
+    try:
+        return get_redis_connection('default').ping()
+    except Exception:
+        return False
+
+
 class CreateEligibilityPrograms:
 
     def __init__(self):
@@ -260,6 +275,14 @@ class TestUser:
                 )
             )
 
+            # Add a (nonexistent) document, so the program's files count as
+            # uploaded
+            models.EligibilityProgramDocument.objects.create(
+                eligibility_program=self.eligibility[-1],
+                blob_name=f"user_{self.user.id}/{prgname}.pdf",
+                content_type='application/pdf',
+            )
+
 
     def create_iq(self):
         """ Create IQ Program record(s). """
@@ -290,6 +313,10 @@ class TestView:
         Set parameters for views to be tested.
          
         The first 'views' test is to ensure all views are accounted for.
+
+        Views that are accessed directly respond with HTTP 200 unless
+        'expected_status' is specified (e.g. when the 'kwargs' are rejected
+        by the view itself).
         
         """
 
@@ -367,6 +394,15 @@ class TestView:
                 'login_required': True,
                 'direct_access_allowed': False,
             },
+            'start_upload': {
+                'login_required': True,
+                'direct_access_allowed': False,
+            },
+            'resumable_upload': {
+                'login_required': True,
+                'direct_access_allowed': False,
+                'kwargs': {'upload_id': '0' * 32},
+            },
             'broadcast': {
                 'login_required': True,
                 'direct_access_allowed': False,
@@ -416,6 +452,29 @@ class TestView:
                 'login_required': False,
                 'direct_access_allowed': False,
             },
+            'admin_view_blob': {
+                'login_required': True,
+                'direct_access_allowed': False,
+                'kwargs': {'blob_name': 'test_document.pdf'},
+            },
+            'admin_signed_blob': {
+                # The signed token is the authorization, so the view is
+                # reached but rejects this (unsigned) token
+                'login_required': False,
+                'direct_access_allowed': True,
+                'kwargs': {'token': 'test_token'},
+                'expected_status': 403,
+            },
+            'admin_add_elig_program': {
+                'login_required': True,
+                'direct_access_allowed': False,
+                'kwargs': {'user_id': 0},
+            },
+            'admin_replace_household_member_id': {
+                'login_required': True,
+                'direct_access_allowed': False,
+                'kwargs': {'user_id': 0},
+            },
         }
 
         self.process_values()
@@ -0,0 +1,375 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+import hashlib
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from django.utils.http import quote_etag
+
+from app import models
+from app.admin.views import parse_range_header, get_signed_blob_url
+
+
+class ParseRangeHeader(TestCase):
+    """
+    Test parsing the 'Range' header for view_blob().
+
+    """
+    databases = '__all__'
+
+    def test_ranges(self):
+        """
+        Tests the (first, last) byte positions of satisfiable ranges.
+
+        """
+
+        for header, expected in (
+                ('bytes=0-499', (0, 499)),
+                # The last position is capped at the end of the content
+                ('bytes=1500-4999', (1500, 1999)),
+                # Open-ended range
+                ('bytes=100-', (100, 1999)),
+                # Suffix ranges
+                ('bytes=-500', (1500, 1999)),
+                ('bytes=-5000', (0, 1999)),
+            ):
+            with self.subTest(header=header):
+                self.assertEqual(parse_range_header(header, 2000), expected)
+
+    def test_ignored_ranges(self):
+        """
+        Tests that malformed and multi-range headers are ignored, so the whole
+        content is sent.
+
+        """
+
+        for header in (
+                'bytes=0-1,5-6',
+                'bytes=-',
+                'bytes=500-100',
+                'items=0-499',
+                'bytes=a-b',
+            ):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range_header(header, 2000))
+
+    def test_unsatisfiable_ranges(self):
+        """
+        Tests that ranges outside of the content raise ValueError.
+
+        """
+
+        for header, size in (
+                ('bytes=2000-', 2000),
+                ('bytes=2500-3000', 2000),
+                ('bytes=-0', 2000),
+                ('bytes=-500', 0),
+            ):
+            with self.subTest(header=header, size=size):
+                with self.assertRaises(ValueError):
+                    parse_range_header(header, size)
+
+
+class BlobTestCase(TestCase):
+    """
+    Base class that stores a test document in local storage and logs in a
+    staff user to view it.
+
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        """ Set up the environment for testing. """
+
+        self.media_root = tempfile.mkdtemp()
+        storage_settings = override_settings(
+            DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+            MEDIA_ROOT=self.media_root,
+        )
+        storage_settings.enable()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.addCleanup(storage_settings.disable)
+
+        self.content = bytes(range(256)) * 8
+        self.blob_name = default_storage.save(
+            'test_document.pdf',
+            ContentFile(self.content),
+        )
+
+        self.user = models.User.objects.create_user(
+            email='test_staff@ae.ae',
+            first_name='Test',
+            last_name='Staff',
+            phone_number='+13035551234',
+            password='Something top secret',
+            is_staff=True,
+        )
+        self.client.force_login(self.user)
+
+    def view_blob(self, blob_name=None, **extra):
+        """ Request ``blob_name`` from view_blob() as the admin portal does. """
+
+        return self.client.get(
+            reverse(
+                'app:admin_view_blob',
+                kwargs={'blob_name': blob_name or self.blob_name},
+            ),
+            # view_blob() can't be accessed directly
+            HTTP_REFERER='/admin/',
+            **extra,
+        )
+
+
+@override_settings(BLOB_DELIVERY_MODE='proxy')
+class ViewBlobProxy(BlobTestCase):
+    """
+    Test streaming documents through view_blob(), including range and
+    conditional requests.
+
+    """
+
+    def test_full_content(self):
+        """
+        Tests that the whole document is sent with its content-hash ETag.
+
+        """
+
+        response = self.view_blob()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(
+            response['ETag'],
+            quote_etag(hashlib.sha256(self.content).hexdigest()),
+        )
+
+    def test_ranges(self):
+        """
+        Tests that only the requested range is sent.
+
+        """
+
+        size = len(self.content)
+        for header, first, last in (
+                ('bytes=0-99', 0, 99),
+                ('bytes=-500', size - 500, size - 1),
+                ('bytes=100-', 100, size - 1),
+            ):
+            with self.subTest(header=header):
+                response = self.view_blob(HTTP_RANGE=header)
+
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content),
+                    self.content[first:last + 1],
+                )
+                self.assertEqual(
+                    response['Content-Range'],
+                    f"bytes {first}-{last}/{size}",
+                )
+                self.assertEqual(
+                    response['Content-Length'],
+                    str(last - first + 1),
+                )
+
+    def test_unsatisfiable_range(self):
+        """
+        Tests that a range past the end of the document is rejected.
+
+        """
+
+        response = self.view_blob(HTTP_RANGE=f"bytes={len(self.content)}-")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(
+            response['Content-Range'],
+            f"bytes */{len(self.content)}",
+        )
+
+    def test_multi_range(self):
+        """
+        Tests that the whole document is sent for a multi-range request.
+
+        """
+
+        response = self.view_blob(HTTP_RANGE='bytes=0-1,5-6')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_if_range(self):
+        """
+        Tests that the range is sent only if If-Range matches the current
+        version of the document (otherwise the whole document is sent).
+
+        """
+
+        etag = self.view_blob()['ETag']
+
+        response = self.view_blob(HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[:100])
+
+        response = self.view_blob(
+            HTTP_RANGE='bytes=0-99',
+            HTTP_IF_RANGE=quote_etag('stale'),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_not_modified(self):
+        """
+        Tests that a cached copy is revalidated without sending the document
+        again.
+
+        """
+
+        etag = self.view_blob()['ETag']
+
+        response = self.view_blob(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        response = self.view_blob(HTTP_IF_NONE_MATCH=quote_etag('stale'))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(BLOB_DELIVERY_MODE='signed_url')
+class ViewBlobSignedUrl(BlobTestCase):
+    """
+    Test redirecting to signed URLs from view_blob(), and serving them with
+    signed_blob() when using local storage.
+
+    """
+
+    def test_redirect(self):
+        """
+        Tests that view_blob() redirects to a signed URL that serves the
+        document without logging in.
+
+        """
+
+        response = self.view_blob()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Cache-Control'], 'no-store')
+
+        self.client.logout()
+        response = self.client.get(response['Location'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_signed_url(self):
+        """
+        Tests that get_signed_blob_url() returns a signed_blob() URL for local
+        storage.
+
+        """
+
+        url = get_signed_blob_url(self.blob_name, 'application/pdf')
+
+        self.assertTrue(
+            url.startswith(
+                reverse('app:admin_signed_blob', kwargs={'token': 'x'})[:-1]
+            )
+        )
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_expired_token(self):
+        """
+        Tests that a signed URL is rejected once it has expired.
+
+        """
+
+        with override_settings(BLOB_SIGNED_URL_EXPIRY_SECOND=60):
+            with mock.patch(
+                    'django.core.signing.time.time',
+                    return_value=time.time() - 61,
+                ):
+                url = get_signed_blob_url(self.blob_name, 'application/pdf')
+
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_tampered_token(self):
+        """
+        Tests that a signed URL is rejected if the token has been changed
+        (e.g. to name a different document).
+
+        """
+
+        url = get_signed_blob_url(self.blob_name, 'application/pdf')
+        other_blob_name = default_storage.save(
+            'other_document.pdf',
+            ContentFile(b'other'),
+        )
+
+        # Name the other document without changing the signature
+        token = url.rstrip('/').split('/')[-1]
+        other_token = signing.dumps(other_blob_name, salt='signed_blob')
+        tampered_token = ':'.join((
+            other_token.split(':', 1)[0],
+            token.split(':', 1)[1],
+        ))
+        response = self.client.get(
+            reverse('app:admin_signed_blob', kwargs={'token': tampered_token})
+        )
+        self.assertEqual(response.status_code, 403)
+
+        # Change the signature
+        tampered_token = f"{token[:-1]}{'A' if token[-1] != 'A' else 'B'}"
+        response = self.client.get(
+            reverse('app:admin_signed_blob', kwargs={'token': tampered_token})
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_content_type_rules(self):
+        """
+        Tests that documents with blocked (or not allowed) content types are
+        neither served nor redirected to a signed URL.
+
+        """
+
+        with mock.patch.dict(
+                'app.admin.views.supported_content_types',
+                {'svg': 'image/svg+xml', 'txt': 'text/plain'},
+            ):
+            for blob_name in ('test_image.svg', 'test_text.txt'):
+                with self.subTest(blob_name=blob_name):
+                    default_storage.save(blob_name, ContentFile(b'<svg/>'))
+
+                    response = self.view_blob(blob_name)
+
+                    self.assertEqual(response.status_code, 405)
+                    self.assertFalse(response.has_header('Location'))
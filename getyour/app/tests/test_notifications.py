@@ -0,0 +1,108 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+import datetime
+from unittest import mock, skipUnless
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from app import ratelimit
+from app.backend import queue_bulk_notifications
+from app.models import NotificationOutbox
+from app.tasks import deliver_notification
+from app.tests.init_params import redis_available
+
+
+# Use a fast Twilio limit so the test doesn't take long, with the same
+# single-message burst as the real one
+TEST_SMS_PER_SECOND = 20
+
+
+@skipUnless(redis_available(), 'Redis is unavailable')
+@override_settings(OUTBOUND_RATE_LIMITS={
+    'twilio': {'rate': TEST_SMS_PER_SECOND, 'capacity': 1},
+})
+class BulkSmsDelivery(TestCase):
+    """
+    Test that bulk SMS notifications are delivered at the Twilio rate limit.
+
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        """ Set up the environment for testing. """
+
+        # Start with a full bucket that uses the test settings
+        ratelimit._rate_limiters.pop('twilio', None)
+        get_redis_connection('default').delete('ratelimit:twilio')
+
+        self.recipient_count = 10
+        queue_bulk_notifications(
+            'bulk_sms',
+            [(None, f"+1970555{idx:04d}") for idx in range(self.recipient_count)],
+            payload={'body': 'Test reminder'},
+        )
+
+        # Make every notification due at once, as they are by the time the
+        # scheduled sweeper runs
+        NotificationOutbox.objects.update(
+            next_attempt_at=timezone.now() - datetime.timedelta(seconds=1),
+        )
+
+    def tearDown(self):
+        """ Clean up the test bucket. """
+
+        ratelimit._rate_limiters.pop('twilio', None)
+        get_redis_connection('default').delete('ratelimit:twilio')
+
+    def test_bulk_sms_delivery(self):
+        """
+        Tests that every due bulk SMS is sent (and none are deferred) when the
+        sweeper releases them together, without exceeding the rate limit.
+
+        """
+
+        with mock.patch('app.backend.get_twilio_client') as mock_client:
+            start = time.monotonic()
+            for notification_id in NotificationOutbox.objects.values_list(
+                    'id',
+                    flat=True,
+                ):
+                deliver_notification(notification_id)
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(
+            mock_client.return_value.messages.create.call_count,
+            self.recipient_count,
+        )
+        self.assertEqual(
+            NotificationOutbox.objects.filter(
+                status='sent',
+                attempts=1,
+            ).count(),
+            self.recipient_count,
+        )
+
+        # The first message uses the full bucket; the rest wait for a token
+        self.assertGreaterEqual(
+            elapsed,
+            0.9 * (self.recipient_count - 1) / TEST_SMS_PER_SECOND,
+        )
@@ -0,0 +1,272 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+import uuid
+from unittest import mock, skipUnless
+
+from django.test import TestCase, override_settings
+from django_redis import get_redis_connection
+
+from app import ratelimit
+from app.ratelimit import (
+    TokenBucket,
+    RateLimitExceeded,
+    throttle,
+    rate_limit_utilization,
+)
+from app.tests.init_params import redis_available
+
+
+class RateLimitTestCase(TestCase):
+    """
+    Base class that names each test's buckets uniquely and removes them (and
+    their stats) from Redis afterwards.
+
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        """ Set up the environment for testing. """
+
+        self.prefix = f"test_{uuid.uuid4().hex}"
+
+    def tearDown(self):
+        """ Remove the test buckets from Redis and the limiter cache. """
+
+        connection = get_redis_connection('default')
+        for key in connection.scan_iter(f"ratelimit:{self.prefix}*"):
+            connection.delete(key)
+
+        for name in list(ratelimit._rate_limiters):
+            if name.startswith(self.prefix):
+                del ratelimit._rate_limiters[name]
+
+    def bucket(self, name, **kwargs):
+        """ Return a new bucket with a unique name. """
+
+        return TokenBucket(f"{self.prefix}_{name}", **kwargs)
+
+
+@skipUnless(redis_available(), 'Redis is unavailable')
+class TokenBucketAcquire(RateLimitTestCase):
+    """
+    Test taking tokens from a TokenBucket.
+
+    """
+
+    def test_try_acquire(self):
+        """
+        Tests that the burst is allowed without waiting, then calls are denied
+        with the time until the next token.
+
+        """
+
+        bucket = self.bucket('burst', rate=1, capacity=2)
+
+        self.assertTrue(bucket.try_acquire()[0])
+        self.assertTrue(bucket.try_acquire()[0])
+
+        acquired, retry_after = bucket.try_acquire()
+        self.assertFalse(acquired)
+        self.assertGreater(retry_after, 0.5)
+        self.assertLessEqual(retry_after, 1)
+
+    def test_acquire_waits(self):
+        """
+        Tests that acquire() waits for a token within its timeout.
+
+        """
+
+        bucket = self.bucket('wait', rate=20, capacity=1)
+        bucket.try_acquire()
+
+        start = time.monotonic()
+        acquired, _ = bucket.acquire(timeout=1)
+        elapsed = time.monotonic() - start
+
+        self.assertTrue(acquired)
+        self.assertGreaterEqual(elapsed, 0.9 / 20)
+
+    def test_acquire_without_waiting(self):
+        """
+        Tests that acquire() with a timeout of 0 returns immediately when no
+        token is available.
+
+        """
+
+        bucket = self.bucket('nowait', rate=1, capacity=1)
+        bucket.try_acquire()
+
+        start = time.monotonic()
+        acquired, retry_after = bucket.acquire(timeout=0)
+
+        self.assertFalse(acquired)
+        self.assertGreater(retry_after, 0)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_throttle(self):
+        """
+        Tests that throttle() raises RateLimitExceeded when the limiter doesn't
+        allow the call within the timeout.
+
+        """
+
+        name = f"{self.prefix}_throttle"
+        with override_settings(OUTBOUND_RATE_LIMITS={
+                name: {'rate': 1, 'capacity': 1},
+            }):
+            throttle(name, timeout=0)
+            with self.assertRaises(RateLimitExceeded) as cm:
+                throttle(name, timeout=0)
+
+        self.assertEqual(cm.exception.name, name)
+        self.assertGreater(cm.exception.retry_after, 0)
+
+
+@skipUnless(redis_available(), 'Redis is unavailable')
+class TokenBucketReserve(RateLimitTestCase):
+    """
+    Test the part of a TokenBucket that's reserved for interactive calls.
+
+    """
+
+    def test_bulk_leaves_reserve(self):
+        """
+        Tests that bulk calls can't take the reserved tokens, but interactive
+        calls can.
+
+        """
+
+        bucket = self.bucket('reserve', rate=1, capacity=10, bulk_reserve=0.5)
+
+        bulk_count = 0
+        while bucket.try_acquire(bulk=True)[0]:
+            bulk_count += 1
+        self.assertEqual(bulk_count, 5)
+
+        interactive_count = 0
+        while bucket.try_acquire()[0]:
+            interactive_count += 1
+        self.assertEqual(interactive_count, 5)
+
+    def test_bulk_retry_after_includes_reserve(self):
+        """
+        Tests that a denied bulk call waits until the bucket is refilled above
+        the reserve.
+
+        """
+
+        bucket = self.bucket('retry', rate=1, capacity=4, bulk_reserve=0.5)
+        for _ in range(4):
+            bucket.try_acquire()
+
+        _, retry_after = bucket.try_acquire(bulk=True)
+        self.assertGreater(retry_after, 2.5)
+        self.assertLessEqual(retry_after, 3)
+
+    def test_reserve_with_capacity_of_one(self):
+        """
+        Tests that a reserve has no effect on a bucket that only holds one call,
+        so bulk calls aren't starved.
+
+        """
+
+        bucket = self.bucket('single', rate=1, capacity=1, bulk_reserve=0.5)
+
+        self.assertTrue(bucket.try_acquire(bulk=True)[0])
+
+
+class TokenBucketFailOpen(RateLimitTestCase):
+    """
+    Test TokenBucket when Redis is unavailable.
+
+    """
+
+    def tearDown(self):
+        """ No Redis cleanup is needed. """
+
+        pass
+
+    def test_fail_open(self):
+        """
+        Tests that calls are allowed (rather than blocked) when Redis can't be
+        reached, and that utilization is reported as unknown.
+
+        """
+
+        bucket = self.bucket('failopen', rate=1, capacity=1)
+        with mock.patch(
+                'app.ratelimit.get_redis_connection',
+                side_effect=ConnectionError('Redis is down'),
+            ):
+            self.assertEqual(bucket.try_acquire(), (True, 0.0))
+            self.assertEqual(bucket.acquire(timeout=0), (True, 0.0))
+
+            utilization = bucket.utilization()
+
+        self.assertIsNone(utilization['available'])
+        self.assertIsNone(utilization['acquired_this_minute'])
+
+
+@skipUnless(redis_available(), 'Redis is unavailable')
+class RateLimitUtilization(RateLimitTestCase):
+    """
+    Test the utilization reported for each configured limiter.
+
+    """
+
+    def test_rate_limit_utilization(self):
+        """
+        Tests that rate_limit_utilization() reports every configured limiter,
+        with its available tokens and the acquired and denied counts.
+
+        """
+
+        busy_name = f"{self.prefix}_busy"
+        idle_name = f"{self.prefix}_idle"
+        with override_settings(OUTBOUND_RATE_LIMITS={
+                busy_name: {'rate': 0.1, 'capacity': 2},
+                idle_name: {'rate': 1, 'capacity': 5},
+            }):
+            for _ in range(3):
+                ratelimit.get_rate_limiter(busy_name).try_acquire()
+
+            utilization = {
+                x['name']: x for x in rate_limit_utilization()
+            }
+
+        self.assertEqual(set(utilization), {busy_name, idle_name})
+
+        busy = utilization[busy_name]
+        self.assertLess(busy['available'], 1)
+        self.assertGreater(busy['utilization'], 0.5)
+        # The calls may straddle a minute boundary
+        self.assertEqual(
+            busy['acquired_this_minute'] + busy['acquired_last_minute'],
+            2,
+        )
+        self.assertEqual(
+            busy['denied_this_minute'] + busy['denied_last_minute'],
+            1,
+        )
+
+        idle = utilization[idle_name]
+        self.assertEqual(idle['available'], 5)
+        self.assertEqual(idle['utilization'], 0)
+        self.assertEqual(idle['acquired_this_minute'], 0)
@@ -0,0 +1,519 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+import hashlib
+import logging
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+from app.constants import upload_max_workers
+from app.models import DocumentBlob
+from app.previews import delete_preview
+from logger.wrappers import LoggerWrapper
+
+
+# Initialize logger
+log = LoggerWrapper(logging.getLogger(__name__))
+
+
+def submission_file_name(file_name, number, upload_time):
+    """
+    Name a file of a submission as 'YYYY-MM-DDTHHmmssZ_<n>_<file name>', where
+    n is the 1-based position (``number``) of the file in the submission and
+    ``upload_time`` is a pendulum datetime in UTC.
+
+    """
+
+    return upload_time.format(f"YYYY-MM-DD[T]HHmmss[Z_{number}_{file_name}]")
+
+
+def submission_file_names(file_names, upload_time):
+    """
+    Name each file of a submission with submission_file_name(), sharing the
+    same timestamp.
+
+    """
+
+    return [
+        submission_file_name(file_name, idx, upload_time)
+        for idx, file_name in enumerate(file_names, start=1)
+    ]
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler that writes each file to a temporary file on disk (as
+    TemporaryFileUploadHandler) and hashes it as it streams in, setting the
+    SHA-256 hex digest as the file's ``sha256`` attribute.
+
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hash.hexdigest()
+        return file
+
+
+def get_sha256(content):
+    """
+    Return the SHA-256 hex digest of ``content`` (a Django File), using the
+    one computed while it was uploaded if it exists.
+
+    """
+
+    if getattr(content, 'sha256', None) is None:
+        file_hash = hashlib.sha256()
+        for chunk in content.chunks():
+            file_hash.update(chunk)
+        content.seek(0)
+        content.sha256 = file_hash.hexdigest()
+    return content.sha256
+
+
+def claim_document(sha256, references=1):
+    """
+    Add ``references`` to the stored document with this content, if there is
+    one. Either way, the document is marked as re-used, so it isn't deleted
+    by the 'unreferenced_document' retention policy (see app.retention)
+    before it's referenced.
+
+    Returns
+    -------
+    str or None
+        The document's name in storage, or None if it isn't stored.
+
+    """
+
+    with transaction.atomic():
+        document = DocumentBlob.objects.select_for_update().filter(
+            sha256=sha256,
+        ).first()
+        if document is None:
+            return None
+
+        document.ref_count = F('ref_count') + references
+        document.save(update_fields=['ref_count', 'modified_at'])
+        return document.blob_name
+
+
+def register_document(
+        sha256,
+        blob_name,
+        size,
+        storage=default_storage,
+        references=1,
+    ):
+    """
+    Index the newly stored document ``blob_name`` by its content, with
+    ``references`` references (e.g. 0 for a document that isn't attached to
+    a record yet).
+
+    If the same content was stored at the same time (e.g. by another
+    request), ``blob_name`` is deleted and the other document is referenced
+    instead.
+
+    Returns
+    -------
+    str
+        The name of the document to reference.
+
+    """
+
+    try:
+        with transaction.atomic():
+            DocumentBlob.objects.create(
+                sha256=sha256,
+                blob_name=blob_name,
+                size=size,
+                ref_count=references,
+            )
+        return blob_name
+
+    except IntegrityError:
+        existing_name = claim_document(sha256, references=references)
+        if existing_name is None:
+            raise
+        storage.delete(blob_name)
+        return existing_name
+
+
+def release_document(blob_name, storage=default_storage):
+    """
+    Remove a reference to the document ``blob_name``, and delete it (with its
+    preview) once there are none left. Documents that aren't indexed (i.e.
+    that were uploaded before deduplication) are deleted directly.
+
+    Returns
+    -------
+    bool
+        Whether the document was deleted.
+
+    """
+
+    with transaction.atomic():
+        unreferenced_names = release_references([blob_name])
+
+    for name in unreferenced_names:
+        storage.delete(name)
+        delete_preview(name, storage=storage)
+    return len(unreferenced_names) > 0
+
+
+def get_identification_names(household_info):
+    """
+    Return the names of the stored IDs referenced by ``household_info`` (of
+    HouseholdMembers), one per household member that has one.
+
+    """
+
+    if household_info is None:
+        return []
+    return [
+        x['identification_path']
+        for x in household_info.get('persons_in_household', [])
+        if x.get('identification_path') is not None
+    ]
+
+
+def claim_references(blob_names):
+    """
+    Add a reference to each of the stored documents ``blob_names`` (a name
+    that's repeated is claimed once per repeat), e.g. when another record
+    starts referencing them. Documents that aren't indexed are skipped. Call
+    this in a transaction with whatever references the documents.
+
+    """
+
+    for blob_name in blob_names:
+        document = DocumentBlob.objects.select_for_update().filter(
+            blob_name=blob_name,
+        ).first()
+        if document is not None:
+            document.ref_count = F('ref_count') + 1
+            document.save(update_fields=['ref_count', 'modified_at'])
+
+
+def release_references(blob_names, retain=False):
+    """
+    Remove a reference to each of the documents ``blob_names`` (a name that's
+    repeated is released once per repeat), without touching storage. Call
+    this in a transaction with whatever stops referencing the documents, then
+    delete the returned documents once it's committed (e.g. with
+    delete_documents()).
+
+    Parameters
+    ----------
+    blob_names : list
+        The names of the documents.
+    retain : bool, optional
+        Keep the documents with no references left (with a ``ref_count`` of
+        0), to be deleted by the 'unreferenced_document' retention policy
+        (see app.retention) rather than now. Use this when a document is
+        replaced rather than purged. Documents that aren't indexed can't be
+        tracked, so they're left in storage.
+
+    Returns
+    -------
+    list
+        The names of the documents with no references left, including those
+        that aren't indexed. This is always empty if ``retain`` is True.
+
+    """
+
+    unreferenced_names = []
+    for blob_name in blob_names:
+        document = DocumentBlob.objects.select_for_update().filter(
+            blob_name=blob_name,
+        ).first()
+        if document is not None and (
+                document.ref_count > 1 or (retain and document.ref_count > 0)
+            ):
+            document.ref_count = F('ref_count') - 1
+            document.save(update_fields=['ref_count', 'modified_at'])
+            continue
+
+        if retain:
+            # Keep the (now) unreferenced document for its retention policy,
+            # or leave it in storage if it isn't indexed
+            continue
+
+        if document is not None:
+            document.delete()
+        if blob_name not in unreferenced_names:
+            unreferenced_names.append(blob_name)
+
+    return unreferenced_names
+
+
+def delete_documents(
+        blob_names,
+        calling_function=None,
+        storage=default_storage,
+        max_workers=upload_max_workers,
+    ):
+    """
+    Delete the documents ``blob_names`` (with their previews) from
+    ``storage``, with up to ``max_workers`` threads. Failures are logged
+    rather than raised, since the references to the documents are already
+    gone.
+
+    Returns
+    -------
+    list
+        The names of the documents that couldn't be deleted.
+
+    """
+
+    def delete_document(blob_name):
+        storage.delete(blob_name)
+        delete_preview(blob_name, storage=storage)
+
+    if len(blob_names) == 0:
+        return []
+
+    with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(blob_names)),
+            thread_name_prefix='delete_documents',
+        ) as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                delete_document,
+                blob_name,
+            ) for blob_name in blob_names
+        ]
+        wait(futures)
+
+    failed_names = []
+    for blob_name, future in zip(blob_names, futures):
+        if future.exception() is not None:
+            log.error(
+                f"Document {blob_name} couldn't be deleted: {future.exception()!r}",
+                function=calling_function,
+            )
+            failed_names.append(blob_name)
+
+    return failed_names
+
+
+def _save_file(storage, name, content, user_id, calling_function):
+    start = time.perf_counter()
+    saved_name = storage.save(name, content)
+    log.debug(
+        "File %s (%s bytes) uploaded in %.0f ms",
+        saved_name,
+        content.size,
+        (time.perf_counter() - start) * 1000,
+        function=calling_function,
+        user_id=user_id,
+    )
+    return saved_name
+
+
+def upload_files(
+        files,
+        user_id=None,
+        calling_function=None,
+        storage=default_storage,
+        max_workers=upload_max_workers,
+    ):
+    """
+    Upload the files of one submission to ``storage`` at the same time, with
+    up to ``max_workers`` threads.
+
+    Files whose content is already stored (including repeats within the
+    submission) aren't uploaded again; the stored document is referenced
+    instead (see DocumentBlob).
+
+    Either every file is stored or none are: if any upload fails, the
+    references that were added are released (see release_document()), any
+    uploaded documents that weren't indexed yet are deleted, and the (first)
+    exception is raised.
+
+    Parameters
+    ----------
+    files : list
+        (name, file) tuples, where name is the full storage name.
+    user_id : int, optional
+        The user the files belong to, for logging.
+    calling_function : str, optional
+        The function to log the uploads under.
+    storage : Storage, optional
+        The storage to upload to.
+    max_workers : int, optional
+        The maximum number of files to upload at once.
+
+    Returns
+    -------
+    list
+        The names of the stored documents, in the same order as ``files``.
+        These can differ from the requested names, if the content was
+        already stored or the names already exist.
+    list
+        The names of the documents that were newly stored (i.e. not already
+        stored), which are the only ones that should be processed further
+        (e.g. normalized), since the others can be referenced by other
+        records.
+
+    """
+
+    hashes = [get_sha256(content) for _, content in files]
+
+    stored_names = {}
+    new_names = []
+    references = []
+    # Uploaded documents that haven't been indexed yet, which nothing else can
+    # reference
+    unregistered_names = []
+    try:
+        # Reference the documents that are already stored, and collect the
+        # distinct new content to upload
+        new_files = {}
+        for (name, content), sha256 in zip(files, hashes):
+            if sha256 in stored_names or sha256 in new_files:
+                continue
+
+            existing_name = claim_document(sha256)
+            if existing_name is None:
+                new_files[sha256] = (name, content)
+            else:
+                stored_names[sha256] = existing_name
+                references.append(existing_name)
+
+        uploaded_names = _save_files(
+            storage,
+            list(new_files.values()),
+            user_id,
+            calling_function,
+            max_workers,
+        )
+        unregistered_names.extend(uploaded_names)
+        for sha256, uploaded_name in zip(new_files, uploaded_names):
+            stored_names[sha256] = register_document(
+                sha256,
+                uploaded_name,
+                new_files[sha256][1].size,
+                storage=storage,
+            )
+            unregistered_names.remove(uploaded_name)
+            references.append(stored_names[sha256])
+            # The same content can have been stored at the same time
+            if stored_names[sha256] == uploaded_name:
+                new_names.append(uploaded_name)
+
+        # Each repeat of the same content within the submission is another
+        # reference
+        for sha256, count in Counter(hashes).items():
+            for _ in range(count - 1):
+                references.append(claim_document(sha256))
+
+    except Exception:
+        for blob_name in references:
+            try:
+                release_document(blob_name, storage=storage)
+            except Exception:
+                log.exception(
+                    f"Reference to {blob_name} couldn't be released after an upload failed",
+                    function=calling_function,
+                    user_id=user_id,
+                )
+        for blob_name in unregistered_names:
+            try:
+                storage.delete(blob_name)
+            except Exception:
+                log.exception(
+                    f"Document {blob_name} couldn't be deleted after an upload failed",
+                    function=calling_function,
+                    user_id=user_id,
+                )
+        raise
+
+    if len(new_files) < len(files):
+        log.info(
+            f"{len(files) - len(new_files)} of {len(files)} file(s) were already stored",
+            function=calling_function,
+            user_id=user_id,
+        )
+    return [stored_names[sha256] for sha256 in hashes], new_names
+
+
+def _save_files(storage, files, user_id, calling_function, max_workers):
+    # Save the (name, file) tuples in parallel. If any fails, the files that
+    # were saved are deleted and the (first) exception is raised
+    if len(files) <= 1:
+        return [
+            _save_file(storage, name, content, user_id, calling_function)
+            for name, content in files
+        ]
+
+    with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(files)),
+            thread_name_prefix='upload_files',
+        ) as executor:
+        # Run each upload in a copy of the current context, so its log
+        # records keep the request ID
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                _save_file,
+                storage,
+                name,
+                content,
+                user_id,
+                calling_function,
+            ) for name, content in files
+        ]
+        wait(futures)
+
+    errors = [x.exception() for x in futures if x.exception() is not None]
+    if not errors:
+        return [x.result() for x in futures]
+
+    # Roll back the uploads that succeeded
+    for future in futures:
+        if future.exception() is None:
+            try:
+                storage.delete(future.result())
+            except Exception:
+                log.exception(
+                    f"Uploaded file {future.result()} couldn't be deleted after another upload failed",
+                    function=calling_function,
+                    user_id=user_id,
+                )
+
+    log.error(
+        f"{len(errors)} of {len(files)} file upload(s) failed; the rest were deleted",
+        function=calling_function,
+        user_id=user_id,
+    )
+    raise errors[0]
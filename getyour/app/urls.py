@@ -20,7 +20,7 @@ from django.urls import path
 from django.conf.urls.static import static
 from django.conf import settings
 from app.admin import views as admin_views
-from app.views import landing, authentication, application, dashboard
+from app.views import landing, authentication, application, dashboard, uploads
 
 
 urlpatterns = [
@@ -131,6 +131,18 @@ urlpatterns = [
         name='files',
         kwargs={'allow_direct_user': False},
      ),
+    path(
+        'uploads',
+        uploads.start_upload,
+        name='start_upload',
+        kwargs={'allow_direct_user': False},
+     ),
+    path(
+        'uploads/<str:upload_id>',
+        uploads.resumable_upload,
+        name='resumable_upload',
+        kwargs={'allow_direct_user': False},
+     ),
     path(
         'broadcast',
         application.broadcast,
@@ -215,6 +227,14 @@ urlpatterns = [
         name='admin_view_blob',
         kwargs={'allow_direct_user': False},
     ),
+    path(
+        'app_admin/signed_blob/<str:token>',
+        admin_views.signed_blob,
+        name='admin_signed_blob',
+        # The token is the authorization, so the browser can be sent here
+        # directly
+        kwargs={'allow_direct_user': True},
+    ),
     path(
         'app_admin/add_elig_program/<int:user_id>',
         admin_views.add_elig_program,
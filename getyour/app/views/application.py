@@ -20,19 +20,15 @@ import json
 import usaddress
 import pendulum
 import logging
-import base64
-import io
 import re
 from urllib.parse import urlencode
 
 from django.shortcuts import render, redirect, reverse
-from django.core.files.uploadedfile import SimpleUploadedFile
 from django.http import QueryDict, HttpResponseRedirect, JsonResponse
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.models.query_utils import Q
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.forms.utils import ErrorList
-from django.core.files.storage import default_storage
 from django.contrib.auth.decorators import login_required
 
 from app.forms import (
@@ -49,6 +45,7 @@ from app.models import (
     Address,
     EligibilityProgram,
     Household,
+    HouseholdMembers,
     User,
     EligibilityProgramRD,
     Admin as AppAdmin,
@@ -59,8 +56,7 @@ from app.backend import (
     serialize_household_members,
     get_in_progress_eligiblity_file_uploads,
     what_page,
-    broadcast_email,
-    broadcast_sms,
+    queue_notification,
     save_renewal_action,
     file_validation,
     tag_mapping,
@@ -69,7 +65,15 @@ from app.backend import (
     finalize_address,
     finalize_application,
 )
-from app.decorators import set_update_mode
+from app.decorators import set_update_mode, stream_file_uploads
+from app.uploads import (
+    submission_file_names,
+    upload_files,
+    get_identification_names,
+    release_references,
+)
+from app.resumable import UploadError, get_completed_uploads, attach_uploads
+from app.normalization import queue_normalization
 from app.constants import supported_content_types
 from logger.wrappers import LoggerWrapper
 
@@ -573,20 +577,20 @@ def address_correction(request, **kwargs):
                 try:
                     if idx in (0, 1):
                         log.info(
-                            f"Attempting USPS validation with rawAddressDict: {rawAddressDict}",
+                            "Attempting USPS validation with rawAddressDict: %s", rawAddressDict,
                             function='address_correction',
                             user_id=request.user.id,
                         )
                         validationResult = validate_usps(rawAddressDict)
                     else:
                         log.info(
-                            f"Attempting USPS validation with input QueryDict: {q}",
+                            "Attempting USPS validation with input QueryDict: %s", q,
                             function='address_correction',
                             user_id=request.user.id,
                         )
                         validationResult = validate_usps(q)
                     log.info(
-                        f"USPS Validation returned {validationResult}",
+                        "USPS Validation returned %s", validationResult,
                         function='address_correction',
                         user_id=request.user.id,
                     )
@@ -629,7 +633,7 @@ def address_correction(request, **kwargs):
                                 validated_address['secondaryAddress'],
                                 validated_address['city'] + " " + validated_address['state'] + " " + validated_address['ZIPCode']]
             log.info(
-                f"address_feedback is: {address_feedback}",
+                "address_feedback is: %s", address_feedback,
                 function='address_correction',
                 user_id=request.user.id,
             )
@@ -986,6 +990,7 @@ def household(request, **kwargs):
 
 @login_required(redirect_field_name='auth_next')
 @set_update_mode
+@stream_file_uploads
 def household_members(request, **kwargs):
 
     try:
@@ -1007,94 +1012,108 @@ def household_members(request, **kwargs):
                 existing = request.user.householdmembers
 
                 form = HouseholdMembersForm(
-                    request.POST, instance=existing)
+                    request.POST, request.FILES, instance=existing)
             except (AttributeError, ObjectDoesNotExist):
-                form = HouseholdMembersForm(request.POST or None)
+                form = HouseholdMembersForm(request.POST, request.FILES)
 
             file_paths = []
             if form.is_valid():
                 instance = form.save(commit=False)
 
-                # Loop 1: scans files
-                # Loop 2: saves file(s) if valid
-                identification_paths = request.POST.getlist('identification_path')
-                updated_identification_paths = []
-
-                for _, base64_content in enumerate(identification_paths):
-                    # Decode the Base64 string
-                    decoded_bytes = base64.b64decode(base64_content)
-                    # Create a buffer from the decoded bytes
-                    buffer = io.BytesIO(decoded_bytes).getvalue()
+                upload_ids = request.POST.getlist('identification_upload_id')
+                identification_files = request.FILES.getlist('identification_path')
+                file_extensions = []
+                failure_message = None
 
-                    file_validated, failure_message_or_file_extension = file_validation(
-                        buffer,
-                        request.user.id,
-                        calling_function='household_members',
-                    )
-                    if not file_validated:
-                        # Attempt to define household_info to load
-                        try:
-                            household_info = request.user.householdmembers.household_info
-                        except AttributeError:
-                            household_info = None
-
-                        return render(
-                            request,
-                            "application/household_members.html",
-                            {
-                                'step': 3,
-                                "message": failure_message_or_file_extension,
-                                'dependent': str(request.user.household.number_persons_in_household),
-                                'list': list(range(request.user.household.number_persons_in_household)),
-                                'form': form,
-                                'form_page_number': form_page_number,
-                                'title': "Household Members",
-                                'update_mode': update_mode,
-                                'form_data': json.dumps(household_info) if household_info else [],
-                            },
+                if upload_ids:
+                    # The files were uploaded in chunks before the form was
+                    # submitted (see app.resumable) and validated as they
+                    # were, so they only need to be attached (with the save)
+                    try:
+                        uploads = get_completed_uploads(
+                            upload_ids,
+                            request.user,
+                            'identification',
                         )
+                        file_paths = [x['blob_name'] for x in uploads]
+                        new_file_paths = [
+                            x['blob_name'] for x in uploads if x['is_new']
+                        ]
+                    except UploadError as e:
+                        failure_message = str(e)
+
+                elif not identification_files:
+                    # The file field isn't required by the form, since it's
+                    # empty when the files were uploaded in chunks
+                    failure_message = "Please upload an identification file."
 
-                    # File was successfully validated; file_validation() output
-                    # will be the file extension
-                    file_name = f"household_member_id.{failure_message_or_file_extension}"
-                    # Assuming file_name is already defined
-                    updated_base64_content = base64_content + "," + file_name
-                    updated_identification_paths.append(updated_base64_content)
-
-                fileAmount = 0
-                for f in updated_identification_paths:
-                    file_name = f.split(",")[1]
-                    file_contents = f.split(",")[0]
-                    content_type = supported_content_types.get(
-                        file_name.split(".")[1],
-                        "text/plain",
-                    )
+                else:
+                    # Loop 1: scans files
+                    # Loop 2: saves file(s) if valid
+                    # The files are streamed to temporary files on disk (see
+                    # stream_file_uploads), so each is validated from its first
+                    # chunk and saved to storage a chunk at a time
+                    for f in identification_files:
+                        file_validated, failure_message_or_file_extension = file_validation(
+                            f,
+                            request.user.id,
+                            calling_function='household_members',
+                        )
+                        if not file_validated:
+                            failure_message = failure_message_or_file_extension
+                            break
 
-                    # Decode the Base64 string
-                    decoded_bytes = base64.b64decode(file_contents)
+                        # File was successfully validated; file_validation()
+                        # output will be the file extension
+                        file_extensions.append(failure_message_or_file_extension)
 
-                    # Create a buffer from the decoded bytes
-                    buffer = io.BytesIO(decoded_bytes)
-                    fileAmount += 1
+                if failure_message is not None:
+                    # Attempt to define household_info to load
+                    try:
+                        household_info = request.user.householdmembers.household_info
+                    except AttributeError:
+                        household_info = None
 
-                    file_path = userfiles_path(
-                        request.user,
-                        pendulum.now(
-                            'utc'
-                        ).format(
-                            f"YYYY-MM-DD[T]HHmmss[Z_{fileAmount}_{file_name}]"
-                        ),
+                    return render(
+                        request,
+                        "application/household_members.html",
+                        {
+                            'step': 3,
+                            "message": failure_message,
+                            'dependent': str(request.user.household.number_persons_in_household),
+                            'list': list(range(request.user.household.number_persons_in_household)),
+                            'form': form,
+                            'form_page_number': form_page_number,
+                            'title': "Household Members",
+                            'update_mode': update_mode,
+                            'form_data': json.dumps(household_info) if household_info else [],
+                        },
                     )
 
-                    uploaded_file = SimpleUploadedFile(
-                        file_name, buffer.read(), content_type)
-                    file_paths.append(file_path)
-                    default_storage.save(file_path, uploaded_file)
-                    log.debug(
-                        f"Identification file {file_path} saved successfully",
-                        function='household_members',
+                if not upload_ids:
+                    for f, file_extension in zip(identification_files, file_extensions):
+                        # Store the validated content type rather than the one
+                        # sent by the browser
+                        f.content_type = supported_content_types[file_extension]
+
+                    # Upload the files concurrently; if any fails, none are
+                    # kept
+                    file_names = submission_file_names(
+                        [f"household_member_id.{x}" for x in file_extensions],
+                        pendulum.now('utc'),
+                    )
+                    file_paths, new_file_paths = upload_files(
+                        [
+                            (userfiles_path(request.user, file_name), f)
+                            for file_name, f in zip(file_names, identification_files)
+                        ],
                         user_id=request.user.id,
+                        calling_function='household_members',
                     )
+                fileAmount = len(file_paths)
+                # Only normalize newly stored files; the others are already
+                # normalized and can be referenced by other records
+                queue_normalization(new_file_paths)
 
                 if fileAmount > 0:
                     log.info(
@@ -1138,7 +1157,22 @@ def household_members(request, **kwargs):
             instance.update_mode = update_mode
             instance.renewal_mode = renewal_mode
 
-            instance.save()
+            with transaction.atomic():
+                if upload_ids:
+                    attach_uploads(upload_ids, request.user, 'identification')
+
+                # Every ID is replaced by the ones just uploaded, so release
+                # the references to the previous IDs along with the save. They
+                # stay in storage until the 'unreferenced_document' retention
+                # policy deletes them
+                previous_household_info = HouseholdMembers.objects.select_for_update().filter(
+                    user_id=request.user.id,
+                ).values_list('household_info', flat=True).first()
+                instance.save()
+                release_references(
+                    get_identification_names(previous_household_info),
+                    retain=True,
+                )
 
             if renewal_mode:
                 # Call save_renewal_action after .save() so as not to save
@@ -1290,6 +1324,7 @@ def programs(request, **kwargs):
 
 @login_required(redirect_field_name='auth_next')
 @set_update_mode
+@stream_file_uploads
 def files(request, **kwargs):
     '''
     Variables:
@@ -1318,61 +1353,113 @@ def files(request, **kwargs):
                                 instance=user_file_upload)
             if form.is_valid():
                 instance = form.save(commit=False)
-                fileNames = []
-                fileAmount = 0
                 
-                # Loop 1: scans files
-                # Loop 2: saves file(s) if valid
-                for f in request.FILES.getlist('document_path'):
-                    file_validated, failure_message_or_file_extension = file_validation(
-                        f,
-                        request.user.id,
-                        calling_function='files',
-                    )
-                    if not file_validated:
-                        users_programs_without_uploads = get_in_progress_eligiblity_file_uploads(
-                            request)
-                        return render(
-                            request,
-                            'application/files.html',
+                upload_ids = request.POST.getlist('upload_id')
+                failure_message = None
+
+                if upload_ids:
+                    # The files were uploaded in chunks before the form was
+                    # submitted (see app.resumable) and validated as they
+                    # were, so they only need to be attached (with the save)
+                    try:
+                        uploads = get_completed_uploads(
+                            upload_ids,
+                            request.user,
+                            'document',
+                        )
+                        documents = [
                             {
-                                "message": failure_message_or_file_extension,
-                                'form': form,
-                                'eligiblity_programs': users_programs_without_uploads,
-                                'step': 5,
-                                'form_page_number': form_page_number,
-                                'title': "Files",
-                                'file_upload': json.dumps({'success_status': False}),
-                                'renewal_mode': renewal_mode,
-                            },
+                                'blob_name': x['blob_name'],
+                                'size': x['size'],
+                                'content_type': x['content_type'],
+                                'sha256': x['sha256'],
+                            } for x in uploads
+                        ]
+                        new_file_names = [
+                            x['blob_name'] for x in uploads if x['is_new']
+                        ]
+                    except UploadError as e:
+                        failure_message = str(e)
+
+                elif not request.FILES.getlist('document_path'):
+                    # The file field isn't required by the form, since it's
+                    # empty when the files were uploaded in chunks
+                    failure_message = "Please upload a file."
+
+                else:
+                    # Loop 1: scans files
+                    # Loop 2: saves file(s) if valid
+                    for f in request.FILES.getlist('document_path'):
+                        file_validated, failure_message_or_file_extension = file_validation(
+                            f,
+                            request.user.id,
+                            calling_function='files',
                         )
+                        if not file_validated:
+                            failure_message = failure_message_or_file_extension
+                            break
 
-                for f in request.FILES.getlist('document_path'):
-                    fileAmount += 1
-                    instance.renewal_mode = renewal_mode
-
-                    # This allows us to save multiple files under the same
-                    # Eligibility Program record. Note that the database is updated
-                    # each time this loop is run, plus again for the final save()
-                    # afterward
-                    instance.document_path.save(
-                        pendulum.now(
-                            'utc'
-                        ).format(
-                            f"YYYY-MM-DD[T]HHmmss[Z_{fileAmount}_{f}]"
-                        ),
-                        f,
+                        # Store the validated content type rather than the one
+                        # sent by the browser
+                        f.content_type = supported_content_types[failure_message_or_file_extension]
+
+                if failure_message is not None:
+                    users_programs_without_uploads = get_in_progress_eligiblity_file_uploads(
+                        request)
+                    return render(
+                        request,
+                        'application/files.html',
+                        {
+                            "message": failure_message,
+                            'form': form,
+                            'eligiblity_programs': users_programs_without_uploads,
+                            'step': 5,
+                            'form_page_number': form_page_number,
+                            'title': "Files",
+                            'file_upload': json.dumps({'success_status': False}),
+                            'renewal_mode': renewal_mode,
+                        },
                     )
-                    fileNames.append(str(instance.document_path))
-                    log.debug(
-                        f"Eligibility file {instance.document_path} saved successfully",
-                        function='files',
+
+                if not upload_ids:
+                    # Upload the files concurrently; if any fails, none are
+                    # kept. This allows us to save multiple files under the
+                    # same Eligibility Program record
+                    uploaded_files = request.FILES.getlist('document_path')
+                    file_names = submission_file_names(
+                        [f.name for f in uploaded_files],
+                        pendulum.now('utc'),
+                    )
+                    fileNames, new_file_names = upload_files(
+                        [
+                            (instance.document_path.field.generate_filename(instance, file_name), f)
+                            for file_name, f in zip(file_names, uploaded_files)
+                        ],
                         user_id=request.user.id,
+                        calling_function='files',
+                        storage=instance.document_path.storage,
                     )
+                    documents = [
+                        {
+                            'blob_name': file_name,
+                            'size': f.size,
+                            'content_type': f.content_type,
+                            'sha256': f.sha256,
+                        } for file_name, f in zip(fileNames, uploaded_files)
+                    ]
+
+                fileNames = [x['blob_name'] for x in documents]
+                fileAmount = len(fileNames)
+                # Only normalize newly stored files; the others are already
+                # normalized and can be referenced by other records
+                queue_normalization(new_file_names)
+                instance.renewal_mode = renewal_mode
 
-                # Save the fileNames list as a single document_path string
-                instance.document_path = str(fileNames)
-                instance.save()
+                # Save the documents, one record per file
+                with transaction.atomic():
+                    if upload_ids:
+                        attach_uploads(upload_ids, request.user, 'document')
+                    instance.set_documents(documents)
 
                 if fileAmount == 0:
                     log.info(
@@ -1457,25 +1544,32 @@ def broadcast(request, **kwargs):
         )
 
         current_user = request.user
-        try:
-            broadcast_email(current_user.email)
-        except Exception:
-            log.exception(
-                "There was a problem with sending the email (Sendgrid)",
-                function='broadcast',
-                user_id=request.user.id,
+
+        # Note in the database when notifications were sent, and queue the
+        # notifications in the same transaction. They're delivered by the
+        # Django-Q workers so that slow providers don't hold up this page. The
+        # idempotency key is tied to the completed application, so reloading
+        # this page doesn't notify the user again
+        completed_key = '{}:{}'.format(
+            current_user.id,
+            current_user.last_completed_at.isoformat() if current_user.last_completed_at else '',
+        )
+        with transaction.atomic():
+            current_user.last_action_notification_at = pendulum.now()
+            current_user.save()
+
+            queue_notification(
+                'welcome_email',
+                current_user.email,
+                user=current_user,
+                idempotency_key=f"welcome_email:{completed_key}",
             )
-            # TODO store / save for later: client getting feedback that SendGrid may be down
-        phone = str(current_user.phone_number)
-        try:
-            broadcast_sms(phone)
-        except Exception:
-            log.exception(
-                "Twilio servers may be down",
-                function='broadcast',
-                user_id=request.user.id,
+            queue_notification(
+                'welcome_sms',
+                str(current_user.phone_number),
+                user=current_user,
+                idempotency_key=f"welcome_sms:{completed_key}",
             )
-            # TODO store / save for later: client getting feedback that twilio may be down
 
         log.info(
             "Application completed successfully",
@@ -1483,10 +1577,6 @@ def broadcast(request, **kwargs):
             user_id=request.user.id,
         )
 
-        # Note in the database when notifications were sent
-        current_user.last_action_notification_at = pendulum.now()
-        current_user.save()
-
         return render(
             request,
             'application/broadcast.html',
@@ -29,7 +29,7 @@ from django.utils.http import urlsafe_base64_encode
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.encoding import force_bytes
 
-from app.backend import login, what_page, broadcast_email_pw_reset
+from app.backend import login, what_page, queue_notification
 from logger.wrappers import LoggerWrapper
 
 
@@ -66,7 +66,14 @@ def password_reset_request(request, **kwargs):
                         }
                         email = render_to_string(email_template_name, c)
                         try:
-                            broadcast_email_pw_reset(user.email, email)
+                            # Queue the email; it's delivered by the Django-Q
+                            # workers so the provider doesn't hold up the page
+                            queue_notification(
+                                'pw_reset_email',
+                                user.email,
+                                user=user,
+                                payload={'content': email},
+                            )
                         except BadHeaderError:
                             msg = 'Invalid header found'
                             log.exception(
@@ -76,7 +76,7 @@ def index(request, **kwargs):
                     raw_address_dict['city'] = 'Fort Collins'
 
                     log.info(
-                        f"Address form submitted: {raw_address_dict}",
+                        "Address form submitted: %s", raw_address_dict,
                         function='index',
                         user_id=request.user.id,
                     )
@@ -0,0 +1,143 @@
+"""
+Get-Your is a platform for application and administration of income-
+qualified programs, used primarily by the City of Fort Collins.
+Copyright (C) 2022-2026
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import logging
+
+from django.http import JsonResponse
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST, require_http_methods
+
+from app import resumable
+from app.constants import resumable_upload_max_chunk_bytes
+from logger.wrappers import LoggerWrapper
+
+
+# Initialize logger
+log = LoggerWrapper(logging.getLogger(__name__))
+
+
+@login_required(redirect_field_name='auth_next')
+@require_POST
+def start_upload(request, **kwargs):
+    """
+    Start a resumable upload. Expects 'file_name', 'size' and (optionally)
+    'number' and 'purpose' as form data, and returns the upload ID and the
+    chunk size to send the file in.
+
+    """
+
+    try:
+        try:
+            size = int(request.POST['size'])
+            number = int(request.POST.get('number', 1))
+            upload_id = resumable.start_upload(
+                request.user,
+                request.POST['file_name'],
+                size,
+                number=number,
+                purpose=request.POST.get('purpose', 'document'),
+            )
+        except (KeyError, ValueError):
+            return JsonResponse({'error': "Invalid upload request"}, status=400)
+        except resumable.UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+
+        return JsonResponse(
+            {
+                'upload_id': upload_id,
+                'offset': 0,
+                'chunk_size': resumable_upload_max_chunk_bytes,
+            },
+            status=201,
+        )
+
+    except:
+        # General view-level exception catching
+        try:
+            user_id = request.user.id
+        except Exception:
+            user_id = None
+        log.exception(
+            'Uncaught view-level exception',
+            function='start_upload',
+            user_id=user_id,
+        )
+        raise
+
+
+@login_required(redirect_field_name='auth_next')
+@require_http_methods(['GET', 'PUT', 'POST'])
+def resumable_upload(request, upload_id, **kwargs):
+    """
+    Continue a resumable upload.
+
+    GET returns the offset to resume the upload from. PUT appends the request
+    body as the chunk starting at the 'Upload-Offset' header, and returns the
+    new offset (or HTTP 409 with the current offset, if the chunk isn't at
+    it). POST completes the upload, after the last chunk.
+
+    """
+
+    try:
+        try:
+            if request.method == 'GET':
+                upload = resumable.get_upload(upload_id, request.user)
+                return JsonResponse({
+                    'offset': upload['offset'],
+                    'is_complete': upload['is_complete'],
+                })
+
+            elif request.method == 'PUT':
+                try:
+                    offset = int(request.headers['Upload-Offset'])
+                except (KeyError, ValueError):
+                    return JsonResponse(
+                        {'error': "Missing or invalid Upload-Offset header"},
+                        status=400,
+                    )
+                offset = resumable.append_chunk(
+                    upload_id,
+                    request.user,
+                    offset,
+                    request.body,
+                )
+                return JsonResponse({'offset': offset})
+
+            resumable.complete_upload(upload_id, request.user)
+            return JsonResponse({'upload_id': upload_id, 'is_complete': True})
+
+        except resumable.UploadOffsetMismatch as e:
+            return JsonResponse(
+                {'error': str(e), 'offset': e.offset},
+                status=e.status,
+            )
+        except resumable.UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+
+    except:
+        # General view-level exception catching
+        try:
+            user_id = request.user.id
+        except Exception:
+            user_id = None
+        log.exception(
+            'Uncaught view-level exception',
+            function='resumable_upload',
+            user_id=user_id,
+        )
+        raise
@@ -24,12 +24,45 @@ from django.core.exceptions import MiddlewareNotUsed
 from django.conf import settings
 
 from app.backend import what_page_renewal
+from logger.context import start_correlation, end_correlation, get_request_id
 from logger.wrappers import LoggerWrapper
 
 
 log = LoggerWrapper(logging.getLogger(__name__))
 
 
+class RequestIDMiddleware:
+    """
+    Middleware that assigns each request a correlation ID, which is attached
+    (along with the time elapsed since the request started) to every record
+    logged while handling it, and returned in the X-Request-ID header.
+
+    An incoming X-Request-ID (e.g. from a proxy) is reused if it's valid. This
+    should be first in the middleware so that the timing covers the others.
+
+    """
+
+    header = 'X-Request-ID'
+
+    def __init__(self, get_response):
+        """ One-time configuration/initialization (upon web server start). """
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """ Primary call for the middleware. """
+
+        token = start_correlation(request.headers.get(self.header))
+        try:
+            request.request_id = get_request_id()
+            response = self.get_response(request)
+        finally:
+            end_correlation(token)
+
+        response[self.header] = request.request_id
+        return response
+
+
 class LoginRequiredMiddleware:
     """
     Middleware that checks if the user is logged in and redirects them to the
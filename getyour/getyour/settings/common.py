@@ -22,6 +22,7 @@ from pathlib import Path
 import subprocess
 
 from django.core.files import File
+from django.core.exceptions import ImproperlyConfigured
 
 env = environ.Env()
 
@@ -42,6 +43,46 @@ WELCOME_EMAIL_TEMPLATE = env("WELCOME_EMAIL_TEMPLATE")
 PW_RESET_EMAIL_TEMPLATE = env("PW_RESET_EMAIL_TEMPLATE")
 RENEWAL_EMAIL_TEMPLATE = env("RENEWAL_EMAIL_TEMPLATE")
 
+# Messages per second allowed by the Twilio sender number (1/sec for a standard
+# long code). This is shared by every web and Django-Q process via Redis
+TWILIO_SMS_PER_SECOND = env.float("TWILIO_SMS_PER_SECOND", default=1.0)
+
+# Number of whole months of log records (logger.Detail) to keep. Older monthly
+# partitions are dropped by the 'Maintain Log Partitions' schedule
+LOG_RETENTION_MONTH = env.int("LOG_RETENTION_MONTH", default=12)
+
+# Optionally write log records as JSON lines to a directory of rotated files
+# (LOG_JSONL_DIR) or to a Unix socket (LOG_JSONL_SOCKET), e.g. for a log
+# shipper. Files can be bulk-loaded into logger.Detail with the
+# 'load_log_files' management command, in which case LOG_TO_DATABASE can be
+# disabled to take the database writes off the request path entirely
+LOG_JSONL_DIR = env("LOG_JSONL_DIR", default=None)
+LOG_JSONL_SOCKET = env("LOG_JSONL_SOCKET", default=None)
+LOG_TO_DATABASE = env.bool("LOG_TO_DATABASE", default=True)
+
+# Optionally sample and rate-limit the log records at or below
+# LOG_SAMPLING_MAX_LEVEL (see logger.filters.SamplingFilter), e.g. to keep
+# verbose DEBUG logging from flooding the log tables. Off by default, so no
+# records are dropped unless it's enabled
+LOG_SAMPLING = env.bool("LOG_SAMPLING", default=False)
+LOG_SAMPLING_MAX_LEVEL = env("LOG_SAMPLING_MAX_LEVEL", default='DEBUG')
+
+# Number of user ID partitions that scheduled per-user tasks (e.g. renewals)
+# are split into, so they can be spread across every node's Django-Q workers
+SCHEDULED_TASK_PARTITIONS = env.int("SCHEDULED_TASK_PARTITIONS", default=8)
+
+# Define the cluster-wide (Redis-backed) rate limits for each third-party API,
+# as keyword arguments to app.ratelimit.TokenBucket. 'rate' is calls per second,
+# 'capacity' is the allowed burst, and 'bulk_reserve' is the fraction of the
+# burst held back from bulk jobs for interactive (signup) calls. A reserve has
+# no effect with a capacity of 1, so Twilio doesn't set one
+OUTBOUND_RATE_LIMITS = {
+    'usps': {'rate': 1, 'capacity': 10, 'bulk_reserve': 0.5},
+    'arcgis': {'rate': 10, 'capacity': 20, 'bulk_reserve': 0.5},
+    'sendgrid': {'rate': 10, 'capacity': 50, 'bulk_reserve': 0.2},
+    'twilio': {'rate': TWILIO_SMS_PER_SECOND, 'capacity': 1},
+}
+
 # Add environment variables optionally set by Azure or in the Docker build.
 # These will use the environment var if exists, else the .env file or fallback
 # to the defined default
@@ -110,6 +151,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Keep this first, so the request timing in the logs covers everything
+    'getyour.middleware.RequestIDMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -210,6 +253,42 @@ STATIC_ROOT = BASE_DIR.joinpath('static')
 AZURE_LOCATION = ""  # Subdirectory-like prefix to the blob name
 DEFAULT_FILE_STORAGE = 'getyour.settings.custom_azure.AzureMediaStorage'
 
+# Deliver documents to staff through Django ('proxy'), or by redirecting the
+# browser to a short-lived, read-only URL for the single document
+# ('signed_url'), so it downloads straight from storage. On Azure this is a SAS
+# URL; for other storage backends (e.g. local files), it's a signed app URL
+BLOB_DELIVERY_MODE = env("BLOB_DELIVERY_MODE", default='proxy')
+BLOB_SIGNED_URL_EXPIRY_SECOND = env.int("BLOB_SIGNED_URL_EXPIRY_SECOND", default=300)
+if BLOB_DELIVERY_MODE not in ('proxy', 'signed_url'):
+    raise ImproperlyConfigured("BLOB_DELIVERY_MODE must be 'proxy' or 'signed_url'")
+
+# Normalize uploaded images in the background (see app.normalization): strip
+# their metadata, rotate them upright, cap their longest side and re-encode
+# them. The originals are kept under 'originals/<date>/' for
+# DOCUMENT_ORIGINAL_RETENTION_DAY days
+DOCUMENT_NORMALIZATION = env.bool("DOCUMENT_NORMALIZATION", default=True)
+DOCUMENT_NORMALIZATION_MAX_DIMENSION_PX = env.int(
+    "DOCUMENT_NORMALIZATION_MAX_DIMENSION_PX",
+    default=2400,
+)
+DOCUMENT_NORMALIZATION_JPEG_QUALITY = env.int(
+    "DOCUMENT_NORMALIZATION_JPEG_QUALITY",
+    default=85,
+)
+DOCUMENT_ORIGINAL_RETENTION_DAY = env.int("DOCUMENT_ORIGINAL_RETENTION_DAY", default=30)
+
+# Delete uploaded documents once they're older than their type's retention
+# policy, in days (see app.retention). 'unreferenced_document' covers stored
+# documents that no record references any more (e.g. replaced IDs). A policy
+# that isn't set keeps that type forever. The purge only logs what it would
+# delete unless DOCUMENT_RETENTION_DRY_RUN is False
+DOCUMENT_RETENTION_DAY = {
+    'eligibility_document': env.int("ELIGIBILITY_DOCUMENT_RETENTION_DAY", default=None),
+    'identification': env.int("IDENTIFICATION_RETENTION_DAY", default=None),
+    'unreferenced_document': env.int("UNREFERENCED_DOCUMENT_RETENTION_DAY", default=None),
+}
+DOCUMENT_RETENTION_DRY_RUN = env.bool("DOCUMENT_RETENTION_DRY_RUN", default=True)
+
 # Define database routing other than the default
 DATABASE_ROUTERS = ['getyour.routers.LogRouter']
 
@@ -223,10 +302,30 @@ LOGGING = {
             # datefmt is autocreated by Django; it would be ignored here
         },
     },
+    'filters': {
+        # Rate-limit each (logger, function, level) call site at or below
+        # max_level, logging a summary of the dropped records every minute. Add
+        # 'rules' to sample or limit specific call sites (see
+        # logger.filters.SamplingFilter). This is only used by the handlers if
+        # LOG_SAMPLING is enabled
+        'sampling': {
+            '()': 'logger.filters.SamplingFilter',
+            'default_rate': 5,
+            'default_burst': 20,
+            'max_level': LOG_SAMPLING_MAX_LEVEL,
+            'summary_interval_second': 60,
+            'rules': [],
+        },
+    },
     'handlers': {
         'db_log': {
             'class': 'logger.handlers.DatabaseLogHandler',
             'formatter': 'simple',
+            'filters': ['sampling'] if LOG_SAMPLING else [],
+            # Records are saved by a background thread in batches of up to
+            # batch_size, at least every flush_interval_second
+            'batch_size': 100,
+            'flush_interval_second': 1.0,
         },
     },
     'loggers': {
@@ -248,3 +347,23 @@ LOGGING = {
         },
     },
 }
+
+if LOG_JSONL_DIR or LOG_JSONL_SOCKET:
+    LOGGING['handlers']['jsonl'] = {
+        'class': 'logger.handlers.JSONLinesHandler',
+        'formatter': 'simple',
+        'filters': ['sampling'] if LOG_SAMPLING else [],
+        'directory': LOG_JSONL_DIR or None,
+        'socket_path': None if LOG_JSONL_DIR else LOG_JSONL_SOCKET,
+        # Completed files are rotated at max_bytes or rotate_interval_second
+        'max_bytes': 50*1048576,
+        'rotate_interval_second': 3600,
+    }
+    for logger_settings in LOGGING['loggers'].values():
+        logger_settings['handlers'].append('jsonl')
+
+if not LOG_TO_DATABASE:
+    if 'jsonl' not in LOGGING['handlers']:
+        raise ImproperlyConfigured("LOG_TO_DATABASE can only be disabled when LOG_JSONL_DIR or LOG_JSONL_SOCKET is set")
+    for logger_settings in LOGGING['loggers'].values():
+        logger_settings['handlers'].remove('db_log')
@@ -1,5 +1,64 @@
+from azure.core import MatchConditions
+from azure.storage.blob import BlobBlock, ContentSettings
 from storages.backends.azure_storage import AzureStorage
 
 class AzureMediaStorage(AzureStorage):
     location = ''
     file_overwrite = False
+
+    def get_blob_properties(self, name):
+        """
+        Return the blob's properties (including size, etag and last_modified),
+        in a single request.
+
+        """
+
+        blob_client = self.client.get_blob_client(self._get_valid_path(name))
+        return blob_client.get_blob_properties(timeout=self.timeout)
+
+    def iter_blob(self, name, offset=0, length=None, etag=None):
+        """
+        Yield the blob's content (or ``length`` bytes of it, from ``offset``)
+        in chunks, without holding more than one chunk in memory. The download
+        starts on the first iteration.
+
+        If ``etag`` is specified, the download fails if the blob has changed
+        since (so a range can't be taken from a different version).
+
+        """
+
+        blob_client = self.client.get_blob_client(self._get_valid_path(name))
+        kwargs = {}
+        if etag is not None:
+            kwargs = {
+                'etag': etag,
+                'match_condition': MatchConditions.IfNotModified,
+            }
+
+        downloader = blob_client.download_blob(
+            offset=offset,
+            length=length,
+            timeout=self.timeout,
+            **kwargs,
+        )
+        yield from downloader.chunks()
+
+    def stage_block(self, name, block_id, data):
+        """
+        Upload ``data`` as an uncommitted block of the blob. Uncommitted blocks
+        are discarded by Azure if they're not committed within 7 days.
+
+        """
+
+        blob_client = self.client.get_blob_client(self._get_valid_path(name))
+        blob_client.stage_block(block_id, data, timeout=self.timeout)
+
+    def commit_blocks(self, name, block_ids, content_type):
+        """ Create the blob from its staged blocks, in the given order. """
+
+        blob_client = self.client.get_blob_client(self._get_valid_path(name))
+        blob_client.commit_block_list(
+            [BlobBlock(block_id=x) for x in block_ids],
+            content_settings=ContentSettings(content_type=content_type),
+            timeout=self.timeout,
+        )
@@ -28,6 +28,8 @@ AZURE_ACCOUNT_NAME = env("AZURE_ACCOUNT_NAME")
 AZURE_ACCOUNT_KEY = env("AZURE_ACCOUNT_KEY")
 AZURE_CUSTOM_DOMAIN = f"{AZURE_ACCOUNT_NAME}.blob.core.usgovcloudapi.net"
 AZURE_CONTAINER = env("AZURE_CONTAINER")
+# Optionally use a local Azure stand-in (e.g. Azurite) via its connection string
+AZURE_CONNECTION_STRING = env("AZURE_CONNECTION_STRING", default=None)
 IS_PROD = False
 
 # SECURITY WARNING: don't run with debug turned on for any live site!
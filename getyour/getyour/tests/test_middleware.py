@@ -170,7 +170,7 @@ class ValidRouteTest(TestCase):
 
                 # If users aren't allowed direct access, HTTP 405 is expected
                 if viewdict['direct_access_allowed']:
-                    expected_status = 200
+                    expected_status = viewdict.get('expected_status', 200)
                 else:
                     expected_status = 405
                 # login is the only exception for status_code; it should be
@@ -223,7 +223,7 @@ class ValidRouteTest(TestCase):
                         # Check for successful status
                         self.assertEqual(
                             response.status_code,
-                            200,
+                            viewdict.get('expected_status', 200),
                         )
 
                         # Check for successful target
@@ -11,6 +11,8 @@ class DetailAdmin_ext(admin.ModelAdmin):
     list_display = ('colored_msg', 'traceback', 'created_at_format')
     list_display_links = ('colored_msg',)
     list_filter = ('log_level',)
+    # Exact match, to use the request_id index
+    search_fields = ('=request_id',)
     list_per_page = 10
 
     def colored_msg(self, instance):
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LogConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "logger"
+
+    def ready(self):
+        # Connect the Django-Q receivers that correlate task log records
+        import logger.signals
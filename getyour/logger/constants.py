@@ -7,4 +7,11 @@ LOG_LEVELS = (
     (logging.DEBUG, 'Debug'),
     (logging.ERROR, 'Error'),
     (logging.FATAL, 'Fatal'),
-)
\ No newline at end of file
+)
+# Create the monthly Detail partitions this many months ahead of the current
+# month (see logger.partitions)
+log_partition_months_ahead = 2
+
+# Delete expired records in batches of this size when the Detail table isn't
+# partitioned (e.g. SQLite in local development)
+log_retention_delete_batch_size = 5000
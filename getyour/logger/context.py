@@ -0,0 +1,61 @@
+import re
+import time
+import uuid
+import contextvars
+
+
+# The (request ID, time.monotonic() at the start) of the current HTTP request
+# or Django-Q task, or None outside of either. A context variable keeps this
+# separate per thread (and per asyncio task)
+_correlation = contextvars.ContextVar('log_correlation', default=None)
+
+# Incoming request IDs (e.g. from a proxy) are only reused if they match this
+valid_request_id = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def start_correlation(request_id=None):
+    """
+    Start correlating log records under ``request_id`` (or a new ID, if it's
+    missing or invalid), timed from now.
+
+    Returns
+    -------
+    contextvars.Token
+        Pass this to end_correlation() to restore the previous state.
+
+    """
+
+    if request_id is None or not valid_request_id.match(request_id):
+        request_id = uuid.uuid4().hex
+
+    return _correlation.set((request_id, time.monotonic()))
+
+
+def end_correlation(token):
+    """ Stop correlating the records started by start_correlation(). """
+
+    _correlation.reset(token)
+
+
+def get_request_id():
+    """ Return the current request ID, or None. """
+
+    correlation = _correlation.get()
+    if correlation is None:
+        return None
+    return correlation[0]
+
+
+def get_log_context():
+    """
+    Return the current request ID and the milliseconds elapsed since the
+    request (or task) started, or (None, None).
+
+    """
+
+    correlation = _correlation.get()
+    if correlation is None:
+        return None, None
+
+    request_id, started_at = correlation
+    return request_id, int((time.monotonic() - started_at) * 1000)
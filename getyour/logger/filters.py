@@ -0,0 +1,211 @@
+import os
+import time
+import atexit
+import random
+import logging
+import threading
+
+
+def get_level(level):
+    """Return the numeric value of ``level`` (a level name or number)."""
+
+    if isinstance(level, int):
+        return level
+
+    levelno = logging.getLevelName(str(level).upper())
+    if not isinstance(levelno, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return levelno
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Sample and rate-limit log records per call site, where a call site is the
+    (logger name, function, level) of the record.
+
+    Each call site has a token bucket of ``burst`` records, refilled at
+    ``rate`` records per second; records that arrive with the bucket empty are
+    dropped. Records that get through are then kept with probability
+    ``sample_rate``. Every ``summary_interval_second``, a summary record
+    ("N similar messages suppressed") is logged for each call site that had
+    records dropped, by a background thread (so a burst at the end of activity
+    is still reported), and any remaining summaries are logged at exit.
+
+    Only records at or below ``max_level`` (DEBUG by default) are ever
+    dropped.
+
+    Configure this in the LOGGING setting, e.g.::
+
+        'filters': {
+            'sampling': {
+                '()': 'logger.filters.SamplingFilter',
+                'default_rate': 5,
+                'default_burst': 20,
+                'rules': [
+                    {'logger': 'app.views', 'level': 'DEBUG', 'sample_rate': 0.1},
+                    {'logger': 'app.backend', 'function': 'address_check', 'rate': 1},
+                ],
+            },
+        },
+
+    Parameters
+    ----------
+    rules : list of dict, optional
+        Per-call-site overrides. Each rule can match on ``logger`` (the logger
+        name or a parent of it), ``function`` and ``level`` (omitted matches
+        anything), and set ``rate``, ``burst`` and ``sample_rate``. The first
+        matching rule is used.
+    default_rate : float, optional
+        Records per second allowed per call site when no rule sets ``rate``.
+        None (the default) doesn't rate-limit.
+    default_burst : float, optional
+        Bucket size when no rule sets ``burst``. Defaults to the rate, with a
+        minimum of 1.
+    default_sample_rate : float, optional
+        Fraction of records kept when no rule sets ``sample_rate``.
+    max_level : str or int, optional
+        The highest level that can be dropped.
+    summary_interval_second : float, optional
+        How often to log the suppression summaries.
+
+    """
+
+    def __init__(
+            self,
+            rules=None,
+            default_rate=None,
+            default_burst=None,
+            default_sample_rate=1.0,
+            max_level='DEBUG',
+            summary_interval_second=60,
+        ):
+        super().__init__()
+        self.rules = [
+            {
+                **rule,
+                'level': get_level(rule['level']) if 'level' in rule else None,
+            } for rule in (rules or [])
+        ]
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.default_sample_rate = default_sample_rate
+        self.max_level = get_level(max_level)
+        self.summary_interval_second = summary_interval_second
+
+        self._lock = threading.Lock()
+        # Call site -> (tokens, last refill time)
+        self._buckets = {}
+        # Call site -> number of dropped records since the last summary
+        self._suppressed = {}
+        self._last_summary = time.monotonic()
+
+        # The summary thread is started on the first dropped record (and
+        # again after a fork, since the thread doesn't survive it)
+        self._pid = None
+        self._stop_event = threading.Event()
+        atexit.register(self.flush)
+
+    def _get_limits(self, record):
+        for rule in self.rules:
+            logger_name = rule.get('logger')
+            if logger_name and not (
+                    record.name == logger_name or
+                    record.name.startswith(f"{logger_name}.")
+            ):
+                continue
+            if 'function' in rule and rule['function'] != record.function:
+                continue
+            if rule['level'] is not None and rule['level'] != record.levelno:
+                continue
+
+            rate = rule.get('rate', self.default_rate)
+            return (
+                rate,
+                rule.get('burst', self.default_burst if 'rate' not in rule else None),
+                rule.get('sample_rate', self.default_sample_rate),
+            )
+
+        return self.default_rate, self.default_burst, self.default_sample_rate
+
+    def _take_token(self, call_site, rate, burst, now):
+        burst = burst or max(rate, 1)
+        tokens, last = self._buckets.get(call_site, (burst, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+        if tokens >= 1:
+            self._buckets[call_site] = (tokens - 1, now)
+            return True
+
+        self._buckets[call_site] = (tokens, now)
+        return False
+
+    def filter(self, record):
+        # Always pass the summaries logged by this filter
+        if getattr(record, 'is_suppression_summary', False):
+            return True
+
+        if not hasattr(record, 'function'):
+            record.function = None
+
+        keep = True
+        if record.levelno <= self.max_level:
+            rate, burst, sample_rate = self._get_limits(record)
+            call_site = (record.name, record.function, record.levelno)
+            now = time.monotonic()
+
+            with self._lock:
+                if rate is not None and not self._take_token(call_site, rate, burst, now):
+                    keep = False
+                elif sample_rate < 1 and random.random() >= sample_rate:
+                    keep = False
+
+                if not keep:
+                    self._suppressed[call_site] = self._suppressed.get(call_site, 0) + 1
+
+            if not keep:
+                self._start_summary_thread()
+
+        return keep
+
+    def flush(self):
+        """ Log the summaries of any records dropped since the last ones. """
+
+        self._log_summaries()
+
+    def _start_summary_thread(self):
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(
+                target=self._run_summaries,
+                name='SamplingFilter',
+                daemon=True,
+            ).start()
+
+    def _run_summaries(self):
+        while not self._stop_event.wait(self.summary_interval_second):
+            self._log_summaries()
+
+    def _log_summaries(self):
+        now = time.monotonic()
+        with self._lock:
+            elapsed = now - self._last_summary
+            self._last_summary = now
+            suppressed, self._suppressed = self._suppressed, {}
+
+        # Log outside of the lock, since this filter sees the summaries too
+        for (logger_name, function, levelno), count in suppressed.items():
+            summary = logging.makeLogRecord({
+                'name': logger_name,
+                'levelno': levelno,
+                'levelname': logging.getLevelName(levelno),
+                'msg': "%d similar messages suppressed in the last %d seconds",
+                'args': (count, elapsed),
+                'function': function,
+                'user_id': None,
+                'is_suppression_summary': True,
+            })
+            logging.getLogger(logger_name).handle(summary)
@@ -1,14 +1,64 @@
+import os
+import sys
+import json
+import queue
+import socket
 import logging
+import datetime
+import threading
+import time
+
+from logger.context import get_log_context
 
 
 db_default_formatter = logging.Formatter()
 
 
+def get_correlation(record):
+    """
+    Return the request ID and elapsed milliseconds of ``record``. These are set
+    by LoggerWrapper; for other records (e.g. from 'django.request'), use the
+    current context, since handlers run in the logging thread.
+
+    """
+
+    if hasattr(record, 'request_id'):
+        return record.request_id, getattr(record, 'elapsed_ms', None)
+    return get_log_context()
+
+
 class DatabaseLogHandler(logging.Handler):
+    """
+    Save each log record as a ``logger.models.Detail`` row.
 
-    def emit(self, record):
+    Records are put on an in-process queue and saved in batches (with
+    ``bulk_create``) by a background thread, so logging doesn't add a database
+    round trip to the calling thread. A batch is saved once it reaches
+    ``batch_size`` records or ``flush_interval_second`` has passed, and the
+    queue is flushed at shutdown. Records that can't be saved (or don't fit in
+    the queue) are written to stderr instead.
+
+    """
+
+    def __init__(
+            self,
+            level=logging.NOTSET,
+            batch_size=100,
+            flush_interval_second=1.0,
+            max_queue_size=10000,
+        ):
+        super().__init__(level)
+        self.batch_size = batch_size
+        self.flush_interval_second = flush_interval_second
+        self.max_queue_size = max_queue_size
 
-        from logger.models import Detail
+        self._queue = None
+        self._thread = None
+        self._stop_event = None
+        self._pid = None
+        self._thread_lock = threading.Lock()
+
+    def emit(self, record):
 
         # Format trace, if exception exists
         trace = ''
@@ -25,9 +75,12 @@ class DatabaseLogHandler(logging.Handler):
         if not hasattr(record, 'function'):
             record.function = None
 
+        request_id, elapsed_ms = get_correlation(record)
         kwargs = {
             'user_id': record.user_id,
             'function': record.function,
+            'request_id': request_id,
+            'elapsed_ms': elapsed_ms,
             'process_id': record.process,
             'thread_id': record.thread,
             'app_name': record.name.split('.', 1)[0],
@@ -37,7 +90,11 @@ class DatabaseLogHandler(logging.Handler):
             'trace': trace
         }
 
-        Detail.objects.create(**kwargs)
+        self._start_writer()
+        try:
+            self._queue.put_nowait(kwargs)
+        except queue.Full:
+            self._write_to_stderr([kwargs], 'log queue is full')
 
     def format(self, record):
 
@@ -54,3 +111,284 @@ class DatabaseLogHandler(logging.Handler):
             return fmt.formatMessage(record)
         else:
             return fmt.format(record)
+
+    def flush(self):
+        """ Save everything currently in the queue, in the calling thread. """
+
+        if self._queue is None or self._pid != os.getpid():
+            return
+
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        """ Stop the writer thread and save any remaining records. """
+
+        if self._thread is not None and self._pid == os.getpid():
+            self._stop_event.set()
+            self._thread.join(timeout=self.flush_interval_second + 5)
+
+        self.flush()
+        super().close()
+
+    def _start_writer(self):
+        # Start the writer thread on first use. This is also redone after a
+        # fork (e.g. into gunicorn or Django-Q workers), since the thread
+        # doesn't survive it and the queue would hold the parent's records
+        if self._pid == os.getpid():
+            return
+
+        with self._thread_lock:
+            if self._pid == os.getpid():
+                return
+
+            self._queue = queue.Queue(self.max_queue_size)
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='DatabaseLogHandler',
+                daemon=True,
+            )
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+
+    def _collect_batch(self):
+        # Wait for the first record, then collect until the batch is full or
+        # the flush interval has passed
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval_second)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval_second
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _write(self, batch):
+        # Note that nothing here may log, since that would be handled by this
+        # handler again
+        try:
+            from logger.models import Detail
+
+            Detail.objects.bulk_create([Detail(**kwargs) for kwargs in batch])
+
+        except Exception as e:
+            self._write_to_stderr(batch, repr(e))
+
+            # Drop this thread's connections so the next batch reconnects
+            try:
+                from django.db import connections
+                connections.close_all()
+            except Exception:
+                pass
+
+    def _write_to_stderr(self, batch, reason):
+        try:
+            sys.stderr.write(
+                f"DatabaseLogHandler: {len(batch)} record(s) not saved ({reason}):\n"
+            )
+            for kwargs in batch:
+                sys.stderr.write(
+                    "{log_level} {logger_name} {function} user_id={user_id} "
+                    "request_id={request_id}: {message}\n".format(**kwargs)
+                )
+                if kwargs['trace']:
+                    sys.stderr.write(f"{kwargs['trace']}\n")
+            sys.stderr.flush()
+        except Exception:
+            pass
+
+
+class JSONLinesHandler(logging.Handler):
+    """
+    Write each log record as a line of JSON, either to a local file (rotated by
+    size and age) or to a Unix socket, as a cheaper alternative to
+    DatabaseLogHandler.
+
+    Files are written to ``directory`` as '<prefix>-<pid>-<timestamp>.jsonl',
+    one per process. The file being written has an additional '.open' suffix,
+    which is removed once it's rotated (or the handler is closed), so only
+    complete files are picked up by the 'load_log_files' management command.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory to write the files to. Exactly one of ``directory`` and
+        ``socket_path`` must be specified.
+    socket_path : str, optional
+        Path of a Unix (stream) socket to send the lines to.
+    prefix : str, optional
+        Prefix of the file names.
+    max_bytes : int, optional
+        Rotate the file once it reaches this size.
+    rotate_interval_second : float, optional
+        Rotate the file once it's been open this long.
+
+    """
+
+    def __init__(
+            self,
+            level=logging.NOTSET,
+            directory=None,
+            socket_path=None,
+            prefix='getyour',
+            max_bytes=50 * 1024 * 1024,
+            rotate_interval_second=3600,
+        ):
+        super().__init__(level)
+        if (directory is None) == (socket_path is None):
+            raise ValueError("Specify exactly one of directory or socket_path")
+
+        self.directory = directory
+        self.socket_path = socket_path
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.rotate_interval_second = rotate_interval_second
+
+        self._pid = None
+        self._stream = None
+        self._path = None
+        self._opened_at = None
+        self._size = 0
+        self._socket = None
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    # Format the message the same way as DatabaseLogHandler
+    format = DatabaseLogHandler.format
+
+    def record_to_dict(self, record):
+        trace = ''
+        if record.exc_info:
+            trace = db_default_formatter.formatException(record.exc_info)
+
+        request_id, elapsed_ms = get_correlation(record)
+        return {
+            'created_at': datetime.datetime.fromtimestamp(
+                record.created,
+                tz=datetime.timezone.utc,
+            ).isoformat(),
+            'log_level': record.levelno,
+            'app_name': record.name.split('.', 1)[0],
+            'logger_name': record.name,
+            'function': getattr(record, 'function', None),
+            'user_id': getattr(record, 'user_id', None),
+            'process_id': record.process,
+            'thread_id': record.thread,
+            'request_id': request_id,
+            'elapsed_ms': elapsed_ms,
+            'message': self.format(record),
+            'trace': trace,
+        }
+
+    def emit(self, record):
+        try:
+            line = json.dumps(self.record_to_dict(record), default=str) + '\n'
+            if self.socket_path is not None:
+                self._send(line)
+            else:
+                self._write(line)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._pid == os.getpid():
+                self._close_file()
+                if self._socket is not None:
+                    self._socket.close()
+                    self._socket = None
+        finally:
+            self.release()
+        super().close()
+
+    def _write(self, line):
+        data = line.encode('utf-8')
+
+        if self._pid != os.getpid():
+            # After a fork, leave the parent's file alone and start a new one
+            self._stream = None
+            self._socket = None
+            self._pid = os.getpid()
+        elif self._stream is not None and (
+                self._size + len(data) > self.max_bytes or
+                time.monotonic() - self._opened_at > self.rotate_interval_second
+        ):
+            self._close_file()
+
+        if self._stream is None:
+            self._path = os.path.join(
+                self.directory,
+                "{prefix}-{pid}-{timestamp}.jsonl.open".format(
+                    prefix=self.prefix,
+                    pid=self._pid,
+                    timestamp=datetime.datetime.now(
+                        datetime.timezone.utc
+                    ).strftime('%Y%m%dT%H%M%S%f'),
+                ),
+            )
+            self._stream = open(self._path, 'ab')
+            self._opened_at = time.monotonic()
+            self._size = 0
+
+        self._stream.write(data)
+        self._stream.flush()
+        self._size += len(data)
+
+    def _close_file(self):
+        if self._stream is None:
+            return
+
+        self._stream.close()
+        self._stream = None
+        # Remove the '.open' suffix to mark the file as complete
+        os.rename(self._path, self._path[:-len('.open')])
+
+    def _send(self, line):
+        if self._pid != os.getpid():
+            self._socket = None
+            self._pid = os.getpid()
+
+        if self._socket is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._socket = sock
+
+        try:
+            self._socket.sendall(line.encode('utf-8'))
+        except OSError:
+            # Reconnect on the next record
+            self._socket.close()
+            self._socket = None
+            raise
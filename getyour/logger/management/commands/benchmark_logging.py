@@ -0,0 +1,72 @@
+import timeit
+import logging
+
+from django.core.management.base import BaseCommand
+
+from logger.wrappers import LoggerWrapper
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark LoggerWrapper calls at a disabled level (DEBUG on an "
+        "INFO logger), compared with the standard library logger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=200000,
+            help="Number of calls per case.",
+        )
+
+    def handle(self, *args, **options):
+        number = options['number']
+
+        # Use a standalone logger so no handlers are involved
+        base_logger = logging.getLogger('logger.benchmark')
+        base_logger.setLevel(logging.INFO)
+        base_logger.propagate = False
+        log = LoggerWrapper(base_logger)
+
+        # Something comparable to a USPS response dict
+        response_dict = {
+            'address': {
+                'streetAddress': '300 LAPORTE AVE',
+                'secondaryAddress': '',
+                'city': 'FORT COLLINS',
+                'state': 'CO',
+                'ZIPCode': '80521',
+                'ZIPPlus4': '2763',
+            },
+            'additionalInfo': {'deliveryPoint': '00', 'carrierRoute': 'C005'},
+            'corrections': [{'code': '', 'text': ''}],
+            'matches': [{'code': '31', 'text': 'Single Response - exact match'}],
+        }
+
+        def noop():
+            pass
+
+        cases = [
+            ('empty function call (baseline)', noop),
+            ('stdlib logger.debug, %-args', lambda: base_logger.debug(
+                "Address dict found: %s", response_dict,
+            )),
+            ('LoggerWrapper.debug, f-string', lambda: log.debug(
+                f"Address dict found: {response_dict}",
+                function='benchmark',
+            )),
+            ('LoggerWrapper.debug, %-args', lambda: log.debug(
+                "Address dict found: %s", response_dict,
+                function='benchmark',
+            )),
+            ('LoggerWrapper.debug, callable', lambda: log.debug(
+                lambda: f"Address dict found: {response_dict}",
+                function='benchmark',
+            )),
+        ]
+
+        self.stdout.write(f"{number} calls per case, DEBUG disabled:")
+        for name, func in cases:
+            seconds = min(timeit.repeat(func, number=number, repeat=3))
+            self.stdout.write(f"  {name}: {seconds / number * 1e9:.0f} ns/call")
@@ -0,0 +1,164 @@
+import io
+import csv
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+
+from logger.models import Detail
+
+
+# Columns of logger.Detail populated from each JSON line, in COPY order
+COLUMNS = (
+    'created_at',
+    'process_id',
+    'thread_id',
+    'app_name',
+    'logger_name',
+    'log_level',
+    'function',
+    'user_id',
+    'request_id',
+    'elapsed_ms',
+    'message',
+    'trace',
+    'has_been_addressed',
+)
+
+NOT_NULL_TEXT_COLUMNS = (
+    'process_id',
+    'thread_id',
+    'app_name',
+    'logger_name',
+    'message',
+    'trace',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the completed JSON lines log files written by "
+        "logger.handlers.JSONLinesHandler into logger.Detail, using COPY on "
+        "PostgreSQL. Each file is loaded in a single transaction and deleted "
+        "once it's been loaded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            help=(
+                "Files or directories to load. Defaults to the LOG_JSONL_DIR "
+                "setting."
+            ),
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help="Keep the files after they're loaded.",
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths']
+        if not paths:
+            if not settings.LOG_JSONL_DIR:
+                raise CommandError(
+                    "Specify the paths to load, or set LOG_JSONL_DIR"
+                )
+            paths = [settings.LOG_JSONL_DIR]
+
+        # Files still being written end in '.jsonl.open', so they're skipped
+        files = []
+        for path in map(Path, paths):
+            if path.is_dir():
+                files.extend(sorted(path.glob('*.jsonl')))
+            else:
+                files.append(path)
+
+        connection = connections[router.db_for_write(Detail)]
+        total_count = 0
+        for file_path in files:
+            rows = self.read_rows(file_path)
+            with transaction.atomic(using=connection.alias):
+                if connection.vendor == 'postgresql':
+                    self.copy_rows(connection, rows)
+                else:
+                    self.insert_rows(connection, rows)
+
+            if not options['keep']:
+                file_path.unlink()
+
+            total_count += len(rows)
+            self.stdout.write(f"{file_path}: {len(rows)} record(s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {total_count} record(s) from {len(files)} file(s)"
+        ))
+
+    def read_rows(self, file_path):
+        rows = []
+        with open(file_path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Most likely a line cut short by a crashed process
+                    self.stderr.write(
+                        f"{file_path}:{line_number}: skipping invalid line"
+                    )
+                    continue
+
+                rows.append((
+                    record['created_at'],
+                    record['process_id'],
+                    record['thread_id'],
+                    record['app_name'],
+                    record['logger_name'],
+                    record['log_level'],
+                    record.get('function'),
+                    record.get('user_id'),
+                    record.get('request_id'),
+                    record.get('elapsed_ms'),
+                    record['message'],
+                    record.get('trace') or '',
+                    False,
+                ))
+
+        return rows
+
+    def copy_rows(self, connection, rows):
+        # Build the CSV in memory. Empty fields are read as NULL, except in the
+        # NOT NULL text columns (e.g. a blank trace)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['' if x is None else x for x in row])
+        buffer.seek(0)
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                "COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, "
+                "FORCE_NOT_NULL ({not_null_columns}))".format(
+                    table=Detail._meta.db_table,
+                    columns=', '.join(COLUMNS),
+                    not_null_columns=', '.join(NOT_NULL_TEXT_COLUMNS),
+                ),
+                buffer,
+            )
+
+    def insert_rows(self, connection, rows):
+        # Insert directly rather than with bulk_create, which would overwrite
+        # created_at (an auto_now_add field) with the current time
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO {table} ({columns}) VALUES ({values})".format(
+                    table=Detail._meta.db_table,
+                    columns=', '.join(COLUMNS),
+                    values=', '.join(['%s'] * len(COLUMNS)),
+                ),
+                rows,
+            )
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.8 on 2026-10-19 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0001_squashed_0016_migrate_from_log_to_logger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detail',
+            index=models.Index(fields=['-created_at'], name='logger_det_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detail',
+            index=models.Index(fields=['log_level', '-created_at'], name='logger_det_level_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detail',
+            index=models.Index(fields=['user_id', '-created_at'], name='logger_det_user_created_idx'),
+        ),
+    ]
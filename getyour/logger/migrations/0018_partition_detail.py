@@ -0,0 +1,125 @@
+# Generated by Django 4.1.8 on 2026-10-19 03:20
+
+import datetime
+
+from django.db import migrations
+
+TABLE = 'logger_detail'
+TEMP_TABLE = 'logger_detail_unpartitioned'
+SEQUENCE = 'logger_detail_id_seq'
+MONTHS_AHEAD = 2
+
+
+def month_start(value, months=0):
+    month_index = value.year * 12 + value.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def get_index_definitions(cursor, table):
+    # Get every index other than the primary key. The definitions reference
+    # the table by name, so they can be re-run once the new table exists
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s "
+        "AND indexname <> %s",
+        [table, f"{table}_pkey"],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def partition_detail(apps, schema_editor):
+    # Partitioning is PostgreSQL-only; other backends (e.g. SQLite in local
+    # development) keep the plain table, and retention falls back to DELETEs
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        index_definitions = get_index_definitions(cursor, TABLE)
+        cursor.execute(f"SELECT min(created_at), max(id) FROM {TABLE}")
+        min_created_at, max_id = cursor.fetchone()
+
+        # Replace the table with one partitioned by month on created_at
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {TEMP_TABLE}")
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {TEMP_TABLE} INCLUDING DEFAULTS "
+            "INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)"
+        )
+
+        # Create a partition for each month with existing records through the
+        # upcoming months, plus a default partition as a catch-all
+        current = month_start(datetime.date.today())
+        start = month_start(min_created_at) if min_created_at else current
+        while start <= month_start(current, MONTHS_AHEAD):
+            cursor.execute(
+                "CREATE TABLE {table}_y{year:04d}m{month:02d} PARTITION OF {table} "
+                "FOR VALUES FROM ('{start} 00:00:00+00') TO ('{end} 00:00:00+00')".format(
+                    table=TABLE,
+                    year=start.year,
+                    month=start.month,
+                    start=start.isoformat(),
+                    end=month_start(start, 1).isoformat(),
+                )
+            )
+            start = month_start(start, 1)
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+
+        # Move the records, then drop the old table (and its identity sequence)
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {TEMP_TABLE}")
+        cursor.execute(f"DROP TABLE {TEMP_TABLE}")
+
+        # The partition key must be part of the primary key, and identity
+        # columns aren't supported on partitioned tables, so use a plain
+        # sequence
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, created_at)")
+        cursor.execute(f"CREATE SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id")
+        if max_id is not None:
+            cursor.execute("SELECT setval(%s, %s)", [SEQUENCE, max_id])
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')"
+        )
+
+        # Recreate the indexes on the partitioned table, which propagates them
+        # to every partition
+        for index_definition in index_definitions:
+            cursor.execute(index_definition)
+
+
+def unpartition_detail(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        index_definitions = get_index_definitions(cursor, TABLE)
+        cursor.execute(f"SELECT max(id) FROM {TABLE}")
+        max_id = cursor.fetchone()[0]
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {TEMP_TABLE}")
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {TEMP_TABLE} INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {TEMP_TABLE}")
+        cursor.execute(f"DROP TABLE {TEMP_TABLE} CASCADE")
+
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY"
+        )
+        if max_id is not None:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), %s)",
+                [max_id],
+            )
+
+        # Index definitions on the partitioned parent are 'ON ONLY' the parent
+        for index_definition in index_definitions:
+            cursor.execute(index_definition.replace(' ON ONLY ', ' ON ', 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0017_detail_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_detail, unpartition_detail),
+    ]
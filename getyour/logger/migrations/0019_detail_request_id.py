@@ -0,0 +1,27 @@
+# Generated by Django 4.1.8 on 2026-10-19 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0018_partition_detail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detail',
+            name='elapsed_ms',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='detail',
+            name='request_id',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='detail',
+            index=models.Index(fields=['request_id', 'created_at'], name='logger_det_request_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.1.8 on 2026-10-19 03:25
+
+import pendulum
+
+from django.db import migrations
+
+from django_q.models import Schedule
+
+SCHEDULE_NAME = 'Maintain Log Partitions'
+
+def apply_migration(apps, schema_editor):
+    # Add the daily 'Maintain Log Partitions' schedule to Django-Q2. This
+    # creates the upcoming monthly logger.Detail partitions and drops those
+    # past LOG_RETENTION_MONTH, so it repeats by default.
+    # Logger migrations only run on the analytics database (see
+    # getyour.routers.LogRouter), but the schedule is stored in the default
+    # database with the rest of Django-Q. It used to be added by app.0039, so
+    # update it in place if it already exists
+    Schedule.objects.using('default').update_or_create(
+        # Name the schedule
+        name=SCHEDULE_NAME,
+        defaults={
+            # Run the function
+            'func': 'logger.tasks.maintain_log_partitions',
+            # Create a 'daily' schedule
+            'schedule_type': Schedule.DAILY,
+            # Repeat forever
+            'repeats': -1,
+            # Set the next run to be 2 AM in America/Denver timezone, starting
+            # tomorrow (from whenever this is applied)
+            'next_run': pendulum.tomorrow(tz='America/Denver').add(hours=2),
+            # No cluster is specified, so this will run on any cluster
+        },
+    )
+
+
+def revert_migration(apps, schema_editor):
+    # Remove the schedule with the same name
+    Schedule.objects.using('default').filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0019_detail_request_id"),
+        (
+            "django_q",
+            "0017_task_cluster_alter",
+        ),
+    ]
+
+    operations = [
+        migrations.RunPython(apply_migration, revert_migration),
+    ]
@@ -26,6 +26,11 @@ class Detail(models.Model):
     function = models.CharField(max_length=50, null=True)
     user_id = models.PositiveBigIntegerField(null=True)
 
+    # The ID of the HTTP request or Django-Q task that logged the record, and
+    # the milliseconds since it started (see logger.context)
+    request_id = models.CharField(max_length=64, null=True)
+    elapsed_ms = models.PositiveIntegerField(null=True)
+
     message = models.TextField()
     trace = models.TextField(blank=True)
 
@@ -43,4 +48,21 @@ class Detail(models.Model):
                 fields=['process_id', 'thread_id'],
                 name='logger_det_process_712f94_idx',
             ),
+            # Support the admin's default ordering and its filters
+            models.Index(
+                fields=['-created_at'],
+                name='logger_det_created_idx',
+            ),
+            models.Index(
+                fields=['log_level', '-created_at'],
+                name='logger_det_level_created_idx',
+            ),
+            models.Index(
+                fields=['user_id', '-created_at'],
+                name='logger_det_user_created_idx',
+            ),
+            models.Index(
+                fields=['request_id', 'created_at'],
+                name='logger_det_request_idx',
+            ),
         ]
@@ -0,0 +1,160 @@
+import datetime
+
+from django.conf import settings
+from django.db import connections, router
+from django.utils import timezone
+
+from logger.constants import (
+    log_partition_months_ahead,
+    log_retention_delete_batch_size,
+)
+from logger.models import Detail
+
+
+def month_start(value, months=0):
+    """ Return the first day of the month of ``value``, offset by ``months``. """
+
+    month_index = value.year * 12 + value.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(start):
+    """ Return the name of the monthly Detail partition starting at ``start``. """
+
+    return f"{Detail._meta.db_table}_y{start.year:04d}m{start.month:02d}"
+
+
+def get_connection():
+    return connections[router.db_for_write(Detail)]
+
+
+def is_partitioned(connection=None):
+    """ Return whether the Detail table is a partitioned (PostgreSQL) table. """
+
+    connection = connection or get_connection()
+    if connection.vendor != 'postgresql':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [Detail._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def create_partition(cursor, start):
+    """ Create the monthly partition starting at ``start``, if it's missing. """
+
+    end = month_start(start, 1)
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+        "FOR VALUES FROM ('{start} 00:00:00+00') TO ('{end} 00:00:00+00')".format(
+            partition=partition_name(start),
+            table=Detail._meta.db_table,
+            start=start.isoformat(),
+            end=end.isoformat(),
+        )
+    )
+
+
+def ensure_log_partitions(months_ahead=log_partition_months_ahead):
+    """
+    Create the partitions for the current month and the next ``months_ahead``
+    months, so that new records don't land in the default partition.
+
+    Returns
+    -------
+    list
+        The names of the partitions that now exist for those months.
+
+    """
+
+    connection = get_connection()
+    if not is_partitioned(connection):
+        return []
+
+    current = month_start(timezone.now())
+    starts = [month_start(current, x) for x in range(months_ahead + 1)]
+    with connection.cursor() as cursor:
+        for start in starts:
+            create_partition(cursor, start)
+
+    return [partition_name(x) for x in starts]
+
+
+def drop_expired_log_partitions(retention_month=None):
+    """
+    Remove log records older than ``retention_month`` whole months (defaulting
+    to the LOG_RETENTION_MONTH setting).
+
+    If the table is partitioned, each monthly partition that's entirely older
+    than the cutoff is dropped. Otherwise, the old rows are deleted in batches.
+
+    Returns
+    -------
+    list or int
+        The names of the dropped partitions, or the number of deleted rows.
+
+    """
+
+    if retention_month is None:
+        retention_month = settings.LOG_RETENTION_MONTH
+    cutoff = month_start(timezone.now(), -retention_month)
+
+    connection = get_connection()
+    if not is_partitioned(connection):
+        return _delete_expired_rows(cutoff)
+
+    table = Detail._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+            [table],
+        )
+        partitions = [row[0] for row in cursor.fetchall()]
+
+        dropped = []
+        for name in partitions:
+            # Only consider the monthly partitions (this skips the default)
+            try:
+                start = datetime.datetime.strptime(
+                    name[len(table):],
+                    '_y%Ym%m',
+                ).date()
+            except ValueError:
+                continue
+
+            if month_start(start, 1) <= cutoff:
+                cursor.execute(f"DROP TABLE {name}")
+                dropped.append(name)
+
+    return dropped
+
+
+def _delete_expired_rows(cutoff):
+    cutoff = datetime.datetime.combine(
+        cutoff,
+        datetime.time(),
+        tzinfo=datetime.timezone.utc,
+    )
+
+    deleted_count = 0
+    while True:
+        ids = list(
+            Detail.objects.filter(
+                created_at__lt=cutoff,
+            ).values_list(
+                'id',
+                flat=True,
+            )[:log_retention_delete_batch_size]
+        )
+        if len(ids) == 0:
+            return deleted_count
+
+        deleted_count += Detail.objects.filter(id__in=ids).delete()[0]
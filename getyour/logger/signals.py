@@ -0,0 +1,34 @@
+from django.dispatch import receiver
+from django_q.signals import pre_enqueue, pre_execute
+
+from logger.context import get_request_id, start_correlation
+
+
+@receiver(pre_enqueue)
+def add_request_id(sender, task, **kwargs):
+    """
+    Pass the current request ID (if any) to the task, so the records it logs
+    can be correlated with the request (or task) that queued it.
+
+    """
+
+    request_id = get_request_id()
+    if request_id is not None:
+        task['request_id'] = request_id
+
+
+@receiver(pre_execute)
+def start_task_correlation(sender, func, task, **kwargs):
+    """
+    Start correlating the records logged by the task, under the ID of whatever
+    queued it or a new ID.
+
+    """
+
+    # Synchronous tasks run within the caller, so keep the caller's context
+    if task.get('sync', False):
+        return
+
+    # Workers run one task at a time, so this just replaces the previous
+    # task's context rather than resetting it afterwards
+    start_correlation(task.get('request_id'))
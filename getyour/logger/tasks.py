@@ -0,0 +1,23 @@
+import logging
+
+from logger.partitions import ensure_log_partitions, drop_expired_log_partitions
+from logger.wrappers import LoggerWrapper
+
+
+def maintain_log_partitions():
+    """
+    Create the upcoming monthly log partitions and remove log records past the
+    retention period. This is run by a Django-Q schedule.
+
+    """
+
+    # Initialize logger (needs to be done within the async task)
+    log = LoggerWrapper(logging.getLogger(__name__))
+
+    created = ensure_log_partitions()
+    removed = drop_expired_log_partitions()
+
+    log.info(
+        f"Log partitions ensured: {created}; expired records removed: {removed}",
+        function='maintain_log_partitions',
+    )
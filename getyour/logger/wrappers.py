@@ -1,65 +1,111 @@
 import logging
 
+from logger.context import get_log_context
+
+
+# Cache of the wrapped classes, keyed by the base logger class, so the class
+# is only built once per base class rather than for every LoggerWrapper
+_wrapped_classes = {}
+
+
+class LazyMessage:
+    """
+    Log message built by calling ``func`` only when the message is rendered
+    (i.e. after the record has passed the level check and any filters).
+
+    """
+
+    __slots__ = ('func', '_message')
+
+    def __init__(self, func):
+        self.func = func
+        self._message = None
+
+    def __str__(self):
+        if self._message is None:
+            self._message = str(self.func())
+        return self._message
+
 
 class LoggerWrapper(logging.Logger):
     """
     Custom database logger wrapper. This adds custom functionality to select
     logging methods while preserving all other methods.
 
+    Each record is given the ID of the current request (or Django-Q task) and
+    the milliseconds elapsed since it started; see logger.context.
+
+    Messages are formatted lazily: use %-style arguments (as with the standard
+    logging methods) or pass a callable that returns the message, e.g.
+    ``log.debug(lambda: f"Result: {result}")``. Neither is rendered unless the
+    level is enabled, so prefer them over f-strings for expensive messages.
+
     """
 
     def __init__(self, baseLogger):
         """
         Initialize with the input baseLogger (the call to logging.getLogger()).
-        
+
         """
 
-        self.__class__ = type(baseLogger.__class__.__name__,
-                             (self.__class__, baseLogger.__class__),
-                             {})
+        base_class = baseLogger.__class__
+        if base_class not in _wrapped_classes:
+            _wrapped_classes[base_class] = type(
+                base_class.__name__,
+                (LoggerWrapper, base_class),
+                {},
+            )
+
+        self.__class__ = _wrapped_classes[base_class]
         self.__dict__ = baseLogger.__dict__
 
-    def debug(self, *args, function=None, user_id=None, **kwargs):
-        """ Call debug() after adding stock 'extra' parameters. """
+    def _log_with_extra(self, level, msg, args, function, user_id, kwargs):
+        if callable(msg):
+            msg = LazyMessage(msg)
 
-        super().debug(
-            *args,
+        request_id, elapsed_ms = get_log_context()
+        self._log(
+            level,
+            msg,
+            args,
             **kwargs,
-            extra={'function': function, 'user_id': user_id},
+            extra={
+                'function': function,
+                'user_id': user_id,
+                'request_id': request_id,
+                'elapsed_ms': elapsed_ms,
+            },
         )
 
-    def info(self, *args, function=None, user_id=None, **kwargs):
+    # Each method checks the level first (before anything else is built), which
+    # makes calls at a disabled level nearly free
+
+    def debug(self, msg, *args, function=None, user_id=None, **kwargs):
+        """ Call debug() after adding stock 'extra' parameters. """
+
+        if self.isEnabledFor(logging.DEBUG):
+            self._log_with_extra(logging.DEBUG, msg, args, function, user_id, kwargs)
+
+    def info(self, msg, *args, function=None, user_id=None, **kwargs):
         """ Call info() after adding stock 'extra' parameters. """
 
-        super().info(
-            *args,
-            **kwargs,
-            extra={'function': function, 'user_id': user_id},
-        )
+        if self.isEnabledFor(logging.INFO):
+            self._log_with_extra(logging.INFO, msg, args, function, user_id, kwargs)
 
-    def warning(self, *args, function=None, user_id=None, **kwargs):
+    def warning(self, msg, *args, function=None, user_id=None, **kwargs):
         """ Call warning() after adding stock 'extra' parameters. """
 
-        super().warning(
-            *args,
-            **kwargs,
-            extra={'function': function, 'user_id': user_id},
-        )
+        if self.isEnabledFor(logging.WARNING):
+            self._log_with_extra(logging.WARNING, msg, args, function, user_id, kwargs)
 
-    def error(self, *args, function=None, user_id=None, **kwargs):
+    def error(self, msg, *args, function=None, user_id=None, **kwargs):
         """ Call error() after adding stock 'extra' parameters. """
 
-        super().error(
-            *args,
-            **kwargs,
-            extra={'function': function, 'user_id': user_id},
-        )
+        if self.isEnabledFor(logging.ERROR):
+            self._log_with_extra(logging.ERROR, msg, args, function, user_id, kwargs)
 
-    def critical(self, *args, function=None, user_id=None, **kwargs):
+    def critical(self, msg, *args, function=None, user_id=None, **kwargs):
         """ Call critical() after adding stock 'extra' parameters. """
 
-        super().critical(
-            *args,
-            **kwargs,
-            extra={'function': function, 'user_id': user_id},
-        )
+        if self.isEnabledFor(logging.CRITICAL):
+            self._log_with_extra(logging.CRITICAL, msg, args, function, user_id, kwargs)
@@ -39,6 +39,14 @@ begin
   where is_income_verified = true
   and user_id = any(p_id);
 	
+  -- Record the previous values in app_householdhist (as the app's
+  -- history-aware updates do) for the users that will change
+  INSERT INTO public.app_householdhist (user_id, created, historical_values)
+  SELECT user_id, now(), jsonb_build_object('is_income_verified', is_income_verified)
+  FROM public.app_household
+  WHERE is_income_verified IS DISTINCT FROM true
+  AND user_id = any(p_id);
+
   -- Update app_household table
   UPDATE public.app_household
   SET is_income_verified = true
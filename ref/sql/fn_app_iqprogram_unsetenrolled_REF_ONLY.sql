@@ -52,6 +52,19 @@ begin
     and is_enrolled = false
     and user_id = any(p_id);
   	
+    -- Record the previous values in app_iqprogramhist (as the app's
+    -- history-aware updates do), including the program to identify the record
+    INSERT INTO public.app_iqprogramhist (user_id, created, historical_values)
+    SELECT user_id, now(), jsonb_build_object(
+      'program_id', program_id,
+      'is_enrolled', is_enrolled,
+      'enrolled_at', to_char(enrolled_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')
+    )
+    FROM public.app_iqprogram
+    WHERE program_id = programid
+    and is_enrolled = true
+    and user_id = any(p_id);
+
     -- Update app_iqprogram table, but only if is_enrolled is true (for timestamp validity)
     UPDATE public.app_iqprogram
     SET is_enrolled = false, enrolled_at = null
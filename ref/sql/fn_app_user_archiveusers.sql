@@ -39,6 +39,14 @@ begin
   where is_archived = true
   and id = any(p_id);
 	
+  -- Record the previous values in app_userhist (as the app's
+  -- history-aware updates do) for the users that will change
+  INSERT INTO public.app_userhist (user_id, created, historical_values)
+  SELECT id, now(), jsonb_build_object('is_archived', is_archived)
+  FROM public.app_user
+  WHERE is_archived IS DISTINCT FROM true
+  AND id = any(p_id);
+
   -- Update app_user table
   UPDATE public.app_user
   SET is_archived = true